@@ -65,6 +65,10 @@ def create_app(config_class=Config):
         from app.common.log_capture import LogCapture
         LogCapture(app)
 
+    # Per-request tracing (registered first so its span covers the other hooks)
+    from app.common import tracing
+    tracing.init_app(app)
+
     from app.core.models import Login
     @login_manager.user_loader
     def load_user(userid):
@@ -101,6 +105,8 @@ def create_app(config_class=Config):
                 'main.login',
                 'main.signup',
                 'main.submit_feedback',
+                'main.health',
+                'main.metrics',
                     'static'] and not request.endpoint.startswith('static'):
                 return redirect(url_for('main.login'))
 
@@ -1,4 +1,5 @@
-from app.common.utils import call_llm
+from app.common.utils import call_llm, chat_model_name, StreamingTagFilter
+from app.common.context_builder import get_context_builder
 from app.common.prompts import get_code_execution_prompt
 import re
 import json
@@ -24,7 +25,7 @@ class CodeExecutionAgent:
 
         # Use call_llm utility
         try:
-            response = call_llm(prompt)
+            response = call_llm(prompt, task='code_execution')
         except Exception as e:
             print(f"CodeExecutionAgent LLM error: {e}")
             return {"code": original_code, "dependencies": []}
@@ -126,7 +127,7 @@ class FeedbackAgent:
             correct_answer_text,
             user_answer_text)
         try:
-            feedback = call_llm(prompt)
+            feedback = call_llm(prompt, task='feedback')
         except LLMResponseError as e:
             # Fallback on LLM error
             print(f"LLM Error in FeedbackAgent: {e}")
@@ -181,7 +182,7 @@ class PlannerAgent:
         from app.common.prompts import get_study_plan_prompt
 
         prompt = get_study_plan_prompt(topic, user_background)
-        plan_data = call_llm(prompt, is_json=True)
+        plan_data = call_llm(prompt, is_json=True, task='plan')
 
         plan_steps = plan_data.get("plan", [])
         if not plan_steps or not isinstance(plan_steps, list):
@@ -234,7 +235,7 @@ class PlannerAgent:
 
         prompt = get_plan_update_prompt(
             topic_name, user_background, current_plan, comment)
-        response = call_llm(prompt)
+        response = call_llm(prompt, task='plan')
 
         try:
             # Remove analysis block if present
@@ -344,13 +345,37 @@ class ChatAgent:
         # We will implement get_answer here using the generator.
         pass
 
+    def _build_messages(
+            self,
+            question,
+            conversation_history,
+            context,
+            user_background,
+            plan=None,
+            history_summary=None):
+        """Assemble the system message, token-bounded history and question for the LLM."""
+        # Determine if this is guided mode
+        is_guided_mode = len(conversation_history) > 0
+
+        system_message = self.system_message_generator(
+            context, user_background, is_guided_mode, plan)
+
+        # Older turns are summarised / rolled up to fit the chat model's context window
+        return get_context_builder().build(
+            system_message,
+            conversation_history,
+            summaries=history_summary,
+            question=question,
+            model_name=chat_model_name())
+
     def get_answer(
             self,
             question,
             conversation_history,
             context,
             user_background,
-            plan=None):
+            plan=None,
+            history_summary=None):
         """
         Generates an answer to a user's question.
 
@@ -360,29 +385,17 @@ class ChatAgent:
             context (str): Context for the conversation.
             user_background (str): User's background info.
             plan (list, optional): The study plan.
+            history_summary (list, optional): Per-message summaries aligned with
+                ``conversation_history``, used for older turns.
 
         Returns:
             tuple: The generated answer string and an error object (or None).
         """
-        # Determine if this is guided mode
-        is_guided_mode = len(conversation_history) > 0
-
-        system_message = self.system_message_generator(
-            context, user_background, is_guided_mode, plan)
-
-        messages = [{"role": "system", "content": system_message}]
-
-        # Add history
-        if conversation_history:
-            messages.extend(conversation_history)
-
-        # Ensure the user's question is included.
-        if not conversation_history or conversation_history[-1].get(
-                'content') != question:
-            messages.append({"role": "user", "content": question})
+        messages = self._build_messages(
+            question, conversation_history, context, user_background, plan, history_summary)
 
         try:
-            answer = call_llm(messages)
+            answer = call_llm(messages, task='chat')
         except LLMResponseError as e:
             raise e
 
@@ -399,6 +412,38 @@ class ChatAgent:
 
         return answer
 
+    def stream_answer(
+            self,
+            question,
+            conversation_history,
+            context,
+            user_background,
+            plan=None,
+            history_summary=None):
+        """
+        Streams an answer to a user's question as it is generated.
+
+        Takes the same arguments as ``get_answer``.
+
+        Returns:
+            generator: Text deltas with <think> and <tool_call> blocks removed.
+        """
+        messages = self._build_messages(
+            question, conversation_history, context, user_background, plan, history_summary)
+        deltas = call_llm(messages, stream=True, task='chat')
+
+        def filtered():
+            tool_filter = StreamingTagFilter('tool_call')
+            for delta in deltas:
+                text = tool_filter.feed(delta)
+                if text:
+                    yield text
+            tail = tool_filter.flush()
+            if tail:
+                yield tail
+
+        return filtered()
+
 
 class SuggestionAgent:
     """
@@ -420,7 +465,7 @@ class SuggestionAgent:
         prompt = get_topic_suggestions_prompt(user_profile, past_topics)
 
         try:
-            response = call_llm(prompt, is_json=True)
+            response = call_llm(prompt, is_json=True, task='suggestions')
         except LLMResponseError as e:
             return [], e
 
@@ -18,6 +18,9 @@ def validate_config(env_path=None):
     # or will be called by the caller. This function checks os.environ.
 
     for var in REQUIRED_VARS:
+        # A backend pool replaces the single LLM endpoint
+        if var in ("LLM_BASE_URL", "LLM_MODEL_NAME") and os.environ.get("LLM_BACKENDS"):
+            continue
         value = os.environ.get(var)
         if not value:
             missing_vars.append(var)
@@ -0,0 +1,448 @@
+"""
+Context Builder - assembles chat history into a token-bounded prompt.
+
+``ChatAgent`` used to send the last five messages in full plus every older
+message's summary, so prompts grew with the conversation until they overflowed
+the model's context window. ``ContextBuilder.build`` keeps the prompt within a
+per-model token budget:
+
+1. The system message and the current question are always included.
+2. Walking back from the newest message, each turn is added in full if it fits
+   a recency-weighted share of the remaining budget, otherwise as its summary.
+3. Everything older is rolled up: fixed blocks of message summaries are
+   condensed into one summary each, and if those still do not fit, blocks of
+   roll-ups are condensed again (summaries of summaries), level by level.
+   Blocks are aligned to the start of the conversation, so a block's text
+   rarely changes. Roll-ups are never computed on the request path: a block
+   whose roll-up is not in the ``RollupStore`` yet is truncated for this turn
+   and queued on the summary worker, which stores the roll-up for later turns.
+
+Configuration (environment):
+    LLM_TOKENIZER: 'bytes' (default, ~4 bytes per token; works for any model) or
+        'tiktoken[:<encoding>]' for exact counts on OpenAI-style tokenizers.
+    LLM_CONTEXT_WINDOW: Context window in tokens for unlisted models (default 8192).
+    LLM_CONTEXT_WINDOWS: JSON object of per-model windows, e.g. '{"llama3.1:8b": 131072}'.
+    LLM_CONTEXT_RESERVE: Tokens kept free for the answer (default 2048).
+    LLM_CONTEXT_RECENCY_DECAY: Share of the remaining budget each older turn may
+        take in full, compounded per turn of age (default 0.8).
+    LLM_CONTEXT_ROLLUP_BLOCK: Messages (or roll-ups) per roll-up block (default 8).
+    LLM_CONTEXT_ROLLUP_ENTRIES: Roll-ups kept in memory per process (default 2048).
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+LLM_TOKENIZER = os.getenv("LLM_TOKENIZER", "bytes")
+LLM_CONTEXT_WINDOW = int(os.getenv("LLM_CONTEXT_WINDOW", 8192))
+LLM_CONTEXT_RESERVE = int(os.getenv("LLM_CONTEXT_RESERVE", 2048))
+LLM_CONTEXT_RECENCY_DECAY = float(os.getenv("LLM_CONTEXT_RECENCY_DECAY", 0.8))
+LLM_CONTEXT_ROLLUP_BLOCK = int(os.getenv("LLM_CONTEXT_ROLLUP_BLOCK", 8))
+LLM_CONTEXT_ROLLUP_ENTRIES = int(os.getenv("LLM_CONTEXT_ROLLUP_ENTRIES", 2048))
+
+try:
+    LLM_CONTEXT_WINDOWS = {k: int(v) for k, v in json.loads(os.getenv("LLM_CONTEXT_WINDOWS", "{}")).items()}
+except (ValueError, TypeError, AttributeError) as e:
+    logger.warning(f"Ignoring invalid LLM_CONTEXT_WINDOWS: {e}")
+    LLM_CONTEXT_WINDOWS = {}
+
+# Share of the history budget for recent turns; the rest is left for roll-ups
+RECENT_SHARE = 0.75
+# Per-message framing tokens added by chat templates (role markers, separators)
+MESSAGE_OVERHEAD = 4
+
+ROLLUP_HEADER = "Summary of the earlier conversation:"
+# Tokens of a block's text used in place of its roll-up until that is computed
+ROLLUP_FALLBACK_TOKENS = 200
+
+
+class ByteEstimateTokenizer:
+    """Model-agnostic estimate: roughly four UTF-8 bytes per token."""
+
+    name = 'bytes'
+
+    def count(self, text):
+        """Estimate the number of tokens in ``text``."""
+        return (len(text.encode('utf-8')) + 3) // 4
+
+    def truncate(self, text, max_tokens):
+        """Cut ``text`` to about ``max_tokens`` tokens."""
+        return text.encode('utf-8')[:max(0, max_tokens) * 4].decode('utf-8', errors='ignore')
+
+
+class TiktokenTokenizer:
+    """Exact counts for OpenAI-style BPE encodings (requires the optional 'tiktoken' package)."""
+
+    def __init__(self, encoding='cl100k_base'):
+        """
+        Initializes the tokenizer.
+
+        Args:
+            encoding (str): tiktoken encoding name.
+        """
+        import tiktoken
+        self._encoding = tiktoken.get_encoding(encoding)
+        self.name = f"tiktoken:{encoding}"
+
+    def count(self, text):
+        """Count the tokens in ``text``."""
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text, max_tokens):
+        """Cut ``text`` to at most ``max_tokens`` tokens."""
+        tokens = self._encoding.encode(text, disallowed_special=())
+        return self._encoding.decode(tokens[:max(0, max_tokens)])
+
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer(spec=None):
+    """
+    Get the configured tokenizer, falling back to the byte estimate.
+
+    Args:
+        spec (str, optional): 'bytes' or 'tiktoken[:<encoding>]'; defaults to LLM_TOKENIZER.
+
+    Returns:
+        Tokenizer with ``count(text)`` and ``truncate(text, max_tokens)``.
+    """
+    global _tokenizer
+    if spec is None and _tokenizer is not None:
+        return _tokenizer
+
+    spec = spec or LLM_TOKENIZER
+    tokenizer = ByteEstimateTokenizer()
+    if spec.startswith('tiktoken'):
+        _, _, encoding = spec.partition(':')
+        try:
+            tokenizer = TiktokenTokenizer(encoding or 'cl100k_base')
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable ({e}); using byte estimate for token counts")
+
+    if spec == LLM_TOKENIZER:
+        with _tokenizer_lock:
+            _tokenizer = tokenizer
+    return tokenizer
+
+
+def context_window(model_name):
+    """
+    Context window size for a model.
+
+    Args:
+        model_name (str): Model name.
+
+    Returns:
+        int: Window in tokens.
+    """
+    return LLM_CONTEXT_WINDOWS.get(model_name, LLM_CONTEXT_WINDOW)
+
+
+def _format_transcript(messages):
+    """Render messages as a plain 'Role: content' transcript for roll-up prompts."""
+    return "\n".join(
+        f"{m.get('role', 'user').capitalize()}: {m.get('content', '')}" for m in messages)
+
+
+def llm_rollup(text):
+    """
+    Condense a transcript (or earlier roll-ups) into one dense summary.
+
+    Runs on the summary worker (see ``RollupStore``) through ``call_llm`` with
+    the cacheable 'rollup' task, so other processes can reuse the result.
+
+    Args:
+        text (str): Transcript or concatenated summaries.
+
+    Returns:
+        str: The summary.
+    """
+    from app.common.utils import call_llm
+
+    prompt = f"""
+You are condensing part of a tutoring conversation so it can be remembered later.
+Requirements:
+1. At most 6 lines.
+2. Keep facts, definitions, decisions, open questions and what the learner struggled with.
+3. Drop greetings, filler and repetition.
+4. Output ONLY the summary.
+
+Conversation excerpt:
+{text}
+"""
+    return call_llm(prompt, task='rollup').strip()
+
+
+class RollupStore:
+    """
+    Block roll-ups computed off the request path, keyed by a hash of the block text.
+
+    ``get`` returns a stored roll-up, or None after queueing the text on the
+    summary worker, which runs the summarizer and stores the result. A block
+    whose text changes (a message summary backfilled into it) is a new key;
+    stale entries age out of the LRU.
+    """
+
+    def __init__(self, summarizer=llm_rollup, max_entries=LLM_CONTEXT_ROLLUP_ENTRIES):
+        """
+        Initializes an empty store.
+
+        Args:
+            summarizer (callable): ``text -> summary``, run on the summary worker.
+            max_entries (int): Roll-ups kept before the least recently used is evicted.
+        """
+        self.summarizer = summarizer
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        """
+        Look up the roll-up of ``text``, queueing its computation on a miss.
+
+        Args:
+            text (str): Transcript or concatenated summaries of one block.
+
+        Returns:
+            str or None: The roll-up, or None if it is not computed yet.
+        """
+        from flask import current_app, has_app_context
+        from app.common.summary_worker import RollupJob, get_summary_worker
+
+        key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            if key in self._pending:
+                return None
+            self._pending.add(key)
+
+        app = current_app._get_current_object() if has_app_context() else None
+        if not get_summary_worker().submit(RollupJob(app, self, text)):
+            # Queue full: ask again on a later turn
+            with self._lock:
+                self._pending.discard(key)
+        return None
+
+    def compute(self, text):
+        """
+        Summarise ``text`` and store the roll-up (called by the summary worker).
+
+        Args:
+            text (str): Block text passed to ``get``.
+
+        Returns:
+            bool: True if a roll-up was stored.
+        """
+        key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        try:
+            summary = self.summarizer(text)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+        if not summary:
+            return False
+        with self._lock:
+            self._entries[key] = summary
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+
+_rollup_store = None
+
+
+def get_rollup_store():
+    """
+    Get the process-wide roll-up store.
+
+    Returns:
+        RollupStore: Store summarising with ``llm_rollup``.
+    """
+    global _rollup_store
+    if _rollup_store is None:
+        _rollup_store = RollupStore()
+    return _rollup_store
+
+
+class ContextBuilder:
+    """Builds token-bounded chat prompts; see the module docstring for the policy."""
+
+    def __init__(self, tokenizer=None, window=None, reserve=LLM_CONTEXT_RESERVE,
+                 recency_decay=LLM_CONTEXT_RECENCY_DECAY, block_size=LLM_CONTEXT_ROLLUP_BLOCK,
+                 rollups=None):
+        """
+        Initializes the builder.
+
+        Args:
+            tokenizer: Object with ``count``/``truncate``; defaults to ``get_tokenizer()``.
+            window (int, optional): Fixed context window; defaults to the model's.
+            reserve (int): Tokens kept free for the answer.
+            recency_decay (float): Per-turn decay of the full-message allowance.
+            block_size (int): Items per roll-up block.
+            rollups (RollupStore, optional): Source of roll-ups; defaults to ``get_rollup_store()``.
+        """
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.window = window
+        self.reserve = reserve
+        self.recency_decay = recency_decay
+        self.block_size = max(2, block_size)
+        self.rollups = rollups or get_rollup_store()
+
+    def count_message(self, message):
+        """Tokens used by one chat message, including template overhead."""
+        return MESSAGE_OVERHEAD + self.tokenizer.count(message.get('content') or '')
+
+    def budget(self, model_name=None):
+        """Input tokens available for a model."""
+        window = self.window or context_window(model_name)
+        return max(0, window - self.reserve)
+
+    def build(self, system_message, history, summaries=None, question=None, model_name=None):
+        """
+        Assemble the messages for one chat completion.
+
+        Args:
+            system_message (str): System prompt.
+            history (list): Full conversation, oldest first (may end with ``question``).
+            summaries (list, optional): Per-message summaries aligned with ``history``;
+                the full message is used where missing.
+            question (str, optional): Current user message.
+            model_name (str, optional): Model the prompt is for (selects the budget).
+
+        Returns:
+            list: OpenAI-format messages whose total stays within the budget.
+        """
+        history = list(history or [])
+        summaries = list(summaries or [])
+        summaries = [
+            summaries[i] if i < len(summaries) and summaries[i] else history[i]
+            for i in range(len(history))
+        ]
+
+        # The current question is pinned in full
+        last = (history[-1].get('content') or '').strip() if history else None
+        if history and (question is None or last == question.strip()):
+            pinned = history.pop()
+            summaries.pop()
+        else:
+            pinned = {"role": "user", "content": question or ""}
+
+        system = {"role": "system", "content": system_message}
+        available = self.budget(model_name) - self.count_message(system) - self.count_message(pinned)
+        if available <= 0:
+            logger.warning("Chat context budget exhausted by the system prompt and question alone")
+            return [system, pinned]
+
+        cut, recent, used = self._select_recent(history, summaries, int(available * RECENT_SHARE))
+        cut, recent, used = self._align_cut(history, cut, recent, used)
+
+        rollups = self._rollup(summaries[:cut], available - used) if cut else []
+        if rollups:
+            system = dict(system, content=f"{system_message}\n\n{ROLLUP_HEADER}\n" + "\n\n".join(rollups))
+
+        logger.debug(
+            f"Chat context: {len(recent)} recent messages, {cut} rolled into {len(rollups)} "
+            f"summaries, ~{used + self.count_message(system) + self.count_message(pinned)} tokens")
+        return [system] + [entry for _, entry in recent] + [pinned]
+
+    def _select_recent(self, history, summaries, budget):
+        """
+        Pick recent messages newest-first, full or summarised by recency.
+
+        Returns:
+            tuple: (index of the oldest selected message, [(index, message)], tokens used)
+        """
+        recent = []
+        used = 0
+        cut = len(history)
+        for age, i in enumerate(range(len(history) - 1, -1, -1)):
+            remaining = budget - used
+            full_cost = self.count_message(history[i])
+            if full_cost <= remaining * (self.recency_decay ** age):
+                entry, cost = history[i], full_cost
+            else:
+                entry, cost = summaries[i], self.count_message(summaries[i])
+                if cost > remaining:
+                    break
+            recent.insert(0, (i, entry))
+            used += cost
+            cut = i
+        return cut, recent, used
+
+    def _align_cut(self, history, cut, recent, used):
+        """
+        Move the roll-up boundary up to a block boundary so roll-up blocks stay stable.
+
+        Messages between the old and new boundary leave the recent window and are
+        covered by the (cached) roll-up of their block instead.
+        """
+        if cut == 0 or cut % self.block_size == 0:
+            return cut, recent, used
+        aligned = -(-cut // self.block_size) * self.block_size
+        if aligned >= len(history):
+            # Would empty the recent window; keep a partial trailing block instead
+            return cut, recent, used
+        kept = [(i, entry) for i, entry in recent if i >= aligned]
+        used = sum(self.count_message(entry) for _, entry in kept)
+        return aligned, kept, used
+
+    def _rollup(self, messages, budget):
+        """
+        Condense older messages hierarchically until they fit ``budget`` tokens.
+
+        Returns:
+            list: Summary texts, oldest first.
+        """
+        size = self.block_size
+        items = [
+            self._summarize(_format_transcript(messages[i:i + size]))
+            for i in range(0, len(messages), size)
+        ]
+
+        def cost(texts):
+            return sum(self.tokenizer.count(t) + 2 for t in texts)
+
+        while len(items) > 1 and cost(items) > budget:
+            complete = len(items) // size * size
+            if complete:
+                # Summaries of summaries; a trailing partial group waits for more blocks
+                items = [
+                    self._summarize("\n\n".join(items[i:i + size]))
+                    for i in range(0, complete, size)
+                ] + items[complete:]
+            else:
+                items = [self._summarize("\n\n".join(items))]
+
+        if items and cost(items) > budget:
+            items = [self.tokenizer.truncate(items[0], max(0, budget - 2))]
+        return [t for t in items if t]
+
+    def _summarize(self, text):
+        """Serve a block's stored roll-up, or a truncation while the summary worker computes it."""
+        return self.rollups.get(text) or self.tokenizer.truncate(text, ROLLUP_FALLBACK_TOKENS)
+
+
+_builder = None
+
+
+def get_context_builder():
+    """
+    Get the shared context builder.
+
+    Returns:
+        ContextBuilder: Builder using the configured tokenizer and budgets.
+    """
+    global _builder
+    if _builder is None:
+        _builder = ContextBuilder()
+    return _builder
@@ -3,8 +3,10 @@ import requests
 import logging
 import threading
 import time
+from sqlalchemy import inspect as sa_inspect, update
 from app.core.extensions import db
-from app.core.models import Installation, Topic, ChatMode, ChapterMode, QuizMode, FlashcardMode, User, TelemetryLog, Feedback, AIModelPerformance, PlanRevision, SyncLog
+from app.common import metrics
+from app.core.models import Installation, Topic, ChatMode, ChatMessage, ChapterMode, QuizMode, FlashcardMode, User, TelemetryLog, Feedback, AIModelPerformance, PlanRevision, SyncLog
 
 logger = logging.getLogger(__name__)
 
@@ -20,12 +22,10 @@ class DCSClient:
         self._load_installation_id()
 
     def _load_installation_id(self):
-        """Load installation ID from database if available."""
+        """Load installation ID from the cached installation identity if available."""
         try:
-            from app.core.models import Installation
-            inst = Installation.query.first()
-            if inst:
-                self.installation_id = inst.installation_id
+            from app.common.installation import get_installation_id
+            self.installation_id = get_installation_id()
         except Exception:
             # DB might not be ready
             pass
@@ -35,14 +35,17 @@ class DCSClient:
         Registers the device with the DCS.
         If already registered (ID exists in DB), verifies or updates details.
         """
-        from app.common.utils import get_system_info
+        from app.common.installation import get_cached_system_info, get_installation_identity
         from sqlalchemy.exc import OperationalError
 
-        # Check if already registered
+        identity = get_installation_identity()
+
+        # Check if already registered (re-read, another process may have registered meanwhile)
         try:
-            inst = Installation.query.first()
-            if inst:
-                self.installation_id = inst.installation_id
+            identity.refresh()
+            installation_id = identity.installation_id()
+            if installation_id:
+                self.installation_id = installation_id
                 logger.info(f"Device already registered with ID: {self.installation_id}")
                 # Optionally update details
                 self.update_device_details()
@@ -69,7 +72,7 @@ class DCSClient:
             self.installation_id = new_id
 
             # Step 2: Save to DB
-            sys_info = get_system_info()
+            sys_info = get_cached_system_info()
             new_inst = Installation(
                 installation_id=new_id,
                 cpu_cores=sys_info['cpu_cores'],
@@ -80,6 +83,7 @@ class DCSClient:
             )
             db.session.add(new_inst)
             db.session.commit()
+            identity.refresh(new_id)
 
             logger.info(f"Device registered successfully: {new_id}")
 
@@ -96,9 +100,8 @@ class DCSClient:
         if not self.installation_id:
             return False
 
-        from app.common.utils import get_system_info
-        sys_info = get_system_info()
-        payload = sys_info.copy()
+        from app.common.installation import get_cached_system_info
+        payload = get_cached_system_info()
         payload['installation_id'] = self.installation_id
 
         try:
@@ -112,16 +115,34 @@ class DCSClient:
     def sync_data(self):
         """
         Gathers unsynced data and sends it to DCS.
+
+        Each pass is recorded in the ``dcs_*`` metrics (duration, outcome, rows sent).
+        """
+        start = time.perf_counter()
+        outcome = self._sync_data()
+        metrics.DCS_SYNC_SECONDS.observe(time.perf_counter() - start)
+        metrics.DCS_SYNCS.inc(outcome=outcome)
+        if outcome == 'synced':
+            metrics.DCS_LAST_SUCCESS.set(time.time())
+
+    def _sync_data(self):
+        """
+        Send one batch of unsynced rows.
+
+        Returns:
+            str: Outcome of the pass: synced, idle (nothing pending), skipped
+            (not registered) or failed.
         """
         if not self.installation_id:
             logger.warning("Cannot sync: No installation_id")
-            return
+            return 'skipped'
 
         payload = {
             "installation_id": self.installation_id,
             "installations": [],
             "topics": [],
             "chat_modes": [],
+            "chat_messages": [],
             "chapter_modes": [],
             "quiz_modes": [],
             "flashcard_modes": [],
@@ -181,9 +202,6 @@ class DCSClient:
                 payload["chat_modes"].append({
                     "topic_id": c.topic_id,
                     "user_id": c.user_id,
-                    "history": c.history,
-                    "history_summary": c.history_summary,
-                    "popup_chat_history": c.popup_chat_history,
                     "time_spent": c.time_spent,
                     "created_at": c.created_at.isoformat(),
                     "modified_at": c.modified_at.isoformat()
@@ -193,6 +211,26 @@ class DCSClient:
                 if c.topic and c.topic.id not in included_topic_ids:
                     add_topic_to_payload(c.topic)
 
+            # ChatMessage: rows are append-only, so only new messages (and
+            # ones whose summary was filled in since) are pending
+            messages = ChatMessage.query.filter((ChatMessage.sync_status == 'pending') | (ChatMessage.sync_status is None)).order_by(ChatMessage.id).limit(BATCH_SIZE * 4).all()
+            for m in messages:
+                payload["chat_messages"].append({
+                    "topic_id": m.topic_id,
+                    "user_id": m.user_id,
+                    "step_index": m.step.step_index if m.step_id else None,
+                    "channel": m.channel,
+                    "seq": m.seq,
+                    "role": m.role,
+                    "content": m.content,
+                    "summary": m.summary,
+                    "created_at": m.created_at.isoformat(),
+                    "modified_at": m.modified_at.isoformat()
+                })
+                objects_to_update.append(m)
+                if m.topic and m.topic.id not in included_topic_ids:
+                    add_topic_to_payload(m.topic)
+
             # ChapterMode
             chapters = ChapterMode.query.filter((ChapterMode.sync_status == 'pending') | (ChapterMode.sync_status is None)).limit(BATCH_SIZE).all()
             for c in chapters:
@@ -206,7 +244,6 @@ class DCSClient:
                     "questions": c.questions,
                     "user_answers": c.user_answers,
                     "score": c.score,
-                    "popup_chat_history": c.popup_chat_history,
                     "time_spent": c.time_spent or 0,
                     "created_at": c.created_at.isoformat(),
                     "modified_at": c.modified_at.isoformat()
@@ -334,7 +371,7 @@ class DCSClient:
             # Check if we have anything to send
             total_items = sum(len(v) for k, v in payload.items() if isinstance(v, list))
             if total_items == 0:
-                return
+                return 'idle'
 
             logger.debug(f"Syncing {total_items} items to DCS...")
 
@@ -342,9 +379,18 @@ class DCSClient:
             resp = requests.post(f"{self.base_url}/api/sync", json=payload, timeout=30)
             resp.raise_for_status()
 
-            # Update status on success
+            # Update status on success. A versioned row written while the batch
+            # was being sent stays pending, and marking a row synced is not a
+            # content change, so its version is left alone
             for obj in objects_to_update:
-                obj.sync_status = 'synced'
+                model = type(obj)
+                if sa_inspect(model).version_id_col is not None:
+                    db.session.execute(
+                        update(model).where(model.id == obj.id, model.version == obj.version)
+                        .values(sync_status='synced'),
+                        execution_options={'synchronize_session': False})
+                else:
+                    obj.sync_status = 'synced'
 
             # Log success
             log_entry = SyncLog(
@@ -354,7 +400,9 @@ class DCSClient:
             )
             db.session.add(log_entry)
             db.session.commit()
+            metrics.DCS_SYNC_ITEMS.inc(total_items)
             logger.debug("Sync successful")
+            return 'synced'
 
         except Exception as e:
             logger.error(f"Sync failed: {e}")
@@ -369,6 +417,7 @@ class DCSClient:
                 db.session.commit()
             except Exception:
                 pass
+            return 'failed'
 
     def get_notifications(self):
         """Fetch active system notifications from DCS."""
@@ -0,0 +1,132 @@
+"""
+Installation Identity - the installation row and hardware profile, resolved once.
+
+The installation id used to be read with ``Installation.query.first()`` by
+every ``log_telemetry`` call that had no logged-in user, by ``DCSClient`` and
+by ``register_device``, and ``get_system_info()`` ran ``nvidia-smi``,
+``rocm-smi`` and ``lspci`` (5 s timeout each) whenever device details were
+sent or a user signed up.
+
+Both are now cached in memory. The installation id is cached per Flask app
+(one database each) in ``app.extensions``; the hardware profile describes the
+host, so it is cached once per process. Neither changes while the app runs,
+so they are only re-read on an explicit ``refresh()``, which device
+registration calls once it has saved a new installation. A missing
+installation is not cached, so workers that started before registration
+finished pick the new row up.
+"""
+import threading
+
+_system_info = None
+_system_info_lock = threading.Lock()
+
+
+def get_cached_system_info(refresh=False):
+    """
+    Get the host's hardware profile, detecting it on first use.
+
+    Args:
+        refresh (bool): Detect again instead of using the cached profile.
+
+    Returns:
+        dict: A copy of ``get_system_info()``'s result.
+    """
+    global _system_info
+    from app.common.utils import get_system_info
+
+    with _system_info_lock:
+        if _system_info is None or refresh:
+            _system_info = get_system_info()
+        return dict(_system_info)
+
+
+class InstallationIdentity:
+    """Cached installation id of one app's database."""
+
+    def __init__(self, app):
+        """
+        Initializes an empty cache.
+
+        Args:
+            app: Flask application whose installation row is cached.
+        """
+        self.app = app
+        self._lock = threading.Lock()
+        self._installation_id = None
+        self._stats = {'hits': 0, 'lookups': 0}
+
+    def installation_id(self):
+        """
+        Get the installation id, reading the installations table only when not cached.
+
+        Database errors (e.g. tables not created yet) propagate and nothing is cached.
+
+        Returns:
+            str: The installation id, or None if the device is not registered yet.
+        """
+        with self._lock:
+            if self._installation_id:
+                self._stats['hits'] += 1
+                return self._installation_id
+
+        from sqlalchemy import select
+        from app.core.extensions import db
+        from app.core.models import Installation
+
+        with self.app.app_context():
+            installation_id = db.session.scalar(select(Installation.installation_id).limit(1))
+
+        with self._lock:
+            self._stats['lookups'] += 1
+            self._installation_id = installation_id
+        return installation_id
+
+    def refresh(self, installation_id=None):
+        """
+        Forget the cached id (e.g. after registration saved a new installation row).
+
+        Args:
+            installation_id (str, optional): The new id, if the caller already knows it.
+        """
+        with self._lock:
+            self._installation_id = installation_id
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: hits and lookups (table reads).
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+def get_installation_identity(app=None):
+    """
+    Get the installation identity cache of an app.
+
+    Args:
+        app: Flask application; defaults to ``current_app``.
+
+    Returns:
+        InstallationIdentity: The app's shared cache.
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app._get_current_object()
+
+    identity = app.extensions.get('installation_identity')
+    if identity is None:
+        identity = app.extensions.setdefault('installation_identity', InstallationIdentity(app))
+    return identity
+
+
+def get_installation_id():
+    """
+    Get the current app's installation id from the cache.
+
+    Returns:
+        str: The installation id, or None if the device is not registered yet.
+    """
+    return get_installation_identity().installation_id()
@@ -0,0 +1,337 @@
+"""
+LLM Backends - a pool of OpenAI-compatible inference servers behind ``call_llm``.
+
+By default the pool holds a single backend built from ``LLM_BASE_URL`` /
+``LLM_MODEL_NAME`` / ``LLM_API_KEY``. To spread load across several servers
+(e.g. one vLLM/Ollama instance per GPU box), configure ``LLM_BACKENDS`` as a
+JSON list::
+
+    LLM_BACKENDS='[
+        {"name": "gpu-a", "url": "http://10.0.0.5:8000/v1", "weight": 2, "max_concurrency": 8},
+        {"name": "gpu-b", "url": "http://10.0.0.6:8000/v1", "model": "llama3.1:8b"}
+    ]'
+
+Each entry accepts ``url`` (required), ``name``, ``model`` (defaults to
+``LLM_MODEL_NAME``), ``api_key`` (defaults to ``LLM_API_KEY``), ``weight``
+(default 1) and ``max_concurrency`` (0 = unlimited).
+
+Selection is least-outstanding-requests, scaled by weight: a backend with
+weight 2 is considered half as busy as one with weight 1 at the same load.
+Every backend has its own circuit breaker, so a failing server is ejected
+from rotation (passive health checking) and probed again after
+``LLM_BREAKER_RESET`` seconds. ``call_llm`` fails over to the next backend
+on connection errors.
+
+Task routing: every ``call_llm`` is tagged with a prompt type (``task``).
+``TASK_ROUTES`` maps a type to the model, backends, ``max_tokens`` and
+temperature to use, so short utility prompts (summaries, counts, code
+preparation) run on a small model instead of the teaching model:
+
+    LLM_UTILITY_MODEL: Model for the built-in utility routes (unset = main model).
+    LLM_TASK_ROUTES: JSON object overriding routes, e.g.
+        '{"summary": {"model": "qwen2.5:1.5b", "backends": ["gpu-b"], "max_tokens": 256}}'
+"""
+import os
+import json
+import logging
+import threading
+
+from app.common.llm_transport import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_base_url(base_url):
+    """
+    Normalize an OpenAI-compatible base URL.
+
+    The convention is a base URL ending in /v1 (or a similar root) to which
+    /chat/completions is appended. Users commonly give Ollama's bare host, so
+    /v1 is added for the default Ollama port.
+
+    Args:
+        base_url (str): Configured base URL.
+
+    Returns:
+        str: Base URL without a trailing slash.
+    """
+    base_url = base_url.rstrip('/')
+    if not base_url.endswith('/v1') and "11434" in base_url and "/v1" not in base_url:
+        base_url += "/v1"
+    return base_url
+
+
+class LLMBackend:
+    """One inference server: where to send requests and how much it can take."""
+
+    def __init__(self, name, url, model, api_key=None, weight=1, max_concurrency=0, breaker=None):
+        """
+        Initializes the backend.
+
+        Args:
+            name (str): Label used in logs and status output.
+            url (str): OpenAI-compatible base URL.
+            model (str): Model name sent in requests.
+            api_key (str, optional): Bearer token.
+            weight (float): Relative capacity for load balancing.
+            max_concurrency (int): Maximum outstanding requests (0 = unlimited).
+            breaker (CircuitBreaker, optional): Breaker to use; a new one by default.
+        """
+        self.name = name
+        self.base_url = normalize_base_url(url)
+        self.model = model
+        self.api_key = api_key
+        self.weight = max(float(weight), 0.01)
+        self.max_concurrency = int(max_concurrency or 0)
+        self.breaker = breaker or CircuitBreaker(name=name)
+        self.outstanding = 0
+        self.requests = 0
+
+    @property
+    def chat_url(self):
+        """The chat completions endpoint."""
+        return f"{self.base_url}/chat/completions"
+
+    def headers(self):
+        """Request headers for this backend."""
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key or 'dummy'}"
+        }
+
+    def snapshot(self):
+        """
+        Describe the backend for status endpoints.
+
+        Returns:
+            dict: Identity, current load and circuit breaker state.
+        """
+        return {
+            'name': self.name,
+            'url': self.base_url,
+            'model': self.model,
+            'weight': self.weight,
+            'max_concurrency': self.max_concurrency,
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'breaker': self.breaker.snapshot(),
+        }
+
+
+class BackendPool:
+    """
+    Least-outstanding-requests balancer over a set of backends.
+
+    ``acquire`` picks a backend and counts the request against it; ``release``
+    must be called once the response has been fully consumed.
+    """
+
+    def __init__(self, backends):
+        """
+        Initializes the pool.
+
+        Args:
+            backends (list): LLMBackend instances.
+        """
+        self.backends = list(backends)
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.backends)
+
+    def count(self, names=None):
+        """Number of backends eligible for a route (all if ``names`` is empty)."""
+        return sum(1 for b in self.backends if not names or b.name in names)
+
+    def _candidates(self, exclude, names=None):
+        """
+        Backends not excluded and not ejected (caller holds the condition).
+
+        Half-open backends stay eligible; their breaker admits a single probe
+        and rejects the rest, which then fail over.
+        """
+        return [
+            b for b in self.backends
+            if b not in exclude and b.breaker.state != CircuitBreaker.OPEN
+            and (not names or b.name in names)
+        ]
+
+    def acquire(self, exclude=(), names=None):
+        """
+        Pick the least-loaded healthy backend, waiting if all are at capacity.
+
+        Args:
+            exclude (iterable): Backends already tried for this request.
+            names (iterable, optional): Restrict the choice to these backend names.
+
+        Returns:
+            LLMBackend | None: The chosen backend, or None if none is available.
+        """
+        with self._cond:
+            while True:
+                candidates = self._candidates(exclude, names)
+                if not candidates:
+                    return None
+
+                free = [
+                    b for b in candidates
+                    if not b.max_concurrency or b.outstanding < b.max_concurrency
+                ]
+                if not free:
+                    self._cond.wait(timeout=1)
+                    continue
+
+                backend = min(free, key=lambda b: (b.outstanding + 1) / b.weight)
+                backend.outstanding += 1
+                backend.requests += 1
+                return backend
+
+    def release(self, backend):
+        """
+        Return a request slot taken by ``acquire``.
+
+        Args:
+            backend (LLMBackend): The backend the request was sent to.
+        """
+        with self._cond:
+            backend.outstanding -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        """
+        Return per-backend load and health.
+
+        Returns:
+            list: One snapshot dict per backend.
+        """
+        with self._cond:
+            return [b.snapshot() for b in self.backends]
+
+
+def parse_backends(raw, default_model=None, default_api_key=None):
+    """
+    Build backends from the ``LLM_BACKENDS`` JSON configuration.
+
+    Args:
+        raw (str): JSON list of backend objects.
+        default_model (str, optional): Model for entries that do not set one.
+        default_api_key (str, optional): API key for entries that do not set one.
+
+    Returns:
+        list: LLMBackend instances (invalid entries are skipped with a warning).
+    """
+    try:
+        entries = json.loads(raw)
+    except ValueError as e:
+        logger.error(f"Ignoring invalid LLM_BACKENDS: {e}")
+        return []
+    if not isinstance(entries, list):
+        logger.error("Ignoring LLM_BACKENDS: expected a JSON list")
+        return []
+
+    backends = []
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not entry.get('url'):
+            logger.warning(f"Skipping LLM_BACKENDS entry {i}: 'url' is required")
+            continue
+        model = entry.get('model') or default_model
+        if not model:
+            logger.warning(f"Skipping LLM_BACKENDS entry {i}: no model and LLM_MODEL_NAME unset")
+            continue
+        backends.append(LLMBackend(
+            name=entry.get('name') or f"backend-{i}",
+            url=entry['url'],
+            model=model,
+            api_key=entry.get('api_key') or default_api_key,
+            weight=entry.get('weight', 1),
+            max_concurrency=entry.get('max_concurrency', 0)))
+    return backends
+
+
+_configured_pool = None
+_default_pool = None
+_default_key = None
+_pool_lock = threading.Lock()
+
+
+def get_backend_pool(default_url=None, default_model=None, default_api_key=None, default_breaker=None):
+    """
+    Get the process-wide backend pool.
+
+    Uses ``LLM_BACKENDS`` when configured; otherwise a single backend built from
+    the given defaults (rebuilt if they change, e.g. after the setup wizard).
+
+    Args:
+        default_url (str, optional): Fallback base URL (``LLM_BASE_URL``).
+        default_model (str, optional): Fallback / default model (``LLM_MODEL_NAME``).
+        default_api_key (str, optional): Fallback / default API key.
+        default_breaker (CircuitBreaker, optional): Breaker for the fallback backend.
+
+    Returns:
+        BackendPool | None: The pool, or None if no backend is configured.
+    """
+    global _configured_pool, _default_pool, _default_key
+
+    with _pool_lock:
+        raw = os.getenv("LLM_BACKENDS", "").strip()
+        if raw:
+            if _configured_pool is None:
+                backends = parse_backends(raw, default_model, default_api_key)
+                _configured_pool = BackendPool(backends) if backends else None
+                if _configured_pool:
+                    logger.info(f"LLM backend pool: {', '.join(b.name for b in backends)}")
+            if _configured_pool is not None:
+                return _configured_pool
+
+        if not default_url or not default_model:
+            return None
+        key = (default_url, default_model, default_api_key, id(default_breaker))
+        if _default_pool is None or _default_key != key:
+            _default_pool = BackendPool([LLMBackend(
+                'default', default_url, default_model,
+                api_key=default_api_key, breaker=default_breaker)])
+            _default_key = key
+        return _default_pool
+
+
+def reset_backend_pool():
+    """Discard the pools so configuration is re-read on next use."""
+    global _configured_pool, _default_pool, _default_key
+    with _pool_lock:
+        _configured_pool = None
+        _default_pool = None
+        _default_key = None
+
+
+LLM_UTILITY_MODEL = os.getenv("LLM_UTILITY_MODEL")
+
+# Prompt type -> overrides. Keys: model, backends (names from LLM_BACKENDS),
+# max_tokens, temperature. Unlisted types use the main model and defaults.
+TASK_ROUTES = {
+    'summary': {'model': LLM_UTILITY_MODEL, 'max_tokens': 1024, 'temperature': 0.3},
+    'quiz_count': {'model': LLM_UTILITY_MODEL, 'max_tokens': 1024, 'temperature': 0.0},
+    'flashcard_count': {'model': LLM_UTILITY_MODEL, 'max_tokens': 1024, 'temperature': 0.0},
+    'code_execution': {'model': LLM_UTILITY_MODEL, 'max_tokens': 4096, 'temperature': 0.2},
+    'rollup': {'model': LLM_UTILITY_MODEL, 'max_tokens': 1024, 'temperature': 0.3},
+}
+
+try:
+    for _task, _route in json.loads(os.getenv("LLM_TASK_ROUTES", "{}")).items():
+        TASK_ROUTES[_task] = dict(TASK_ROUTES.get(_task, {}), **_route)
+except (ValueError, TypeError, AttributeError) as e:
+    logger.warning(f"Ignoring invalid LLM_TASK_ROUTES: {e}")
+
+
+def route_for_task(task):
+    """
+    Look up the routing overrides for a prompt type.
+
+    Args:
+        task (str): Prompt type passed to ``call_llm``.
+
+    Returns:
+        dict: Non-empty overrides among ``model``, ``backends``, ``max_tokens``
+        and ``temperature`` (empty for unrouted types).
+    """
+    route = TASK_ROUTES.get(task) or {}
+    return {k: v for k, v in route.items() if v is not None and v != []}
@@ -0,0 +1,359 @@
+"""
+LLM Response Cache - memoises deterministic prompts in front of ``call_llm``.
+
+Also provides ``SingleFlight``, which collapses concurrent identical requests
+(same key) into one upstream call.
+
+Responses are keyed by a hash of (model name, messages, temperature, is_json)
+and stored in two tiers:
+
+1. An in-process LRU (fast, per worker).
+2. A persistent table in the application database (SQLite or Postgres),
+   shared across workers and restarts.
+
+Only prompt types with a positive TTL in ``CACHE_TTLS`` are cached. Creative
+prompt types (teaching material, chat, plans, ...) are listed with a TTL of 0,
+which is the explicit opt-out; callers can also pass ``cache=False`` to
+``call_llm`` to bypass the cache for a single call.
+
+Configuration (environment):
+    LLM_CACHE_ENABLED: Set to 'false' to disable caching entirely.
+    LLM_CACHE_MAX_ENTRIES: Size of the in-memory LRU tier (default 512).
+    LLM_CACHE_PERSISTENT: Set to 'false' to keep only the in-memory tier.
+    LLM_CACHE_TTLS: JSON object overriding TTLs in seconds, e.g. '{"feedback": 3600}'.
+"""
+import os
+import copy
+import json
+import time
+import hashlib
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 512))
+LLM_CACHE_PERSISTENT = os.getenv("LLM_CACHE_PERSISTENT", "true").lower() == "true"
+
+DAY = 24 * 60 * 60
+
+# Time-to-live (seconds) per prompt type. 0 = never cache (creative output).
+CACHE_TTLS = {
+    # Deterministic given their inputs
+    'quiz_count': 30 * DAY,
+    'flashcard_count': 30 * DAY,
+    'code_execution': 7 * DAY,
+    'feedback': 7 * DAY,
+    # Roll-ups cover fixed, immutable blocks of a conversation
+    'rollup': 30 * DAY,
+    # Creative: a regenerate must produce a fresh answer
+    'teaching': 0,
+    'assessment': 0,
+    'chat': 0,
+    'plan': 0,
+    'podcast': 0,
+    'quiz': 0,
+    'flashcards': 0,
+    'suggestions': 0,
+    'summary': 0,
+}
+
+try:
+    CACHE_TTLS.update({k: int(v) for k, v in json.loads(os.getenv("LLM_CACHE_TTLS", "{}")).items()})
+except (ValueError, TypeError, AttributeError) as e:
+    logger.warning(f"Ignoring invalid LLM_CACHE_TTLS: {e}")
+
+
+def make_cache_key(model_name, messages, temperature, is_json):
+    """
+    Build the cache key for an LLM request.
+
+    Args:
+        model_name (str): Model the request is sent to.
+        messages (list): Chat messages in OpenAI format.
+        temperature (float): Sampling temperature.
+        is_json (bool): Whether the response is parsed as JSON.
+
+    Returns:
+        str: Hex SHA-256 digest identifying the request.
+    """
+    raw = json.dumps(
+        {"model": model_name, "messages": messages, "temperature": temperature, "is_json": bool(is_json)},
+        sort_keys=True,
+        ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Two-tier (memory LRU + database) cache of LLM responses.
+
+    All methods are thread-safe and never raise: a cache failure degrades to a
+    miss so the caller simply calls the model.
+    """
+
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES, persistent=LLM_CACHE_PERSISTENT, ttls=None):
+        """
+        Initializes the cache.
+
+        Args:
+            max_entries (int): Capacity of the in-memory LRU tier.
+            persistent (bool): Whether to use the database tier.
+            ttls (dict, optional): TTL per prompt type; defaults to CACHE_TTLS.
+        """
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self.ttls = ttls if ttls is not None else CACHE_TTLS
+        self._entries = OrderedDict()  # key -> (expires_at_epoch, value)
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'persistent_hits': 0, 'misses': 0, 'stores': 0, 'errors': 0}
+
+    def ttl_for(self, task):
+        """Return the TTL in seconds for a prompt type (0 = not cacheable)."""
+        return self.ttls.get(task, 0) if task else 0
+
+    def get(self, key):
+        """
+        Look up a cached response.
+
+        Args:
+            key (str): Key from ``make_cache_key``.
+
+        Returns:
+            tuple: (hit, value). ``value`` is a copy safe for the caller to mutate.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return True, copy.deepcopy(entry[1])
+            if entry:
+                del self._entries[key]
+
+        if self.persistent:
+            hit, value, expires_at = self._persistent_get(key)
+            if hit:
+                self._remember(key, value, expires_at)
+                with self._lock:
+                    self._stats['persistent_hits'] += 1
+                return True, copy.deepcopy(value)
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return False, None
+
+    def set(self, key, value, task, model_name=None):
+        """
+        Store a response if its prompt type is cacheable.
+
+        Args:
+            key (str): Key from ``make_cache_key``.
+            value: JSON-serialisable response (string or parsed JSON).
+            task (str): Prompt type, used to pick the TTL.
+            model_name (str, optional): Model that produced the response.
+        """
+        ttl = self.ttl_for(task)
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self._remember(key, copy.deepcopy(value), expires_at)
+        with self._lock:
+            self._stats['stores'] += 1
+        if self.persistent:
+            self._persistent_set(key, value, task, model_name, expires_at)
+
+    def clear(self):
+        """Drop the in-memory tier (the persistent tier expires on its own)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return hit/miss counters.
+
+        Returns:
+            dict: Counters plus the current in-memory size and overall hit rate.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._entries)
+        lookups = stats['memory_hits'] + stats['persistent_hits'] + stats['misses']
+        stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _remember(self, key, value, expires_at):
+        """Insert into the LRU tier, evicting the least recently used entries."""
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _persistent_get(self, key):
+        """Read from the database tier on its own connection (outside the request session)."""
+        from flask import has_app_context
+        if not has_app_context():
+            return False, None, None
+        try:
+            from app.core.extensions import db
+            from app.core.models import LLMCacheEntry
+            table = LLMCacheEntry.__table__
+            with db.engine.connect() as conn:
+                row = conn.execute(
+                    table.select().where(table.c.cache_key == key)
+                ).first()
+            if row is None:
+                return False, None, None
+            expires_at = row.expires_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+            if expires_at <= time.time():
+                return False, None, None
+            return True, row.response, expires_at
+        except Exception as e:
+            logger.debug(f"LLM cache read failed: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+            return False, None, None
+
+    def _persistent_set(self, key, value, task, model_name, expires_at):
+        """Upsert into the database tier on its own connection."""
+        from flask import has_app_context
+        if not has_app_context():
+            return
+        try:
+            from app.core.extensions import db
+            from app.core.models import LLMCacheEntry
+            table = LLMCacheEntry.__table__
+            expires = datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc).replace(tzinfo=None)
+            now = datetime.datetime.utcnow()
+            with db.engine.begin() as conn:
+                # Replace this key and purge expired rows (cheap via the expires_at index)
+                conn.execute(table.delete().where(
+                    (table.c.cache_key == key) | (table.c.expires_at < now)))
+                conn.execute(table.insert().values(
+                    cache_key=key,
+                    task=task,
+                    model_name=model_name,
+                    response=value,
+                    created_at=now,
+                    expires_at=expires))
+        except Exception as e:
+            logger.debug(f"LLM cache write failed: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """
+    Get the process-wide LLM response cache, or None if caching is disabled.
+
+    Returns:
+        LLMResponseCache | None: The shared cache.
+    """
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache()
+    return _cache
+
+
+class _InFlightCall:
+    """State shared between the leader and followers of one in-flight request."""
+
+    def __init__(self):
+        """Initializes an unfinished call."""
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    De-duplicates concurrent identical LLM requests.
+
+    The first caller for a key (the leader) performs the upstream call; callers
+    arriving with the same key while it is in flight block and receive a copy of
+    a snapshot taken before the leader returns, or re-raise its exception.
+    """
+
+    def __init__(self):
+        """Initializes an empty in-flight table."""
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'leaders': 0, 'shared': 0}
+
+    def do(self, key, fn):
+        """
+        Run ``fn`` once per key among concurrent callers.
+
+        Args:
+            key (str): Request hash (see ``make_cache_key``).
+            fn (callable): Zero-argument function performing the upstream call.
+
+        Returns:
+            The result of ``fn``. Followers get private deep copies, so no caller
+            sees another's mutations.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+                self._stats['leaders'] += 1
+            else:
+                self._stats['shared'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            result = fn()
+            # Snapshot before the leader's caller can mutate what it is handed
+            call.result = copy.deepcopy(result)
+            return result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def stats(self):
+        """
+        Return de-duplication counters.
+
+        Returns:
+            dict: Upstream calls made (``leaders``), calls that joined one (``shared``)
+            and the number currently in flight.
+        """
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight():
+    """
+    Get the process-wide single-flight group used by ``call_llm``.
+
+    Returns:
+        SingleFlight: The shared instance.
+    """
+    return _single_flight
@@ -0,0 +1,232 @@
+"""
+LLM Scheduler - admission control for calls to the model backend.
+
+All threads of all users share one local inference server, so ``call_llm``
+takes a slot from this scheduler before contacting it:
+
+- A global concurrency cap bounds in-flight requests (``LLM_MAX_CONCURRENCY``,
+  0 disables the cap).
+- Waiting requests are grouped into priority lanes. A free slot always goes to
+  the highest-priority lane with waiters: interactive chat, then teaching
+  material, then background work (summaries, prefetch).
+- Within a lane, users are served round-robin, so one user's bulk flashcard
+  top-ups cannot starve another user's request.
+- Queue time is recorded per lane and exposed through ``stats()``.
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 4))
+
+INTERACTIVE = 'interactive'
+TEACHING = 'teaching'
+BACKGROUND = 'background'
+
+# Highest priority first
+LANES = (INTERACTIVE, TEACHING, BACKGROUND)
+
+# Prompt type (the ``task`` passed to call_llm) -> lane. Unlisted types use TEACHING.
+TASK_LANES = {
+    'chat': INTERACTIVE,
+    'feedback': INTERACTIVE,
+    'code_execution': INTERACTIVE,
+    'summary': BACKGROUND,
+    # Computed by the summary worker; chat replies only read stored roll-ups
+    'rollup': BACKGROUND,
+    'prefetch': BACKGROUND,
+}
+
+_SAMPLE_WINDOW = 1000
+
+
+def lane_for_task(task):
+    """
+    Map a prompt type to its priority lane.
+
+    Args:
+        task (str): Prompt type passed to ``call_llm``.
+
+    Returns:
+        str: One of LANES.
+    """
+    return TASK_LANES.get(task, TEACHING)
+
+
+class _LaneMetrics:
+    """Queue-time statistics for one lane."""
+
+    def __init__(self):
+        """Initializes empty counters."""
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.samples = deque(maxlen=_SAMPLE_WINDOW)
+
+    def record(self, wait):
+        """Record the queue time of one admitted request."""
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.samples.append(wait)
+
+    def snapshot(self, queued):
+        """Return the metrics as a dict (times in milliseconds)."""
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 2)
+
+        return {
+            'queued': queued,
+            'admitted': self.admitted,
+            'avg_wait_ms': round(self.total_wait / self.admitted * 1000, 2) if self.admitted else 0.0,
+            'p50_wait_ms': percentile(0.50),
+            'p95_wait_ms': percentile(0.95),
+            'max_wait_ms': round(self.max_wait * 1000, 2),
+        }
+
+
+class LLMScheduler:
+    """
+    Concurrency-capped, priority-laned, per-user fair queue for LLM calls.
+
+    Use ``acquire``/``release`` (or the ``slot`` context manager) around the
+    upstream request.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY):
+        """
+        Initializes the scheduler.
+
+        Args:
+            max_concurrency (int): Maximum concurrent upstream calls (0 = unlimited).
+        """
+        self.max_concurrency = max_concurrency
+        self._cond = threading.Condition()
+        self._active = 0
+        # lane -> OrderedDict(user_id -> deque of tickets); dict order is the round-robin order
+        self._queues = {lane: OrderedDict() for lane in LANES}
+        self._metrics = {lane: _LaneMetrics() for lane in LANES}
+
+    def _has_capacity(self):
+        """Whether another request may start now (caller holds the condition)."""
+        return not self.max_concurrency or self._active < self.max_concurrency
+
+    def _next_ticket(self):
+        """Return (lane, user_id, ticket) of the request that should run next."""
+        for lane in LANES:
+            users = self._queues[lane]
+            if users:
+                user_id, tickets = next(iter(users.items()))
+                return lane, user_id, tickets[0]
+        return None, None, None
+
+    def acquire(self, lane=TEACHING, user_id=None):
+        """
+        Block until this request may call the backend.
+
+        Args:
+            lane (str): Priority lane (one of LANES).
+            user_id (str, optional): Requesting user, for fair queuing.
+
+        Returns:
+            float: Seconds spent queued.
+        """
+        if lane not in self._queues:
+            lane = TEACHING
+        start = time.monotonic()
+        ticket = object()
+
+        with self._cond:
+            users = self._queues[lane]
+            users.setdefault(user_id, deque()).append(ticket)
+
+            try:
+                while not (self._has_capacity() and self._next_ticket()[2] is ticket):
+                    self._cond.wait()
+            except BaseException:
+                # Interrupted while queued: withdraw the ticket so it cannot block the lane
+                users[user_id].remove(ticket)
+                if not users[user_id]:
+                    del users[user_id]
+                self._cond.notify_all()
+                raise
+
+            # Dequeue and move this user to the back of the lane's rotation
+            tickets = users.pop(user_id)
+            tickets.popleft()
+            if tickets:
+                users[user_id] = tickets
+            self._active += 1
+
+            wait = time.monotonic() - start
+            self._metrics[lane].record(wait)
+            # Another waiter may also fit (e.g. several slots freed at once)
+            self._cond.notify_all()
+
+        if wait > 1:
+            logger.debug(f"LLM request queued {wait:.2f}s in lane '{lane}'")
+        return wait
+
+    def release(self):
+        """Free the slot taken by ``acquire``."""
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, lane=TEACHING, user_id=None):
+        """
+        Context manager holding a slot for the duration of the block.
+
+        Args:
+            lane (str): Priority lane.
+            user_id (str, optional): Requesting user.
+
+        Yields:
+            float: Seconds spent queued.
+        """
+        wait = self.acquire(lane, user_id)
+        try:
+            yield wait
+        finally:
+            self.release()
+
+    def stats(self):
+        """
+        Return current load and per-lane queue-time metrics.
+
+        Returns:
+            dict: ``max_concurrency``, ``active`` and a ``lanes`` mapping.
+        """
+        with self._cond:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'active': self._active,
+                'lanes': {
+                    lane: self._metrics[lane].snapshot(
+                        sum(len(t) for t in self._queues[lane].values()))
+                    for lane in LANES
+                },
+            }
+
+
+_scheduler = LLMScheduler()
+
+
+def get_llm_scheduler():
+    """
+    Get the process-wide LLM scheduler.
+
+    Returns:
+        LLMScheduler: The shared scheduler.
+    """
+    return _scheduler
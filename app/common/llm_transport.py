@@ -0,0 +1,408 @@
+"""
+LLM Transport - pooled HTTP connections for OpenAI-compatible backends.
+
+Every agent reaches the model through ``call_llm``. Instead of opening a new
+TCP (and TLS) connection per request, calls share one ``requests.Session``
+whose connection pools keep sockets alive between requests.
+
+Configuration (environment):
+    LLM_POOL_CONNECTIONS: Number of per-host pools to cache (default 4).
+    LLM_POOL_MAXSIZE: Maximum open connections kept per host (default 16).
+    LLM_POOL_BLOCK: If 'true', callers wait for a free connection instead of
+        opening extra, non-pooled ones once a host reaches LLM_POOL_MAXSIZE.
+    LLM_KEEP_ALIVE: Set to 'false' to close connections after every call.
+    LLM_HTTP2: Set to 'true' to negotiate HTTP/2 (requires urllib3 >= 2.3 with
+        the optional 'h2' package; falls back to HTTP/1.1 otherwise).
+
+Resilience (environment):
+    LLM_CONNECT_TIMEOUT / LLM_READ_TIMEOUT: Seconds to establish a connection
+        (default 5) and to wait between bytes of the response (default 300).
+    LLM_RETRY_ATTEMPTS: Total attempts for a request (default 3, 1 = no retries).
+    LLM_RETRY_BACKOFF_BASE / LLM_RETRY_BACKOFF_MAX: Exponential backoff with
+        full jitter, in seconds (defaults 0.5 and 8).
+    LLM_BREAKER_FAILURES: Consecutive failures that open the circuit (default 5).
+    LLM_BREAKER_RESET: Seconds the circuit stays open before a probe (default 30).
+"""
+import os
+import time
+import random
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+LLM_POOL_CONNECTIONS = int(os.getenv("LLM_POOL_CONNECTIONS", 4))
+LLM_POOL_MAXSIZE = int(os.getenv("LLM_POOL_MAXSIZE", 16))
+LLM_POOL_BLOCK = os.getenv("LLM_POOL_BLOCK", "false").lower() == "true"
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "true").lower() == "true"
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() == "true"
+
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", 300))
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", 3))
+LLM_RETRY_BACKOFF_BASE = float(os.getenv("LLM_RETRY_BACKOFF_BASE", 0.5))
+LLM_RETRY_BACKOFF_MAX = float(os.getenv("LLM_RETRY_BACKOFF_MAX", 8))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", 30))
+
+
+def _enable_http2():
+    """
+    Opt urllib3 into HTTP/2 via its (experimental) h2 integration.
+
+    Returns:
+        bool: True if HTTP/2 was enabled, False if unsupported in this environment.
+    """
+    try:
+        import urllib3.http2
+        urllib3.http2.inject_into_urllib3()
+        return True
+    except Exception as e:
+        # urllib3 < 2.3 or 'h2' not installed
+        logger.warning(f"HTTP/2 requested for LLM transport but unavailable: {e}")
+        return False
+
+
+class LLMTransport:
+    """
+    Thread-safe pooled HTTP client used for all LLM requests.
+
+    Wraps a single ``requests.Session`` mounted with a sized ``HTTPAdapter`` so
+    connections to the backend are reused across agents and request threads.
+    """
+
+    def __init__(self, pool_connections=LLM_POOL_CONNECTIONS, pool_maxsize=LLM_POOL_MAXSIZE,
+                 pool_block=LLM_POOL_BLOCK, keep_alive=LLM_KEEP_ALIVE, http2=LLM_HTTP2):
+        """
+        Create the session and mount the pooled adapter.
+
+        Args:
+            pool_connections: Number of host pools to keep.
+            pool_maxsize: Maximum connections kept alive per host.
+            pool_block: Whether to block when a host's pool is exhausted.
+            keep_alive: Whether to reuse connections between calls.
+            http2: Whether to try negotiating HTTP/2.
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.http2 = _enable_http2() if http2 else False
+
+        self.session = requests.Session()
+        # Retries are handled explicitly by the caller, never silently here
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            max_retries=0
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+
+    def post(self, url, **kwargs):
+        """
+        Issue a POST request over the pooled session.
+
+        Args:
+            url: Target URL.
+            **kwargs: Passed through to ``requests.Session.post``.
+
+        Returns:
+            requests.Response: The response object.
+        """
+        return self.session.post(url, **kwargs)
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_llm_transport():
+    """
+    Get the process-wide LLM transport, creating it on first use.
+
+    Creation is lazy so that pre-forking servers build the pool in each worker
+    rather than sharing sockets across processes.
+
+    Returns:
+        LLMTransport: The shared transport.
+    """
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = LLMTransport()
+                logger.info(
+                    f"LLM transport initialized (pool_maxsize={_transport.pool_maxsize}, "
+                    f"keep_alive={_transport.keep_alive}, http2={_transport.http2})")
+    return _transport
+
+
+def reset_llm_transport():
+    """Close and discard the shared transport (e.g. after configuration changes)."""
+    global _transport
+    with _transport_lock:
+        if _transport is not None:
+            _transport.close()
+        _transport = None
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter for idempotent LLM requests.
+
+    Connection failures, connect timeouts and transient statuses (429/502/503/504)
+    are retried. Read timeouts are not: the backend accepted the request and a
+    retry would only double the wait.
+    """
+
+    RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+    def __init__(self, max_attempts=LLM_RETRY_ATTEMPTS, backoff_base=LLM_RETRY_BACKOFF_BASE,
+                 backoff_max=LLM_RETRY_BACKOFF_MAX):
+        """
+        Initializes the policy.
+
+        Args:
+            max_attempts (int): Total attempts including the first one.
+            backoff_base (float): Backoff ceiling for the first retry, in seconds.
+            backoff_max (float): Upper bound for any single backoff, in seconds.
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def is_retryable_error(self, error):
+        """Whether a transport exception may be retried."""
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(error, requests.exceptions.Timeout):
+            return False
+        return isinstance(error, requests.exceptions.ConnectionError)
+
+    def is_retryable_status(self, status_code):
+        """Whether an HTTP status may be retried."""
+        return status_code in self.RETRY_STATUSES
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Seconds to sleep before retry number ``attempt`` (1-based).
+
+        Args:
+            attempt (int): Retry number.
+            retry_after (str, optional): Server-provided Retry-After header.
+
+        Returns:
+            float: Delay in seconds.
+        """
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass  # HTTP-date form; fall back to jittered backoff
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """
+    Fails fast while the LLM backend is down.
+
+    CLOSED: requests flow; consecutive failures are counted.
+    OPEN: after ``failure_threshold`` failures, requests are rejected for
+        ``reset_timeout`` seconds without touching the network.
+    HALF_OPEN: after the timeout one probe request is let through; success
+        closes the circuit, failure re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES, reset_timeout=LLM_BREAKER_RESET, name='llm'):
+        """
+        Initializes a closed breaker.
+
+        Args:
+            failure_threshold (int): Consecutive failures that open the circuit.
+            reset_timeout (float): Seconds to stay open before probing.
+            name (str): Label used in logs and health output.
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._last_error = None
+
+    @property
+    def state(self):
+        """Current state, accounting for an expired open period."""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self):
+        """
+        Decide whether a request may be sent now.
+
+        Returns:
+            bool: False while open (or while a half-open probe is already running).
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # HALF_OPEN: only a single probe at a time
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        """Close the circuit after a successful request."""
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed: backend recovered")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error=None):
+        """
+        Count a failed request, opening the circuit at the threshold.
+
+        Args:
+            error: The failure, kept for health reporting.
+        """
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error) if error else None
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Circuit '{self.name}' opened after {self._failures} failures: {error}")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        """
+        Describe the breaker for health endpoints.
+
+        Returns:
+            dict: state, consecutive failures, seconds until the next probe and last error.
+        """
+        state = self.state
+        with self._lock:
+            retry_in = 0.0
+            if state == self.OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            return {
+                'name': self.name,
+                'state': state,
+                'consecutive_failures': self._failures,
+                'retry_in_seconds': round(retry_in, 1),
+                'last_error': self._last_error,
+            }
+
+
+def post_with_resilience(transport, url, breaker, policy, **kwargs):
+    """
+    POST through the transport with circuit breaking and retries.
+
+    Args:
+        transport (LLMTransport): Pooled transport.
+        url (str): Target URL.
+        breaker (CircuitBreaker): Breaker guarding the backend.
+        policy (RetryPolicy): Retry policy.
+        **kwargs: Passed to ``LLMTransport.post``; ``timeout`` defaults to
+            (LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT).
+
+    Returns:
+        requests.Response: The final response (possibly a non-retryable error status).
+
+    Raises:
+        LLMConnectionError: If the circuit is open
+        requests.exceptions.RequestException: If the last attempt failed
+    """
+    from app.core.exceptions import LLMConnectionError
+
+    kwargs.setdefault('timeout', (LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT))
+
+    for attempt in range(1, policy.max_attempts + 1):
+        if not breaker.allow_request():
+            raise LLMConnectionError(
+                "LLM service is unavailable (circuit open); please retry shortly",
+                endpoint=url,
+                error_code="LLM016",
+                debug_info=breaker.snapshot()
+            )
+
+        last = attempt == policy.max_attempts
+        try:
+            response = transport.post(url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            breaker.record_failure(e)
+            if last or not policy.is_retryable_error(e):
+                raise
+            delay = policy.backoff(attempt)
+            logger.warning(f"LLM request failed ({e}); retry {attempt}/{policy.max_attempts - 1} in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+
+        if response.status_code >= 500 or response.status_code == 429:
+            breaker.record_failure(f"HTTP {response.status_code}")
+            if not last and policy.is_retryable_status(response.status_code):
+                delay = policy.backoff(attempt, response.headers.get('Retry-After'))
+                logger.warning(
+                    f"LLM returned HTTP {response.status_code}; "
+                    f"retry {attempt}/{policy.max_attempts - 1} in {delay:.2f}s")
+                response.close()
+                time.sleep(delay)
+                continue
+        else:
+            breaker.record_success()
+        return response
+
+
+_breaker = CircuitBreaker()
+_retry_policy = RetryPolicy()
+
+
+def get_llm_breaker():
+    """
+    Get the circuit breaker guarding the LLM backend.
+
+    Returns:
+        CircuitBreaker: The shared breaker.
+    """
+    return _breaker
+
+
+def get_retry_policy():
+    """
+    Get the retry policy for LLM requests.
+
+    Returns:
+        RetryPolicy: The shared policy.
+    """
+    return _retry_policy
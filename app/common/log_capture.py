@@ -1,4 +1,23 @@
+"""
+Log Capture - line-buffered stdout/stderr capture into rotating log segments.
+
+Terminal output used to be queued one dict per ``write()`` call (including
+every bare newline) and flushed as a single ``TelemetryLog`` row holding up
+to 1000 writes in its JSON payload, which DCS sync then shipped whole.
+
+Now partial writes are joined into lines before they are queued, and the
+worker appends each batch as a gzip member to the current segment file under
+``LOG_CAPTURE_PATH``. A segment is closed once it reaches
+``LOG_SEGMENT_MAX_BYTES`` and a new one is started. ``index.json`` records
+each segment's first and last line time, so a later upload only has to read
+the segments overlapping a time range. Closed segments are deleted once they
+are older than ``LOG_RETENTION_DAYS`` or the segments together exceed
+``LOG_RETENTION_MAX_BYTES``.
+"""
+import os
 import sys
+import gzip
+import json
 import threading
 import time
 import queue
@@ -6,10 +25,172 @@ import atexit
 import datetime
 import logging
 
+LOG_CAPTURE_PATH = os.getenv('LOG_CAPTURE_PATH') or os.path.join(os.getcwd(), 'data', 'logs')
+LOG_SEGMENT_MAX_BYTES = int(os.getenv('LOG_SEGMENT_MAX_BYTES', 1024 * 1024))
+LOG_RETENTION_MAX_BYTES = int(os.getenv('LOG_RETENTION_MAX_BYTES', 50 * 1024 * 1024))
+LOG_RETENTION_DAYS = float(os.getenv('LOG_RETENTION_DAYS', 14))
+LOG_CAPTURE_QUEUE_SIZE = int(os.getenv('LOG_CAPTURE_QUEUE_SIZE', 10000))
+LOG_CAPTURE_FLUSH_INTERVAL = float(os.getenv('LOG_CAPTURE_FLUSH_INTERVAL', 5.0))
+
+# A "line" without a newline is cut here so a runaway partial write can't grow unbounded
+LOG_LINE_MAX_CHARS = 8192
+
+
+def _timestamp(moment=None):
+    """Fixed-width UTC ISO timestamp, so index times compare as strings."""
+    return (moment or datetime.datetime.utcnow()).isoformat(timespec='milliseconds')
+
+
+class LogSegmentStore:
+    """
+    Gzip-compressed, size-rotated segment files plus a JSON index of their time ranges.
+
+    Each segment is JSON lines (``{"t": time, "s": stream, "m": message}``)
+    written as one gzip member per batch, so a segment is readable while it is
+    still being appended to. Only the capture worker appends; ``segments`` and
+    ``read`` may be called from any thread.
+    """
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, path, max_segment_bytes=LOG_SEGMENT_MAX_BYTES,
+                 max_total_bytes=LOG_RETENTION_MAX_BYTES, retention_days=LOG_RETENTION_DAYS):
+        """
+        Opens (or creates) the segment directory.
+
+        Args:
+            path (str): Directory holding the segments and ``index.json``.
+            max_segment_bytes (int): Compressed size at which a segment is closed.
+            max_total_bytes (int): Closed segments are dropped, oldest first, beyond this total.
+            retention_days (float): Closed segments whose last line is older are dropped.
+        """
+        self.path = path
+        self.max_segment_bytes = max_segment_bytes
+        self.max_total_bytes = max_total_bytes
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._index = self._load_index()
+        with self._lock:
+            self._prune()
+
+    def _load_index(self):
+        """Read the index, keeping only entries whose segment file still exists."""
+        try:
+            with open(os.path.join(self.path, self.INDEX_FILE), encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return []
+        return [e for e in entries if os.path.exists(os.path.join(self.path, e['file']))]
+
+    def _save_index(self):
+        """Write the index atomically (write a temp file, then rename it over)."""
+        target = os.path.join(self.path, self.INDEX_FILE)
+        with open(target + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self._index, f)
+        os.replace(target + '.tmp', target)
+
+    def append(self, lines):
+        """
+        Append a batch of lines to the current segment, rotating and pruning as needed.
+
+        Args:
+            lines (list): (timestamp, stream, message) tuples in time order.
+        """
+        if not lines:
+            return
+        data = ''.join(
+            json.dumps({'t': t, 's': s, 'm': m}, ensure_ascii=False) + '\n' for t, s, m in lines)
+
+        with self._lock:
+            current = self._index[-1] if self._index and not self._index[-1]['closed'] else None
+            if current is None:
+                start = lines[0][0]
+                current = {
+                    'file': f"segment-{start.replace(':', '').replace('-', '')}.jsonl.gz",
+                    'start': start, 'end': start, 'lines': 0, 'bytes': 0, 'closed': False,
+                }
+                self._index.append(current)
+
+            segment = os.path.join(self.path, current['file'])
+            with open(segment, 'ab') as f:
+                f.write(gzip.compress(data.encode('utf-8')))
+            current['end'] = lines[-1][0]
+            current['lines'] += len(lines)
+            current['bytes'] = os.path.getsize(segment)
+
+            if current['bytes'] >= self.max_segment_bytes:
+                current['closed'] = True
+                self._prune()
+            self._save_index()
+
+    def _prune(self):
+        """Delete closed segments past the age or total size limit, oldest first, keeping the newest."""
+        cutoff = _timestamp(datetime.datetime.utcnow() - datetime.timedelta(days=self.retention_days))
+        total = sum(e['bytes'] for e in self._index)
+        keep = []
+        for entry in self._index[:-1]:
+            if entry['closed'] and (entry['end'] < cutoff or total > self.max_total_bytes):
+                total -= entry['bytes']
+                try:
+                    os.remove(os.path.join(self.path, entry['file']))
+                except FileNotFoundError:
+                    pass
+                continue
+            keep.append(entry)
+        self._index = keep + self._index[-1:]
+
+    def segments(self, start=None, end=None):
+        """
+        List segments holding lines within a time range.
+
+        Args:
+            start (datetime, optional): Earliest line time of interest.
+            end (datetime, optional): Latest line time of interest.
+
+        Returns:
+            list: Index entries (file, start, end, lines, bytes, closed), oldest first.
+        """
+        low = _timestamp(start) if start else None
+        high = _timestamp(end) if end else None
+        with self._lock:
+            return [dict(e) for e in self._index
+                    if (low is None or e['end'] >= low) and (high is None or e['start'] <= high)]
+
+    def read(self, segment):
+        """
+        Read the lines of a segment.
+
+        Args:
+            segment (dict | str): Index entry or segment file name.
+
+        Returns:
+            list: ``{"t", "s", "m"}`` dicts in the order they were written.
+        """
+        name = segment['file'] if isinstance(segment, dict) else segment
+        with gzip.open(os.path.join(self.path, name), 'rt', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def stats(self):
+        """
+        Return segment totals.
+
+        Returns:
+            dict: segments, lines and bytes currently on disk.
+        """
+        with self._lock:
+            return {
+                'segments': len(self._index),
+                'lines': sum(e['lines'] for e in self._index),
+                'bytes': sum(e['bytes'] for e in self._index),
+            }
+
+
 class LogCapture:
     """
-    Captures stdout and stderr, buffers them, and asynchronously writes to the database.
-    Uses a queue to ensure non-blocking application performance.
+    Captures stdout and stderr line by line and asynchronously writes them to log segments.
+    Uses a bounded queue to ensure non-blocking application performance: when the
+    worker falls behind, new lines are dropped and counted.
 
     This class is implemented as a singleton. Multiple calls to ``LogCapture(app=...)``
     will return the same shared instance. Only the first successful instantiation's
@@ -32,20 +213,26 @@ class LogCapture:
             return
 
         self.app = app
-        self.queue = queue.Queue()
+        self.queue = queue.Queue(maxsize=LOG_CAPTURE_QUEUE_SIZE)
         self.original_stdout = sys.stdout
         self.original_stderr = sys.stderr
         self.stop_event = threading.Event()
         self.worker_thread = None
+        self.dropped = 0
 
         # Configuration
         self.batch_size = 1000
-        self.flush_interval = 300  # seconds
+        self.flush_interval = LOG_CAPTURE_FLUSH_INTERVAL  # seconds
+        path = (app.config.get('LOG_CAPTURE_PATH') if app else None) or LOG_CAPTURE_PATH
+        self.store = LogSegmentStore(path)
 
         try:
             # Install hooks
-            sys.stdout = self._make_stream_wrapper(self.original_stdout, 'stdout')
-            sys.stderr = self._make_stream_wrapper(self.original_stderr, 'stderr')
+            self._wrappers = [
+                self._make_stream_wrapper(self.original_stdout, 'stdout'),
+                self._make_stream_wrapper(self.original_stderr, 'stderr'),
+            ]
+            sys.stdout, sys.stderr = self._wrappers
 
             # Start background worker
             self._start_worker()
@@ -64,26 +251,60 @@ class LogCapture:
             self.worker_thread = None
             # Propagate the error to the caller.
             raise
+
+    def _capture(self, stream_name, line):
+        """Queue one complete line, skipping blank ones; drop it if the queue is full."""
+        line = line.rstrip('\r')
+        if not line.strip():
+            return
+        try:
+            self.queue.put_nowait((_timestamp(), stream_name, line))
+        except queue.Full:
+            self.dropped += 1
+
     def _make_stream_wrapper(self, original_stream, stream_name):
-        """Creates a wrapper that writes to both original stream and queue."""
+        """Creates a wrapper that writes to the original stream and queues complete lines."""
         capture_instance = self
 
         class StreamWrapper:
-            """Stream wrapper that mirrors writes to a queue for capture."""
+            """Stream wrapper that joins partial writes into lines for capture."""
+
+            def __init__(self):
+                """Starts with no pending partial line."""
+                self._partial = []
+                self._partial_size = 0
+                self._lock = threading.Lock()
 
             def write(self, message):
-                """Write message to original stream and capture queue."""
+                """Write message to original stream and queue any lines it completes."""
                 # Write to original stream (console)
                 original_stream.write(message)
+                if not message:
+                    return
 
-                # Filter out empty writes or just newlines if desired,
-                # but often we want to capture everything.
-                if message:
-                    capture_instance.queue.put({
-                        'stream': stream_name,
-                        'message': message,
-                        'timestamp': datetime.datetime.utcnow().isoformat()
-                    })
+                with self._lock:
+                    if '\n' not in message:
+                        self._partial.append(message)
+                        self._partial_size += len(message)
+                        if self._partial_size >= LOG_LINE_MAX_CHARS:
+                            self.flush_partial()
+                        return
+
+                    lines = message.split('\n')
+                    if self._partial:
+                        lines[0] = ''.join(self._partial) + lines[0]
+                    self._partial = [lines[-1]] if lines[-1] else []
+                    self._partial_size = len(lines[-1])
+
+                for line in lines[:-1]:
+                    capture_instance._capture(stream_name, line)
+
+            def flush_partial(self):
+                """Queue the pending partial line, if any, as a line of its own."""
+                if self._partial:
+                    capture_instance._capture(stream_name, ''.join(self._partial))
+                    self._partial = []
+                    self._partial_size = 0
 
             def flush(self):
                 """Flush the original stream."""
@@ -158,54 +379,36 @@ class LogCapture:
         if rest:
             self._flush(rest)
 
-    def _flush(self, logs):
-        """Writes buffered logs to database."""
-        if not self.app:
-            return
-
+    def _flush(self, lines):
+        """Appends buffered lines to the current log segment."""
         try:
-            with self.app.app_context():
-                # Avoid circular imports
-                from app.core.models import TelemetryLog, Installation
-                from app.core.extensions import db
-                from sqlalchemy.exc import OperationalError
-
-                # We need an installation ID. Since this is background, we can't reliably get current_user.
-                # We'll use the first installation found or a system sentinel.
-                # In a single-user app context, this is usually acceptable.
-                inst = Installation.query.first()
-                if not inst:
-                    return
-
-                # Create one telemetry entry for the batch
-                log_entry = TelemetryLog(
-                    installation_id=inst.installation_id,
-                    session_id='system_background',
-                    event_type='terminal_log',
-                    triggers={'source': 'system_capture'},
-                    payload={'logs': logs}
-                )
-
-                db.session.add(log_entry)
-                db.session.commit()
-
-        except OperationalError as e:
-            # Suppress "no such table" errors which happen during startup/setup
-            # This avoids noise when logging happens before DB initialization
-            if "no such table" in str(e):
-                return
-            # Log other operational errors
-            self.original_stderr.write(f"LogCapture Flush Failed (Operational): {e}\n")
-
+            self.store.append(lines)
         except Exception as e:
-            # Fallback to original stderr if DB fails
+            # Fallback to original stderr if the segment can't be written
             self.original_stderr.write(f"LogCapture Flush Failed: {e}\n")
 
+    def stats(self):
+        """
+        Return capture counters.
+
+        Returns:
+            dict: Segment totals plus pending (queued lines) and dropped (queue full).
+        """
+        return dict(self.store.stats(), pending=self.queue.qsize(), dropped=self.dropped)
+
     def stop(self):
         """Stops the worker thread and restores streams."""
+        # Lines still waiting for a newline are captured as they are
+        for wrapper in self._wrappers:
+            with wrapper._lock:
+                wrapper.flush_partial()
+
         self.stop_event.set()
         # Wake up worker immediately
-        self.queue.put(None)
+        try:
+            self.queue.put(None, timeout=1.0)
+        except queue.Full:
+            pass
 
         if self.worker_thread:
             # Wait for worker to finish processing
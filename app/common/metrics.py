@@ -0,0 +1,446 @@
+"""
+Metrics - in-process counters, gauges and latency histograms.
+
+Until now the only performance data were ``AIModelPerformance`` rows, which
+have to be queried out of the app database and aggregated by hand. The
+metrics below are aggregated in memory instead and exported at ``/metrics``
+in OpenMetrics text format for Prometheus (or any compatible scraper).
+
+Histograms use fixed buckets, so recording a sample is a bisect and two
+additions under a lock; nothing is kept per sample. All values are per
+process: with several gunicorn workers, the scraper sums the series.
+
+Components that already keep their own counters (scheduler, caches, background
+writers) are exported through collectors called at scrape time, see
+``MetricsRegistry.register_collector``.
+"""
+import math
+import time
+import bisect
+import functools
+import logging
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Seconds. Local TTS/STT and sandbox runs take seconds; LLM completions up to minutes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# SQL statements issued by one storage call
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+def _escape(value):
+    """Escape a label value for the text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    """Render ``{name="value",...}`` (empty string without labels)."""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    """Render a sample value; integral floats lose their ``.0``."""
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if value.is_integer():
+            return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    """A metric family: one value (or histogram) per label combination."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Initializes an empty family.
+
+        Args:
+            name (str): Family name (without ``_total`` for counters).
+            documentation (str): HELP text.
+            labelnames (tuple): Label names every sample must supply.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        """Label values in ``labelnames`` order."""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key):
+        """Pair label names with the values of a key."""
+        return list(zip(self.labelnames, key))
+
+    def clear(self):
+        """Drop all recorded values (used by tests)."""
+        with self._lock:
+            self._values.clear()
+
+    @abstractmethod
+    def samples(self):
+        """
+        Return the family's samples.
+
+        Returns:
+            list: (sample name, label pairs, value) tuples.
+        """
+        pass
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Add ``amount`` (>= 0) to the series selected by ``labels``."""
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Current value of one series (0 if never incremented)."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        """Return one ``<name>_total`` sample per series."""
+        with self._lock:
+            return [(f'{self.name}_total', self._labels(key), value)
+                    for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        """Set the series selected by ``labels``."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        """Current value of one series (0 if never set)."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        """Return one sample per series."""
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """Distribution over fixed buckets, plus the sum and count of all samples."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        Initializes an empty family.
+
+        Args:
+            name (str): Family name.
+            documentation (str): HELP text.
+            labelnames (tuple): Label names every sample must supply.
+            buckets (tuple): Increasing upper bounds; ``+Inf`` is implied.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """Record one sample in the series selected by ``labels``."""
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts (last one is +Inf), sum, count
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock seconds spent in the ``with`` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        """Number of samples recorded in one series."""
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            return series[2] if series else 0
+
+    def samples(self):
+        """Return cumulative ``_bucket`` samples, then ``_count`` and ``_sum``, per series."""
+        result = []
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._values.items())
+        for key, (counts, total, count) in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = '+Inf' if math.isinf(bound) else repr(float(bound))
+                result.append((f'{self.name}_bucket', labels + [('le', le)], cumulative))
+            result.append((f'{self.name}_count', labels, count))
+            result.append((f'{self.name}_sum', labels, total))
+        return result
+
+
+class MetricsRegistry:
+    """Named metric families plus collectors for values owned by other components."""
+
+    def __init__(self):
+        """Initializes an empty registry."""
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        """Return the family called ``name``, creating it on first use."""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with another type or labels")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Get or create a Counter."""
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        """Get or create a Gauge."""
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """Get or create a Histogram."""
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def register_collector(self, collector):
+        """
+        Add a callable run at every scrape.
+
+        The collector returns (or yields) ``(name, kind, documentation, samples)``
+        families, where ``samples`` is a list of ``(labels dict, value)``. A
+        failing collector is logged and skipped; it never breaks the export.
+
+        Args:
+            collector (callable): Takes no arguments.
+        """
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def render(self):
+        """
+        Export every family in OpenMetrics text format.
+
+        Returns:
+            str: The exposition, terminated by ``# EOF``.
+        """
+        lines = []
+
+        def family(name, kind, documentation, samples):
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'# HELP {name} {_escape(documentation)}')
+            for sample_name, labels, value in samples:
+                lines.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+            collectors = list(self._collectors)
+
+        for metric in metrics:
+            family(metric.name, metric.kind, metric.documentation, metric.samples())
+
+        for collector in collectors:
+            try:
+                for name, kind, documentation, samples in collector():
+                    suffix = '_total' if kind == 'counter' else ''
+                    family(name, kind, documentation, [
+                        (name + suffix, sorted(labels.items()), value) for labels, value in samples])
+            except Exception as e:
+                logger.warning(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def get_metrics_registry():
+    """
+    Get the process-wide metrics registry.
+
+    Returns:
+        MetricsRegistry: The shared registry.
+    """
+    return REGISTRY
+
+
+def instrument(counter, histogram=None, outcome=None, **labels):
+    """
+    Decorator counting a function's calls by outcome and, optionally, timing them.
+
+    Args:
+        counter (Counter): Incremented once per call; needs an ``outcome`` label
+            besides ``labels``.
+        histogram (Histogram, optional): Observes the call's duration with ``labels``.
+        outcome (callable, optional): Maps the return value to an outcome
+            (default ``'ok'``). A raised exception counts as ``'error'``.
+        **labels: Fixed label values.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result_outcome = 'error'
+            try:
+                result = func(*args, **kwargs)
+                result_outcome = outcome(result) if outcome else 'ok'
+                return result
+            finally:
+                if histogram is not None:
+                    histogram.observe(time.perf_counter() - start, **labels)
+                counter.inc(outcome=result_outcome, **labels)
+        return wrapper
+    return decorator
+
+
+# --- SQL statement counting ---
+
+# Counters of the storage calls in progress in this context (nested calls each count)
+_query_counters = ContextVar('metrics_query_counters', default=())
+_listening = False
+_listening_lock = threading.Lock()
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    """SQLAlchemy ``before_cursor_execute`` hook: bump every active counter."""
+    for counter in _query_counters.get():
+        counter[0] += 1
+
+
+def _listen_for_statements():
+    """Install the statement hook on all engines, once per process."""
+    global _listening
+    if _listening:
+        return
+    with _listening_lock:
+        if not _listening:
+            from sqlalchemy import event
+            from sqlalchemy.engine import Engine
+            event.listen(Engine, 'before_cursor_execute', _count_statement)
+            _listening = True
+
+
+@contextmanager
+def count_queries():
+    """
+    Count the SQL statements executed in the ``with`` block on this thread.
+
+    Yields:
+        list: One-element list holding the running count.
+    """
+    _listen_for_statements()
+    counter = [0]
+    token = _query_counters.set(_query_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _query_counters.reset(token)
+
+
+# --- Application metrics ---
+
+LLM_REQUESTS = REGISTRY.counter(
+    'llm_requests', 'LLM completions by prompt type, backend and outcome', ('task', 'backend', 'outcome'))
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    'llm_request_seconds', 'LLM completion latency (streams: until the stream ends)', ('task', 'backend'))
+LLM_QUEUE_SECONDS = REGISTRY.histogram(
+    'llm_queue_seconds', 'Time waiting for an LLM scheduler slot', ('task', 'lane'))
+LLM_TOKENS = REGISTRY.counter(
+    'llm_tokens', 'LLM tokens by prompt type, backend and direction', ('task', 'backend', 'direction'))
+
+STORAGE_SECONDS = REGISTRY.histogram(
+    'storage_operation_seconds', 'Topic load/save latency', ('operation',))
+STORAGE_QUERIES = REGISTRY.histogram(
+    'storage_operation_queries', 'SQL statements per topic load/save', ('operation',),
+    buckets=QUERY_COUNT_BUCKETS)
+
+TTS_CHUNK_SECONDS = REGISTRY.histogram(
+    'tts_chunk_seconds', 'Text-to-speech latency per synthesized chunk', ('operation',))
+TTS_REQUESTS = REGISTRY.counter(
+    'tts_requests', 'Audio generations by operation and outcome', ('operation', 'outcome'))
+STT_SECONDS = REGISTRY.histogram('stt_seconds', 'Speech-to-text latency per transcription')
+STT_REQUESTS = REGISTRY.counter('stt_requests', 'Transcriptions by outcome', ('outcome',))
+
+SANDBOX_SECONDS = REGISTRY.histogram(
+    'sandbox_operation_seconds', 'Sandbox code runs and dependency installs', ('operation',))
+SANDBOX_OPERATIONS = REGISTRY.counter(
+    'sandbox_operations', 'Sandbox operations by outcome', ('operation', 'outcome'))
+
+DCS_SYNC_SECONDS = REGISTRY.histogram('dcs_sync_seconds', 'Duration of one DCS sync pass')
+DCS_SYNCS = REGISTRY.counter('dcs_syncs', 'DCS sync passes by outcome', ('outcome',))
+DCS_SYNC_ITEMS = REGISTRY.counter('dcs_sync_items', 'Rows sent to the DCS')
+DCS_LAST_SUCCESS = REGISTRY.gauge(
+    'dcs_last_success_timestamp_seconds', 'Unix time of the last successful DCS sync')
+
+
+def _component_stats():
+    """Collector exporting the counters kept by the scheduler, caches and background writers."""
+    from app.common.llm_scheduler import get_llm_scheduler
+    from app.common.storage import get_topic_cache
+    from app.common.telemetry_writer import get_telemetry_writer
+    from app.common.summary_worker import get_summary_worker
+
+    scheduler = get_llm_scheduler().stats()
+    yield ('llm_scheduler_active', 'gauge', 'LLM calls holding a scheduler slot', [({}, scheduler['active'])])
+    yield ('llm_scheduler_queued', 'gauge', 'LLM calls waiting for a scheduler slot',
+           [({'lane': lane}, metrics['queued']) for lane, metrics in scheduler['lanes'].items()])
+
+    writer = get_telemetry_writer().stats()
+    yield ('telemetry_writer_pending', 'gauge', 'Telemetry rows waiting to be written', [({}, writer['pending'])])
+    yield ('telemetry_writer_rows', 'counter', 'Telemetry rows by outcome',
+           [({'outcome': outcome}, writer[outcome]) for outcome in ('written', 'dropped', 'failed')])
+
+    topics = get_topic_cache().stats()
+    yield ('topic_cache_lookups', 'counter', 'Topic loads by cache outcome',
+           [({'outcome': outcome}, topics[outcome]) for outcome in ('request_hits', 'process_hits', 'misses')])
+
+    summaries = get_summary_worker().stats()
+    yield ('summary_worker_pending', 'gauge', 'Chat summaries waiting for the background worker',
+           [({}, summaries['pending'])])
+    yield ('summary_worker_jobs', 'counter', 'Chat summary jobs by outcome',
+           [({'outcome': outcome}, summaries[outcome]) for outcome in ('stored', 'deleted', 'failed', 'dropped')])
+
+
+REGISTRY.register_collector(_component_stats)
@@ -12,6 +12,7 @@ import hashlib
 import time
 import stat
 from config import Config
+from app.common import metrics, tracing
 
 logger = logging.getLogger(__name__)
 
@@ -59,11 +60,12 @@ def _validate_python_executable(path):
     if not path or not os.path.isabs(path) or not os.path.isfile(path):
         return False
     try:
-        result = subprocess.run(
-            [path, "--version"],
-            capture_output=True,
-            timeout=5
-        )
+        with tracing.span('subprocess python --version', executable=path):
+            result = subprocess.run(
+                [path, "--version"],
+                capture_output=True,
+                timeout=5
+            )
         return result.returncode == 0
     except Exception:
         return False
@@ -331,6 +333,7 @@ class Sandbox:
         except Exception as e:
              logger.error(f"Failed to create venv: {e}")
 
+    @metrics.instrument(metrics.SANDBOX_OPERATIONS, metrics.SANDBOX_SECONDS, operation='install_deps')
     def install_deps(self, dependencies):
         """Installs dependencies in the sandbox."""
         if not dependencies:
@@ -347,21 +350,24 @@ class Sandbox:
             # Use python -m pip for cross-platform reliability
             # Capture output so we can log it on failure
             # Use Popen to stream output so we don't look stuck
-            process = subprocess.Popen(
-                [self.python_executable, "-m", "pip", "install"] + dependencies,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                encoding='utf-8',
-                errors='replace'  # Crucial for Windows to avoid crashing on weird chars
-            )
-
-            # Read line by line
-            for line in process.stdout:
-                if line.strip():
-                    logger.info(f"pip: {line.strip()}")
-
-            process.wait()
+            with tracing.span('subprocess pip install', sandbox=self.id,
+                              packages=' '.join(dependencies)) as pip_span:
+                process = subprocess.Popen(
+                    [self.python_executable, "-m", "pip", "install"] + dependencies,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    encoding='utf-8',
+                    errors='replace'  # Crucial for Windows to avoid crashing on weird chars
+                )
+
+                # Read line by line
+                for line in process.stdout:
+                    if line.strip():
+                        logger.info(f"pip: {line.strip()}")
+
+                process.wait()
+                pip_span.set_attribute('process.exit_code', process.returncode)
 
             if process.returncode != 0:
                 raise subprocess.CalledProcessError(process.returncode, process.args)
@@ -372,6 +378,8 @@ class Sandbox:
             # Raise a clear error that will be caught by the route handler
             raise Exception(f"Dependency installation failed: {error_msg}")
 
+    @metrics.instrument(metrics.SANDBOX_OPERATIONS, metrics.SANDBOX_SECONDS,
+                        outcome=lambda result: 'error' if result['error'] else 'ok', operation='run_code')
     def run_code(self, code):
         """Runs the provided code in the sandbox."""
         logger.info(f"Sandbox {self.id}: Preparing to run code...")
@@ -467,13 +475,15 @@ except ImportError:
                     "images": []
                 }
 
-            result = subprocess.run(
-                [python_path, "script.py"],
-                cwd=self.path,
-                capture_output=True,
-                check=False,
-                timeout=600
-            )
+            with tracing.span('subprocess run_code', sandbox=self.id) as run_span:
+                result = subprocess.run(
+                    [python_path, "script.py"],
+                    cwd=self.path,
+                    capture_output=True,
+                    check=False,
+                    timeout=600
+                )
+                run_span.set_attribute('process.exit_code', result.returncode)
             output = result.stdout.decode()
             error = result.stderr.decode()
             logger.info("Execution completed.")
@@ -155,7 +155,24 @@ function initChatPopup(config) {
         chatHistory.scrollTop = chatHistory.scrollHeight;
 
         try {
-            const response = await fetch(chatConfig.urls.chat, {
+            const md = window.markdownit({
+                html: false
+            });
+            const showAnswer = (answer) => {
+                const renderedAnswer = md.render(answer || '');
+                const safeAnswer = window.DOMPurify
+                    ? window.DOMPurify.sanitize(renderedAnswer)
+                    : renderedAnswer;
+
+                // Remove skeleton class and show actual content
+                tutorMessage.classList.remove('skeleton-message');
+                tutorMessage.innerHTML = `<strong>Tutor:</strong> ${safeAnswer}`;
+                chatHistory.scrollTop = chatHistory.scrollHeight;
+            };
+
+            const streamUrl = chatConfig.urls.chat_stream;
+            const useStream = Boolean(streamUrl && window.readEventStream);
+            const response = await fetch(useStream ? streamUrl : chatConfig.urls.chat, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -168,19 +185,25 @@ function initChatPopup(config) {
             if (!response.ok) {
                 throw new Error(`Chat request failed with status ${response.status} ${response.statusText}`);
             }
-            const data = await response.json();
-            const md = window.markdownit({
-                html: false
-            });
-            const renderedAnswer = md.render(data.answer || '');
-            const safeAnswer = window.DOMPurify
-                ? window.DOMPurify.sanitize(renderedAnswer)
-                : renderedAnswer;
 
-            // Remove skeleton class and show actual content
-            tutorMessage.classList.remove('skeleton-message');
-            tutorMessage.innerHTML = `<strong>Tutor:</strong> ${safeAnswer}`;
-            chatHistory.scrollTop = chatHistory.scrollHeight;
+            if (useStream) {
+                let answer = '';
+                let streamError = null;
+                await readEventStream(response, (event, data) => {
+                    if (event === 'message') {
+                        answer += data.delta;
+                        showAnswer(answer);
+                    } else if (event === 'done') {
+                        showAnswer(data.answer);
+                    } else if (event === 'error') {
+                        streamError = new Error(data.error);
+                    }
+                });
+                if (streamError) throw streamError;
+            } else {
+                const data = await response.json();
+                showAnswer(data.answer);
+            }
         } catch (error) {
             tutorMessage.classList.remove('skeleton-message');
             tutorMessage.innerHTML = '<strong>Tutor:</strong> Sorry, something went wrong.';
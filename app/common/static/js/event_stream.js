@@ -0,0 +1,36 @@
+/**
+ * Minimal Server-Sent Events reader for fetch() responses.
+ *
+ * EventSource only supports GET, so POST endpoints that stream
+ * (chat send / popup chat) are consumed through fetch and parsed here.
+ *
+ * @param {Response} response - A fetch response with a text/event-stream body.
+ * @param {function(string, object)} onEvent - Called with (eventName, parsedData) per frame.
+ */
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let separator;
+        while ((separator = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, separator);
+            buffer = buffer.slice(separator + 2);
+
+            let event = 'message';
+            const data = [];
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data.push(line.slice(5).trim());
+            });
+            if (data.length) onEvent(event, JSON.parse(data.join('\n')));
+        }
+    }
+}
+
+window.readEventStream = readEventStream;
@@ -1,12 +1,20 @@
 from app.core.extensions import db
-from app.core.models import Topic, ChapterMode, QuizMode, FlashcardMode, Feedback
+from app.core.models import Topic, ChapterMode, ChatMode, ChatMessage, QuizMode, FlashcardMode, Feedback
+import copy
 import logging
 import datetime
+import functools
 import os
-import base64
+import threading
+from collections import OrderedDict
 
+from flask import g, has_app_context
 from flask_login import current_user
+from sqlalchemy import case, func, or_, select, update
 from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.exc import StaleDataError
+from app.common import metrics
 from app.core.exceptions import (
     AuthenticationError,
     DatabaseOperationError,
@@ -16,6 +24,21 @@ from app.core.exceptions import (
 )
 
 
+def _instrumented(operation):
+    """Decorator recording a storage call's latency and SQL statement count in the metrics."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.STORAGE_SECONDS.time(operation=operation), metrics.count_queries() as queries:
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    metrics.STORAGE_QUERIES.observe(queries[0], operation=operation)
+        return wrapper
+    return decorator
+
+
+@_instrumented('save_topic')
 def save_topic(topic_name, data):
     """
     Save topic data to PostgreSQL database.
@@ -24,6 +47,21 @@ def save_topic(topic_name, data):
     - Topic metadata (plan, name)
     - Chapter, Quiz, Flashcard, and Chat modes
 
+    Sections missing from ``data`` are left untouched, so a dictionary returned by
+    a projected ``load_topic`` can be saved back safely; likewise ``{}`` step
+    placeholders keep the stored step at that position. To clear a section, pass
+    it explicitly empty (e.g. ``flashcard_mode=[]`` or ``quiz_mode=None``).
+
+    If ``data`` came from ``load_topic`` in this request, only the columns that
+    changed since it was loaded are written (see ``_diff_topic``); structural
+    changes (plan, steps or flashcards added/removed, quiz created/removed) fall
+    back to the full reconcile (``_reconcile_topic``).
+
+    Topics, steps, quizzes and chat sessions carry a version (see
+    ``VersionMixin``). If another request wrote one of the rows in between,
+    the write is retried: a change set is re-applied to the current rows,
+    and the full reconcile is simply run again (see ``_retry_stale``).
+
     Special Logic:
     - Detects step reordering in Chapter Mode. To prevent 'UniqueViolation' errors on the 'step_index' constraint,
       it temporarily shifts existing steps to negative indices before assigning their new correct positions.
@@ -39,19 +77,88 @@ def save_topic(topic_name, data):
                 debug_info={"topic_name": topic_name}
             )
 
-        topic = Topic.query.filter_by(name=topic_name, user_id=current_user.userid).first()
-        if not topic:
-            topic = Topic(name=topic_name, user_id=current_user.userid)
-            db.session.add(topic)
-            db.session.flush()
+        snapshot = _get_snapshot(topic_name, data)
+        changes = _diff_topic(data, snapshot[1]) if snapshot else None
+        if changes is not None:
+            topic_id, original, versions = snapshot
+
+            def write(attempt):
+                if attempt:
+                    return _apply_topic_changes(topic_id, *_rebase_changes(topic_id, changes, original, versions))
+                return _apply_topic_changes(topic_id, changes, versions)
+
+            versions = _retry_stale('save_topic', write)
+            _invalidate_topic(topic_name)
+            _remember_snapshot(topic_name, topic_id, data, versions)
+            return
+
+        _forget_snapshot(data)
+        _retry_stale('save_topic', lambda attempt: _reconcile_topic(topic_name, data))
+        _invalidate_topic(topic_name)
+
+    except AuthenticationError:
+        db.session.rollback()
+        raise  # Re-raise custom exceptions
+    except (ModelValidationError, DatabaseIntegrityError):
+        db.session.rollback()
+        raise  # Re-raise validation errors
+    except IntegrityError as e:
+        db.session.rollback()
+        logger.error(
+            f"Database integrity error saving topic {topic_name}: {e}")
+        raise DatabaseIntegrityError(
+            f"Topic '{topic_name}' may already exist or violates database constraints",
+            error_code="DB100",
+            debug_info={
+                "topic_name": topic_name,
+                "original_error": str(e)})
+    except OperationalError as e:
+        db.session.rollback()
+        logger.error(f"Database connection error saving topic: {e}")
+        raise DatabaseConnectionError(
+            "Unable to connect to database",
+            error_code="DB101",
+            debug_info={"operation": "save_topic", "original_error": str(e)}
+        )
+    except Exception as e:
+        db.session.rollback()
+        logger.error(
+            f"Unexpected error saving topic {topic_name}: {e}",
+            exc_info=True)
+        raise DatabaseOperationError(
+            f"Failed to save topic: {str(e)}",
+            operation="save_topic",
+            error_code="DB102",
+            debug_info={"topic_name": topic_name}
+        )
+
+
+def _reconcile_topic(topic_name, data):
+    """
+    Full save for save_topic: match the stored rows against ``data`` and
+    insert, update or delete them (not committed).
+
+    The rows are read here, so a ``StaleDataError`` at flush means another
+    request wrote one of them in between; save_topic then runs this again.
+    """
+    logger = logging.getLogger(__name__)
+
+    topic = Topic.query.filter_by(name=topic_name, user_id=current_user.userid).first()
+    if not topic:
+        topic = Topic(name=topic_name, user_id=current_user.userid)
+        db.session.add(topic)
+        db.session.flush()
 
-        # Update topic fields
-        topic.study_plan = data.get('plan', [])
+    # Update topic fields. Sections absent from ``data`` (e.g. not requested
+    # from load_topic) are left as stored.
+    if 'plan' in data:
+        topic.study_plan = data['plan'] or []
 
-        # Explicitly update modified_at when saving
-        topic.modified_at = datetime.datetime.utcnow()
+    # Explicitly update modified_at when saving
+    topic.modified_at = datetime.datetime.utcnow()
 
-        # --- Handle Chapter Mode (Steps) ---
+    # --- Handle Chapter Mode (Steps) ---
+    if 'chapter_mode' in data or 'steps' in data:
         incoming_msg_data = data.get('chapter_mode', [])
         # Support legacy 'steps' key if 'chapter_mode' is missing
         if not incoming_msg_data:
@@ -66,6 +173,9 @@ def save_topic(topic_name, data):
         # But here we are iterating incoming data.
 
         processed_step_ids = set()
+        saved_step_refs = []
+        # (step, messages) popup chats to write once new steps have ids
+        step_popups = []
 
         # Check for reordering to avoid UniqueViolation
         reorder_needed = False
@@ -88,7 +198,17 @@ def save_topic(topic_name, data):
                 s.step_index = -1 * (s.step_index + 1)
             db.session.flush()
 
-        for step_data in incoming_msg_data:
+        for position, step_data in enumerate(incoming_msg_data):
+            if not step_data:
+                # Placeholder ({}) for a step that was not loaded or not yet
+                # generated: keep whatever is stored at this position
+                kept = existing_steps_by_index.get(position)
+                if kept:
+                    if reorder_needed:
+                        kept.step_index = position
+                    processed_step_ids.add(kept.id)
+                continue
+
             step_index = step_data.get('step_index')
             step_id = step_data.get('id')
 
@@ -134,8 +254,6 @@ def save_topic(topic_name, data):
                 if 'score' in step_data:
                     step.score = step_data['score']
 
-                step.popup_chat_history = step_data.get('popup_chat_history', step.popup_chat_history)
-
                 # Only update time_spent if valid positive integer
                 inc_time = step_data.get('time_spent')
                 if isinstance(inc_time, int) and inc_time >= 0:
@@ -145,7 +263,8 @@ def save_topic(topic_name, data):
                 if step_index is not None:
                      step.step_index = step_index
 
-                step.podcast_audio_path = step_data.get('podcast_audio_path', step.podcast_audio_path)
+                if 'podcast_audio_path' in step_data:
+                    step.podcast_audio_path = step_data['podcast_audio_path']
 
                 processed_step_ids.add(step.id)
             else:
@@ -166,59 +285,66 @@ def save_topic(topic_name, data):
                     questions=step_data.get('questions'),
                     user_answers=step_data.get('user_answers'),
                     score=step_data.get('score'),
-                    popup_chat_history=step_data.get('popup_chat_history'),
                     time_spent=step_data.get('time_spent', 0),
                     podcast_audio_path=step_data.get('podcast_audio_path')
                 )
                 db.session.add(step)
 
-            # --- Handle Feedback (Moved to dedicated table) ---
-            # content_reference for this step: topic_{id}_step_{index}
-            # Note: Topic ID might not be available if topic is new and flush not called?
-            # We need to ensure topic is flushed.
-            db.session.flush()
-            content_ref = f"topic_{topic.id}_step_{step.step_index}"
-
-            # Delete existing feedback for this step/user to overwrite with current state
-            Feedback.query.filter_by(
-                user_id=current_user.userid,
-                content_reference=content_ref
-            ).delete()
-
-
+            if 'popup_chat_history' in step_data:
+                step_popups.append((step, step_data['popup_chat_history']))
 
-        # Delete removed steps
-        for s in topic.chapter_mode:
-            if s.id not in processed_step_ids and s not in db.session.new:
-                db.session.delete(s)
-
-        # --- Handle QuizMode ---
-        # "quiz" key in JSON (legacy), "quiz_mode" is new standard
+            # --- Handle Feedback (Moved to dedicated table) ---
+            # Existing feedback for saved steps is overwritten with the current state
+            saved_step_refs.append(step_feedback_reference(topic.id, step.step_index))
+
+        if saved_step_refs:
+            # One bulk DELETE for all saved steps (uses ix_feedback_user_reference)
+            Feedback.query.filter(
+                Feedback.user_id == current_user.userid,
+                Feedback.content_reference.in_(saved_step_refs)
+            ).delete(synchronize_session=False)
+
+        # Delete removed steps, after their popup chats
+        removed_steps = [s for s in topic.chapter_mode
+                         if s.id not in processed_step_ids and s not in db.session.new]
+        if removed_steps:
+            ChatMessage.query.filter(
+                ChatMessage.step_id.in_([s.id for s in removed_steps])
+            ).delete(synchronize_session=False)
+        for s in removed_steps:
+            db.session.delete(s)
+
+        if step_popups:
+            db.session.flush()  # Assign ids to new steps
+            for step, messages in step_popups:
+                _write_thread(topic.id, ChatMessage.STEP, step.id, messages)
+
+    # --- Handle QuizMode ---
+    # "quiz" key in JSON (legacy), "quiz_mode" is new standard
+    if 'quiz_mode' in data or 'quiz' in data:
         q_data = data.get('quiz_mode') or data.get('quiz')
+        existing_quiz = topic.quiz_mode
         if q_data:
-             if True: # preserving indentation block
-                 # Check existing quizzes
-                 existing_quiz = topic.quiz_mode if topic.quiz_mode else None
-
-                 if existing_quiz:
-                     existing_quiz.questions = q_data.get('questions')
-                     existing_quiz.score = q_data.get('score')
-                     existing_quiz.result = data.get('last_quiz_result')
-                     existing_quiz.time_spent = q_data.get('time_spent', 0)
-                 else:
-                     quiz = QuizMode(
-                         user_id=current_user.userid,
-                         topic_id=topic.id,
-                         questions=q_data.get('questions'),
-                         score=q_data.get('score'),
-                         result=data.get('last_quiz_result'),
-                         time_spent=q_data.get('time_spent', 0)
-                     )
-                     db.session.add(quiz)
-        elif topic.quiz_mode:
-             db.session.delete(topic.quiz_mode)
-
-        # --- Handle Flashcards ---
+            if existing_quiz:
+                existing_quiz.questions = q_data.get('questions')
+                existing_quiz.score = q_data.get('score')
+                existing_quiz.result = data.get('last_quiz_result', existing_quiz.result)
+                existing_quiz.time_spent = q_data.get('time_spent', 0)
+            else:
+                quiz = QuizMode(
+                    user_id=current_user.userid,
+                    topic_id=topic.id,
+                    questions=q_data.get('questions'),
+                    score=q_data.get('score'),
+                    result=data.get('last_quiz_result'),
+                    time_spent=q_data.get('time_spent', 0)
+                )
+                db.session.add(quiz)
+        elif existing_quiz:
+            db.session.delete(existing_quiz)
+
+    # --- Handle Flashcards ---
+    if 'flashcard_mode' in data or 'flashcards' in data:
         incoming_cards = data.get('flashcard_mode') or data.get('flashcards') or []
 
         # Maps for ID-based and Term-based lookup
@@ -273,72 +399,529 @@ def save_topic(topic_name, data):
             if c.id not in processed_ids and c not in db.session.new:
                 db.session.delete(c)
 
-        # --- Handle ChatMode ---
-        # Ensure we save history and popup_history if they are in the data
-        if 'chat_history' in data or 'popup_chat_history' in data:
-            from app.core.models import ChatMode
-            if not topic.chat_mode:
-                chat_session = ChatMode(user_id=current_user.userid, topic_id=topic.id)
-                db.session.add(chat_session)
-            else:
-                chat_session = topic.chat_mode
-
-            from sqlalchemy.orm.attributes import flag_modified
-            if 'chat_history' in data:
-                chat_session.history = data['chat_history']
-                flag_modified(chat_session, 'history')
-            if 'chat_history_summary' in data:
-                chat_session.history_summary = data['chat_history_summary']
-                flag_modified(chat_session, 'history_summary')
-            if 'popup_chat_history' in data:
-                chat_session.popup_chat_history = data['popup_chat_history']
-                flag_modified(chat_session, 'popup_chat_history')
-            if 'chat_time_spent' in data:
-                chat_session.time_spent = data['chat_time_spent']
-
-            db.session.add(chat_session)
+    # --- Handle ChatMode ---
+    # Ensure we save history and popup_history if they are in the data
+    if 'chat_history' in data or 'popup_chat_history' in data:
+        chat_session = _ensure_chat_session(topic.id)
+        if 'chat_history' in data:
+            _write_thread(topic.id, ChatMessage.CHAT, None, data['chat_history'],
+                          summaries=data.get('chat_history_summary'))
+        if 'popup_chat_history' in data:
+            _write_thread(topic.id, ChatMessage.POPUP, None, data['popup_chat_history'])
+        if 'chat_time_spent' in data:
+            chat_session.time_spent = data['chat_time_spent']
 
-        db.session.commit()
 
-    except AuthenticationError:
-        db.session.rollback()
-        raise  # Re-raise custom exceptions
-    except (ModelValidationError, DatabaseIntegrityError):
-        db.session.rollback()
-        raise  # Re-raise validation errors
+# Times save_topic and save_chat_history re-run a write that lost a version race
+STALE_DATA_RETRIES = 3
+
+# Step dict keys compared as-is by _diff_step (same name as the ChapterMode column)
+STEP_DIFF_KEYS = ('questions', 'user_answers', 'score', 'podcast_audio_path')
+
+# Keys save_topic understands; one present in a dict but not in its snapshot
+# means the caller added a section, which needs the full save
+SECTION_KEYS = frozenset({
+    'plan', 'chapter_mode', 'steps', 'quiz_mode', 'quiz', 'last_quiz_result',
+    'flashcard_mode', 'flashcards', 'chat_history', 'chat_history_summary',
+    'popup_chat_history', 'chat_time_spent'
+})
+
+
+def _remember_snapshot(topic_name, topic_id, data, versions):
+    """
+    Keep a deep copy of a loaded topic dict for the rest of the request.
+
+    Args:
+        versions (dict): Row versions the dict was read at (see ``_new_versions``).
+    """
+    if not has_app_context():
+        return
+    snapshots = g.setdefault('_topic_snapshots', {})
+    # Holding ``data`` itself keeps its id() from being reused by another dict
+    snapshots[id(data)] = (data, topic_name, topic_id, copy.deepcopy(data), _copy_versions(versions))
+
+
+def _forget_snapshot(data):
+    """Drop the snapshot of ``data`` once its shape may no longer match the database."""
+    if has_app_context():
+        g.get('_topic_snapshots', {}).pop(id(data), None)
+
+
+def _get_snapshot(topic_name, data):
+    """
+    Find the load_topic snapshot of ``data``.
+
+    Returns:
+        tuple | None: (topic_id, snapshot dict, row versions), or None if
+        ``data`` was not loaded in this request.
+    """
+    if not has_app_context():
+        return None
+    entry = g.get('_topic_snapshots', {}).get(id(data))
+    if not entry or entry[0] is not data or entry[1] != topic_name:
+        return None
+    return entry[2], entry[3], entry[4]
+
+
+def _diff_step(step, original):
+    """
+    Column changes for one step, following the update rules of the full save.
+
+    Returns:
+        dict | None: Changed columns, or None if the step was added, removed,
+        moved or retitled.
+    """
+    if not step and not original:
+        return {}
+    if not step or not original:
+        return None
+    if step.get('id') != original.get('id') \
+            or step.get('step_index', original.get('step_index')) != original.get('step_index'):
+        return None
+    if step.get('title') and step['title'] != original.get('title'):
+        return None
+
+    columns = {}
+    content = step.get('teaching_material') or step.get('content')
+    if content and content != (original.get('teaching_material') or original.get('content')):
+        columns['content'] = content
+    for key in STEP_DIFF_KEYS:
+        if key in step and step[key] != original.get(key):
+            columns[key] = step[key]
+    time_spent = step.get('time_spent')
+    if isinstance(time_spent, int) and time_spent >= 0 and time_spent != original.get('time_spent'):
+        columns['time_spent'] = time_spent
+    return columns
+
+
+def _diff_topic(data, snapshot):
+    """
+    Compute the column updates that turn a topic's snapshot into ``data``.
+
+    Returns:
+        dict | None: ``steps`` and ``cards`` ({id: columns}), ``quiz`` and ``chat``
+        columns, ``feedback_steps`` (indices whose stored feedback is replaced)
+        and ``threads`` (chat threads to write, see ``_write_thread``); None if
+        the change is structural and needs the full save.
+    """
+    if any(key in data and key not in snapshot for key in SECTION_KEYS):
+        return None
+    if 'plan' in data and data['plan'] != snapshot['plan']:
+        return None
+
+    changes = {'steps': {}, 'feedback_steps': [], 'cards': {}, 'quiz': {}, 'chat': {}, 'threads': []}
+
+    if 'chapter_mode' in data:
+        steps, originals = data['chapter_mode'] or [], snapshot['chapter_mode']
+        if len(steps) != len(originals):
+            return None
+        for step, original in zip(steps, originals):
+            columns = _diff_step(step, original)
+            if columns is None:
+                return None
+            if columns:
+                changes['steps'][original['id']] = columns
+            popup_changed = 'popup_chat_history' in step \
+                and step['popup_chat_history'] != original.get('popup_chat_history')
+            if popup_changed:
+                changes['threads'].append((
+                    ChatMessage.STEP, original['id'], step['popup_chat_history'], None,
+                    original.get('popup_chat_history')))
+            if columns or popup_changed or step.get('feedback') != original.get('feedback'):
+                # Saving a step replaces its stored feedback, as in the full save
+                changes['feedback_steps'].append(original['step_index'])
+
+    if 'quiz_mode' in data:
+        quiz, original = data['quiz_mode'], snapshot['quiz_mode']
+        if bool(quiz) != bool(original):
+            return None
+        if quiz:
+            for key in ('questions', 'score'):
+                if quiz.get(key) != original.get(key):
+                    changes['quiz'][key] = quiz.get(key)
+            if quiz.get('time_spent', 0) != original.get('time_spent', 0):
+                changes['quiz']['time_spent'] = quiz.get('time_spent', 0)
+    if 'last_quiz_result' in data and data['last_quiz_result'] != snapshot['last_quiz_result']:
+        if not snapshot.get('quiz_mode'):
+            return None
+        changes['quiz']['result'] = data['last_quiz_result']
+
+    if 'flashcard_mode' in data:
+        cards = data['flashcard_mode'] or []
+        originals = {c['id']: c for c in snapshot['flashcard_mode']}
+        if len(cards) != len(originals) or any(c.get('id') not in originals for c in cards):
+            return None
+        for card in cards:
+            original = originals[card['id']]
+            if card.get('term') != original['term']:
+                return None
+            columns = {}
+            if card.get('definition', original['definition']) != original['definition']:
+                columns['definition'] = card['definition']
+            if card.get('time_spent') is not None and card['time_spent'] != original['time_spent']:
+                columns['time_spent'] = card['time_spent']
+            if columns:
+                changes['cards'][card['id']] = columns
+
+    # Chat time is only saved alongside a history, as in the full save
+    if 'chat_history' in data or 'popup_chat_history' in data:
+        if 'chat_time_spent' in data and data['chat_time_spent'] != snapshot.get('chat_time_spent'):
+            changes['chat']['time_spent'] = data['chat_time_spent']
+        if 'chat_history' in data and data['chat_history'] != snapshot['chat_history']:
+            changes['threads'].append((
+                ChatMessage.CHAT, None, data['chat_history'],
+                data.get('chat_history_summary'), snapshot['chat_history']))
+        if 'popup_chat_history' in data and data['popup_chat_history'] != snapshot['popup_chat_history']:
+            changes['threads'].append((
+                ChatMessage.POPUP, None, data['popup_chat_history'], None,
+                snapshot['popup_chat_history']))
+
+    return changes
+
+
+def _new_versions():
+    """Empty row versions of a loaded topic: step id -> version, and the quiz's and chat session's."""
+    return {'steps': {}, 'quiz': None, 'chat': None}
+
+
+def _copy_versions(versions):
+    """Copy of a versions dict from ``_new_versions``."""
+    return dict(versions, steps=dict(versions['steps']))
+
+
+def _update_versioned(model, condition, version, values):
+    """
+    UPDATE the row matching ``condition`` if it is still at ``version``, incrementing it.
+
+    Raises:
+        StaleDataError: The row changed (or was deleted) since it was read.
+    """
+    result = db.session.execute(
+        update(model).where(condition, model.version == version)
+        .values(version=model.version + 1, **values))
+    if result.rowcount != 1:
+        raise StaleDataError(
+            f"UPDATE statement on table '{model.__tablename__}' expected to update 1 row(s); "
+            f"{result.rowcount} were matched.")
+
+
+def _retry_stale(operation, write):
+    """
+    Run ``write(attempt)`` and commit, retrying when a versioned row changed underneath.
+
+    ``write`` gets the attempt number (0 first), so a retry can re-read what
+    it needs; the session is rolled back before each retry.
+
+    Returns:
+        ``write``'s result.
+
+    Raises:
+        StaleDataError: Still conflicting after ``STALE_DATA_RETRIES`` retries.
+    """
+    for attempt in range(STALE_DATA_RETRIES + 1):
+        try:
+            result = write(attempt)
+            db.session.commit()
+            return result
+        except StaleDataError as e:
+            db.session.rollback()
+            if attempt == STALE_DATA_RETRIES:
+                raise
+            logging.getLogger(__name__).info(f"{operation}: concurrent update, retrying ({e})")
+
+
+def _apply_topic_changes(topic_id, changes, versions):
+    """
+    Write a change set from ``_diff_topic``.
+
+    Rows are updated by primary key in bulk; rows with the same changed
+    columns go out as a single executemany. Steps, the quiz and the chat
+    session are only updated at the version in ``versions``; if one has moved
+    on, ``StaleDataError`` is raised (see ``_rebase_changes``).
+
+    Returns:
+        dict: The row versions after the write.
+    """
+    versions = _copy_versions(versions)
+    db.session.execute(
+        update(Topic).where(Topic.id == topic_id).values(modified_at=datetime.datetime.utcnow()))
+
+    if changes['steps']:
+        # Bulk UPDATE by primary key checks and increments version_id_col itself
+        db.session.execute(update(ChapterMode), [
+            dict(columns, id=pk, version=versions['steps'][pk]) for pk, columns in changes['steps'].items()])
+        for pk in changes['steps']:
+            versions['steps'][pk] += 1
+    if changes['cards']:
+        db.session.execute(update(FlashcardMode), [
+            dict(columns, id=pk) for pk, columns in changes['cards'].items()])
+
+    if changes['feedback_steps']:
+        Feedback.query.filter(
+            Feedback.user_id == current_user.userid,
+            Feedback.content_reference.in_(
+                [step_feedback_reference(topic_id, i) for i in changes['feedback_steps']])
+        ).delete(synchronize_session=False)
+
+    if changes['quiz']:
+        # The quiz was loaded (its dict is in the snapshot), so its version is known
+        _update_versioned(QuizMode, QuizMode.topic_id == topic_id, versions['quiz'], changes['quiz'])
+        versions['quiz'] += 1
+
+    if changes['chat']:
+        if versions['chat'] is not None:
+            _update_versioned(ChatMode, ChatMode.topic_id == topic_id, versions['chat'], changes['chat'])
+            versions['chat'] += 1
+        else:
+            # chat_time_spent was not loaded: no version to check against
+            result = db.session.execute(
+                update(ChatMode).where(ChatMode.topic_id == topic_id)
+                .values(version=ChatMode.version + 1, **changes['chat']))
+            if result.rowcount == 0:
+                _ensure_chat_session(topic_id, **changes['chat'])
+    elif any(channel != ChatMessage.STEP for channel, *_ in changes['threads']):
+        _ensure_chat_session(topic_id)
+
+    for channel, step_id, messages, summaries, stored in changes['threads']:
+        _write_thread(topic_id, channel, step_id, messages, summaries=summaries, stored=stored)
+    return versions
+
+
+def _rebase_changes(topic_id, changes, snapshot, versions):
+    """
+    Re-base a change set on the rows as they are now, after a conflicting write.
+
+    The columns this request changed are written again over the current
+    rows. time_spent is an accumulated counter, so it is re-applied as the
+    time this request added since the snapshot, keeping the other request's.
+    Rows deleted in the meantime are dropped from the change set.
+
+    Args:
+        versions (dict): The versions the snapshot was read at.
+
+    Returns:
+        tuple: (changes, versions) for ``_apply_topic_changes``.
+    """
+    def rebased(columns, current_time, original_time):
+        columns = dict(columns)
+        if 'time_spent' in columns:
+            columns['time_spent'] = (current_time or 0) + columns['time_spent'] - (original_time or 0)
+        return columns
+
+    # Thread snapshots may be stale too: let _write_thread read them again
+    rebased_changes = dict(changes, steps={}, quiz={}, chat={},
+                           threads=[thread[:4] + (None,) for thread in changes['threads']])
+    versions = _copy_versions(versions)
+
+    if changes['steps']:
+        originals = {step['id']: step for step in snapshot['chapter_mode'] if step}
+        rows = db.session.execute(
+            select(ChapterMode.id, ChapterMode.version, ChapterMode.time_spent)
+            .where(ChapterMode.id.in_(list(changes['steps'])))).all()
+        for row in rows:
+            rebased_changes['steps'][row.id] = rebased(
+                changes['steps'][row.id], row.time_spent, originals[row.id].get('time_spent'))
+            versions['steps'][row.id] = row.version
+
+    if changes['quiz']:
+        row = db.session.execute(select(QuizMode.version, QuizMode.time_spent)
+                                 .where(QuizMode.topic_id == topic_id)).first()
+        if row:
+            rebased_changes['quiz'] = rebased(
+                changes['quiz'], row.time_spent, snapshot['quiz_mode'].get('time_spent'))
+            versions['quiz'] = row.version
+
+    if changes['chat'] and 'chat_time_spent' in snapshot:
+        row = db.session.execute(select(ChatMode.version, ChatMode.time_spent)
+                                 .where(ChatMode.topic_id == topic_id)).first()
+        if row:
+            rebased_changes['chat'] = rebased(changes['chat'], row.time_spent, snapshot['chat_time_spent'])
+            versions['chat'] = row.version
+    elif changes['chat']:
+        # Written without a version check (see _apply_topic_changes)
+        rebased_changes['chat'] = changes['chat']
+    return rebased_changes, versions
+
+
+# --- Chat messages ---
+# Chat histories are ChatMessage rows, one per message, in threads keyed by
+# (topic, channel, step). Appending costs one indexed lookup and one INSERT,
+# however long the conversation is; stored messages are never rewritten.
+
+def _thread_filter(topic_id, channel, step_id=None):
+    """WHERE clause selecting one chat thread."""
+    return (ChatMessage.topic_id == topic_id) & (ChatMessage.channel == channel) \
+        & (ChatMessage.step_id == step_id)
+
+
+def _summary_entry(message):
+    """``history_summary`` entry for a message: its summary, or the full text until summarised."""
+    return {"role": message.role, "content": message.summary or message.content}
+
+
+def _message_entry(message):
+    """History entry for a message, as the agents and templates expect it."""
+    return {"role": message.role, "content": message.content}
+
+
+def _ensure_chat_session(topic_id, **values):
+    """Get the topic's ChatMode row, creating it (with ``values``) if it does not exist."""
+    chat_session = ChatMode.query.filter_by(topic_id=topic_id).first()
+    if not chat_session:
+        chat_session = ChatMode(user_id=current_user.userid, topic_id=topic_id, **values)
+        db.session.add(chat_session)
+    return chat_session
+
+
+def _append_messages(topic_id, channel, step_id, messages, summaries=None):
+    """
+    Insert messages at the end of a thread.
+
+    Args:
+        summaries (list, optional): Summary text per message (None if not
+            summarised yet); an entry equal to the message is a placeholder.
+
+    Returns:
+        list: The new ChatMessage rows (flushed, so ids are set).
+
+    Raises:
+        StaleDataError: A concurrent append took the same positions; the
+            caller rolls back and retries (see ``_retry_stale``).
+    """
+    if not messages:
+        return []
+
+    # The lookup autoflushes earlier changes, so a failure below comes from these rows
+    last_seq = db.session.execute(
+        select(func.max(ChatMessage.seq)).where(_thread_filter(topic_id, channel, step_id))
+    ).scalar()
+    next_seq = 0 if last_seq is None else last_seq + 1
+
+    rows = []
+    for offset, message in enumerate(messages):
+        summary = summaries[offset] if summaries and offset < len(summaries) else None
+        if isinstance(summary, dict):
+            summary = summary.get('content')
+        rows.append(ChatMessage(
+            user_id=current_user.userid,
+            topic_id=topic_id,
+            step_id=step_id,
+            channel=channel,
+            seq=next_seq + offset,
+            role=message.get('role'),
+            content=message.get('content') or '',
+            summary=summary if summary != message.get('content') else None))
+    db.session.add_all(rows)
+    try:
+        db.session.flush()
     except IntegrityError as e:
-        db.session.rollback()
-        logger.error(
-            f"Database integrity error saving topic {topic_name}: {e}")
-        raise DatabaseIntegrityError(
-            f"Topic '{topic_name}' may already exist or violates database constraints",
-            error_code="DB100",
-            debug_info={
-                "topic_name": topic_name,
-                "original_error": str(e)})
-    except OperationalError as e:
-        db.session.rollback()
-        logger.error(f"Database connection error saving topic: {e}")
-        raise DatabaseConnectionError(
-            "Unable to connect to database",
-            error_code="DB101",
-            debug_info={"operation": "save_topic", "original_error": str(e)}
-        )
-    except Exception as e:
-        db.session.rollback()
-        logger.error(
-            f"Unexpected error saving topic {topic_name}: {e}",
-            exc_info=True)
-        raise DatabaseOperationError(
-            f"Failed to save topic: {str(e)}",
-            operation="save_topic",
-            error_code="DB102",
-            debug_info={"topic_name": topic_name}
-        )
+        # A concurrent append (second tab, /send racing /send/stream) took these
+        # positions first (unique thread indexes); the caller's retry re-reads the end
+        raise StaleDataError(
+            f"Chat thread ({topic_id}, {channel}, {step_id}) appended concurrently at seq {next_seq}") from e
+    return rows
+
+
+def _write_thread(topic_id, channel, step_id, messages, summaries=None, stored=None):
+    """
+    Make a thread hold ``messages``.
+
+    If the stored thread is a prefix of ``messages`` only the new tail is
+    inserted (stored rows and their summaries are kept); any other edit
+    replaces the thread.
+
+    Args:
+        summaries (list, optional): ``history_summary`` aligned with ``messages``.
+        stored (list, optional): The thread as last loaded, to skip reading it.
+    """
+    def stored_form(history):
+        return [(m.get('role'), m.get('content') or '') for m in history]
+
+    messages = list(messages or [])
+    if stored is None:
+        stored = [_message_entry(m) for m in ChatMessage.query.options(
+            load_only(ChatMessage.role, ChatMessage.content)
+        ).filter(_thread_filter(topic_id, channel, step_id)).order_by(ChatMessage.seq)]
+
+    kept = len(stored)
+    if stored_form(messages[:kept]) != stored_form(stored):
+        ChatMessage.query.filter(
+            _thread_filter(topic_id, channel, step_id)).delete(synchronize_session=False)
+        kept = 0
+    _append_messages(topic_id, channel, step_id, messages[kept:],
+                     summaries=summaries[kept:] if summaries else None)
+
+
+def _load_threads(topic_id, channels, step_ids=()):
+    """
+    Read several threads of a topic in one query.
+
+    Returns:
+        dict: (channel, step_id) -> list of ChatMessage rows in order.
+    """
+    conditions = [(ChatMessage.channel == channel) & ChatMessage.step_id.is_(None) for channel in channels]
+    if step_ids:
+        conditions.append((ChatMessage.channel == ChatMessage.STEP) & ChatMessage.step_id.in_(list(step_ids)))
+    threads = {(channel, None): [] for channel in channels}
+    threads.update({(ChatMessage.STEP, step_id): [] for step_id in step_ids})
+    if not conditions:
+        return threads
+
+    rows = ChatMessage.query.options(
+        load_only(ChatMessage.channel, ChatMessage.step_id, ChatMessage.role,
+                  ChatMessage.content, ChatMessage.summary)
+    ).filter(ChatMessage.topic_id == topic_id, or_(*conditions)).order_by(ChatMessage.seq)
+    for message in rows:
+        threads[(message.channel, message.step_id)].append(message)
+    return threads
+
+
+def load_chat_messages(topic_name, channel=ChatMessage.CHAT, step_index=None, before=None, limit=50):
+    """
+    Read one page of a chat thread, newest page first.
+
+    Args:
+        topic_name (str): Topic name.
+        channel (str): ``ChatMessage.CHAT``, ``POPUP`` or ``STEP``.
+        step_index (int, optional): Chapter step, for the ``STEP`` channel.
+        before (int, optional): Only messages with a lower ``seq`` (the cursor
+            from the previous page); None for the latest messages.
+        limit (int): Page size.
+
+    Returns:
+        dict: ``messages`` (oldest first, each with ``seq``, ``role`` and
+        ``content``) and ``next_before``, the cursor for older messages or None.
+    """
+    if not current_user.is_authenticated:
+        return {"messages": [], "next_before": None}
+
+    topic_id = _topic_id_subquery(topic_name)
+    step_id = None
+    if channel == ChatMessage.STEP:
+        step_id = select(ChapterMode.id).where(
+            ChapterMode.topic_id == topic_id,
+            ChapterMode.step_index == step_index).scalar_subquery()
+
+    query = select(ChatMessage.seq, ChatMessage.role, ChatMessage.content).where(
+        _thread_filter(topic_id, channel, step_id))
+    if before is not None:
+        query = query.where(ChatMessage.seq < before)
+    # One extra row tells whether an older page exists
+    rows = db.session.execute(query.order_by(ChatMessage.seq.desc()).limit(limit + 1)).all()
+
+    page = rows[:limit]
+    return {
+        "messages": [{"seq": r.seq, "role": r.role, "content": r.content} for r in reversed(page)],
+        "next_before": page[-1].seq if len(rows) > limit else None,
+    }
+
 
 def save_chat_history(topic_name, history, history_summary=None, time_spent=0, popup_history=None):
     """
     Save chat history and optional summary for a topic.
+
+    Messages already stored are kept as they are; new ones are appended (see
+    ``_write_thread``). Routes append turns with ``append_chat_messages``.
     """
     logger = logging.getLogger(__name__)
 
@@ -350,39 +933,23 @@ def save_chat_history(topic_name, history, history_summary=None, time_spent=0, p
                 debug_info={"topic_name": topic_name}
             )
 
-        topic = Topic.query.filter_by(name=topic_name, user_id=current_user.userid).first()
-        if not topic:
-            topic = Topic(name=topic_name, user_id=current_user.userid)
-            db.session.add(topic)
-            db.session.flush()  # Ensure ID exists
-
-        from app.core.models import ChatMode
+        def write(attempt):
+            topic = Topic.query.filter_by(name=topic_name, user_id=current_user.userid).first()
+            if not topic:
+                topic = Topic(name=topic_name, user_id=current_user.userid)
+                db.session.add(topic)
+                db.session.flush()  # Ensure ID exists
 
-        if not topic.chat_mode:
-            chat_session = ChatMode(user_id=current_user.userid, topic_id=topic.id, history=[])
-            db.session.add(chat_session)
-        else:
-            chat_session = topic.chat_mode
-
-        if time_spent > 0:
-            chat_session.time_spent = (chat_session.time_spent or 0) + time_spent
-
-        # Update history
-        from sqlalchemy.orm.attributes import flag_modified
-        chat_session.history = list(history)
-        flag_modified(chat_session, 'history')
-
-        if history_summary is not None:
-             chat_session.history_summary = list(history_summary)
-             flag_modified(chat_session, 'history_summary')
+            chat_session = _ensure_chat_session(topic.id, time_spent=0)
+            if time_spent > 0:
+                chat_session.time_spent = (chat_session.time_spent or 0) + time_spent
 
-        if popup_history is not None:
-             chat_session.popup_chat_history = list(popup_history)
-             flag_modified(chat_session, 'popup_chat_history')
+            _write_thread(topic.id, ChatMessage.CHAT, None, history, summaries=history_summary)
+            if popup_history is not None:
+                _write_thread(topic.id, ChatMessage.POPUP, None, popup_history)
 
-        db.session.add(chat_session)
-
-        db.session.commit()
+        _retry_stale('save_chat_history', write)
+        _invalidate_topic(topic_name)
 
     except AuthenticationError:
         db.session.rollback()
@@ -409,138 +976,923 @@ def save_chat_history(topic_name, history, history_summary=None, time_spent=0, p
         )
 
 
-def load_topic(topic_name, update_timestamp=False):
+def backfill_chat_summary(user_id, message_id, summary):
     """
-    Load topic data from PostgreSQL and reconstruct dictionary structure.
-    Returns None if topic doesn't exist or user not authenticated (normal behavior for new topics).
+    Store the summary of a chat message.
+
+    Runs outside a request (no ``current_user``), so the owner is passed in.
+    Nothing is stored if the message was deleted (chat cleared) or already
+    has a summary.
+
+    Returns:
+        bool: True if the summary was stored.
+    """
+    try:
+        result = db.session.execute(
+            update(ChatMessage).where(
+                ChatMessage.id == message_id,
+                ChatMessage.user_id == user_id,
+                ChatMessage.summary.is_(None)
+            ).values(summary=summary))
+        db.session.commit()
+        # The message's topic is not known here
+        invalidate_topic_cache(user_id)
+        return result.rowcount > 0
+    except OperationalError as e:
+        db.session.rollback()
+        raise DatabaseConnectionError(
+            "Unable to connect to database",
+            error_code="DB111",
+            debug_info={
+                "operation": "backfill_chat_summary",
+                "original_error": str(e)})
+    except Exception as e:
+        db.session.rollback()
+        raise DatabaseOperationError(
+            f"Failed to backfill chat summary: {str(e)}",
+            operation="backfill_chat_summary",
+            error_code="DB112",
+            debug_info={"message_id": message_id}
+        )
+
+
+def unsummarised_chat_messages(first_id, limit):
     """
-    logging.getLogger(__name__)
+    List Chat mode answers still waiting for a summary, e.g. after their
+    background job was dropped (see ``summary_worker``).
 
-    topic = Topic.query.filter_by(name=topic_name, user_id=current_user.userid).first()
-    if not topic:
+    Runs outside a request, for every user.
+
+    Args:
+        first_id (int): Lowest ``ChatMessage`` id to consider.
+        limit (int): Most messages returned.
+
+    Returns:
+        list: (user_id, message id, content) tuples, oldest first.
+    """
+    return db.session.execute(
+        select(ChatMessage.user_id, ChatMessage.id, ChatMessage.content).where(
+            ChatMessage.id >= first_id,
+            ChatMessage.channel == ChatMessage.CHAT,
+            ChatMessage.role == 'assistant',
+            ChatMessage.summary.is_(None)
+        ).order_by(ChatMessage.id).limit(limit)).all()
+
+
+# --- Atomic single-row updates ---
+# Routes that change one step, card or quiz use these instead of a
+# load_topic -> save_topic round trip. Each is one or two statements against
+# the affected row, so concurrent requests for the same topic (e.g. the
+# update_time beacon racing an assessment) cannot overwrite each other.
+# They increment the row's version, so a save_topic from a dict loaded
+# before them notices the change (see ``_rebase_changes``).
+
+def _topic_id_subquery(topic_name):
+    """Scalar subquery for the current user's topic id."""
+    return select(Topic.id).where(
+        Topic.name == topic_name,
+        Topic.user_id == current_user.userid).scalar_subquery()
+
+
+def _added_time(column, seconds):
+    """SQL expression adding ``seconds`` to a nullable time_spent column."""
+    return func.coalesce(column, 0) + seconds
+
+
+def _atomic_update(operation, topic_name, write):
+    """
+    Run ``write`` for the current user and commit it.
+
+    ``write`` is run again if it raises ``StaleDataError`` (e.g. a chat append
+    that lost a race for its position), see ``_retry_stale``.
+
+    Returns:
+        bool: ``write``'s result (whether a row was updated).
+    """
+    logger = logging.getLogger(__name__)
+
+    try:
+        if not current_user.is_authenticated:
+            raise AuthenticationError(
+                f"Attempt to run {operation} without authentication",
+                error_code="AUTH102",
+                debug_info={"topic_name": topic_name}
+            )
+
+        updated = _retry_stale(operation, lambda attempt: write())
+        _invalidate_topic(topic_name)
+        return updated
+    except AuthenticationError:
+        db.session.rollback()
+        raise
+    except OperationalError as e:
+        db.session.rollback()
+        logger.error(f"Database connection error in {operation}: {e}")
+        raise DatabaseConnectionError(
+            "Unable to connect to database",
+            error_code="DB113",
+            debug_info={"operation": operation, "original_error": str(e)})
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error in {operation} for {topic_name}: {e}", exc_info=True)
+        raise DatabaseOperationError(
+            f"Failed to update topic: {str(e)}",
+            operation=operation,
+            error_code="DB114",
+            debug_info={"topic_name": topic_name}
+        )
+
+
+def _update_step(topic_name, step_index, **values):
+    """UPDATE one chapter step in place; returns True if it exists."""
+    result = db.session.execute(
+        update(ChapterMode).where(
+            ChapterMode.topic_id == _topic_id_subquery(topic_name),
+            ChapterMode.step_index == step_index
+        ).values(version=ChapterMode.version + 1, **values))
+    return result.rowcount > 0
+
+
+def add_step_time(topic_name, step_index, seconds):
+    """
+    Add ``seconds`` to a chapter step's time_spent.
+
+    Returns:
+        bool: True if the step exists.
+    """
+    return _atomic_update('add_step_time', topic_name, lambda: _update_step(
+        topic_name, step_index, time_spent=_added_time(ChapterMode.time_spent, seconds)))
+
+
+def record_step_assessment(topic_name, step_index, user_answers, score, time_spent=0):
+    """
+    Store a chapter step's submitted answers and score, adding ``time_spent``.
+
+    Returns:
+        bool: True if the step exists.
+    """
+    values = {'user_answers': user_answers, 'score': score}
+    if time_spent:
+        values['time_spent'] = _added_time(ChapterMode.time_spent, time_spent)
+    return _atomic_update('record_step_assessment', topic_name,
+                          lambda: _update_step(topic_name, step_index, **values))
+
+
+def reset_step_assessment(topic_name, step_index):
+    """
+    Clear a chapter step's answers, score and popup chat so it can be retaken.
+
+    Returns:
+        bool: True if the step exists.
+    """
+    def write():
+        if not _update_step(topic_name, step_index, user_answers=None, score=None):
+            return False
+        step_id = select(ChapterMode.id).where(
+            ChapterMode.topic_id == _topic_id_subquery(topic_name),
+            ChapterMode.step_index == step_index).scalar_subquery()
+        ChatMessage.query.filter(ChatMessage.step_id == step_id).delete(synchronize_session=False)
+        return True
+
+    return _atomic_update('reset_step_assessment', topic_name, write)
+
+
+def append_chat_messages(topic_name, messages, step_index=None, channel=None, summaries=None, time_spent=0):
+    """
+    Append messages to a chat thread without reading or rewriting its history.
+
+    Args:
+        topic_name (str): Topic name.
+        messages (list): ``{"role", "content"}`` dicts, oldest first.
+        step_index (int, optional): Append to this chapter step's popup chat.
+        channel (str, optional): ``ChatMessage.CHAT`` (default) or ``POPUP``
+            when ``step_index`` is None; the topic and its chat session are
+            created if missing.
+        summaries (list, optional): Summary per message, None where not summarised yet.
+        time_spent (int): Seconds added to the step's or chat session's time.
+
+    Returns:
+        list | None: Ids of the new messages, or None if the step does not exist.
+    """
+    def write():
+        if step_index is not None:
+            row = db.session.execute(select(ChapterMode.topic_id, ChapterMode.id).where(
+                ChapterMode.topic_id == _topic_id_subquery(topic_name),
+                ChapterMode.step_index == step_index)).first()
+            if row is None:
+                return None
+            topic_id, step_id = row
+            if time_spent:
+                db.session.execute(update(ChapterMode).where(ChapterMode.id == step_id).values(
+                    time_spent=_added_time(ChapterMode.time_spent, time_spent),
+                    version=ChapterMode.version + 1))
+            thread_channel = ChatMessage.STEP
+        else:
+            row = db.session.execute(
+                select(Topic.id, ChatMode.id)
+                .outerjoin(ChatMode, ChatMode.topic_id == Topic.id)
+                .where(Topic.name == topic_name, Topic.user_id == current_user.userid)).first()
+            topic_id, chat_id = row if row else (None, None)
+            if topic_id is None:
+                topic = Topic(name=topic_name, user_id=current_user.userid)
+                db.session.add(topic)
+                db.session.flush()
+                topic_id = topic.id
+            if chat_id is None:
+                db.session.add(ChatMode(user_id=current_user.userid, topic_id=topic_id, time_spent=time_spent))
+            elif time_spent:
+                db.session.execute(update(ChatMode).where(ChatMode.id == chat_id).values(
+                    time_spent=_added_time(ChatMode.time_spent, time_spent),
+                    version=ChatMode.version + 1))
+            step_id, thread_channel = None, channel or ChatMessage.CHAT
+
+        rows = _append_messages(topic_id, thread_channel, step_id, messages, summaries=summaries)
+        return [message.id for message in rows]
+
+    return _atomic_update('append_chat_messages', topic_name, write)
+
+
+def append_popup_messages(topic_name, messages, step_index=None, time_spent=0):
+    """
+    Append messages to a popup chat: chapter step ``step_index``'s, or the
+    Chat mode popup if ``step_index`` is None.
+
+    Returns:
+        bool: True if the messages were stored.
+    """
+    return append_chat_messages(
+        topic_name, messages, step_index=step_index, channel=ChatMessage.POPUP,
+        time_spent=time_spent) is not None
+
+
+def record_quiz_result(topic_name, result, score, time_spent):
+    """
+    Store the last quiz attempt: its result, score and time.
+
+    Returns:
+        bool: True if the topic has a quiz.
+    """
+    def write():
+        rows = db.session.execute(
+            update(QuizMode).where(QuizMode.topic_id == _topic_id_subquery(topic_name))
+            .values(result=result, score=score, time_spent=time_spent, version=QuizMode.version + 1))
+        return rows.rowcount > 0
+
+    return _atomic_update('record_quiz_result', topic_name, write)
+
+
+def extend_quiz_time(topic_name, seconds):
+    """
+    Raise the quiz's time_spent to ``seconds`` if that is longer.
+
+    The quiz page reports the running time of the current attempt, not an increment.
+
+    Returns:
+        bool: True if the topic has a quiz.
+    """
+    def write():
+        current = func.coalesce(QuizMode.time_spent, 0)
+        rows = db.session.execute(
+            update(QuizMode).where(QuizMode.topic_id == _topic_id_subquery(topic_name))
+            .values(time_spent=case((current > seconds, current), else_=seconds),
+                    version=QuizMode.version + 1))
+        return rows.rowcount > 0
+
+    return _atomic_update('extend_quiz_time', topic_name, write)
+
+
+def add_flashcard_time(topic_name, seconds):
+    """
+    Add deck-level time to the topic's first flashcard.
+
+    Returns:
+        bool: True if the topic has flashcards.
+    """
+    def write():
+        first_card = select(func.min(FlashcardMode.id)).where(
+            FlashcardMode.topic_id == _topic_id_subquery(topic_name)).scalar_subquery()
+        rows = db.session.execute(
+            update(FlashcardMode).where(FlashcardMode.id == first_card)
+            .values(time_spent=_added_time(FlashcardMode.time_spent, seconds)))
+        return rows.rowcount > 0
+
+    return _atomic_update('add_flashcard_time', topic_name, write)
+
+
+def record_flashcard_progress(topic_name, by_id, by_term):
+    """
+    Add time to individual flashcards in one UPDATE.
+
+    Args:
+        by_id (dict): Card id -> seconds; takes precedence over ``by_term``.
+        by_term (dict): Card term -> seconds.
+
+    Returns:
+        bool: True if any card was updated.
+    """
+    # Ids are kept even with no time so they still shadow their term
+    by_id = {card_id: max(s, 0) for card_id, s in by_id.items()}
+    by_term = {term: max(s, 0) for term, s in by_term.items()}
+
+    def write():
+        if not any(by_id.values()) and not any(by_term.values()):
+            return False
+        # CASE picks the first matching branch, so an id match wins over a term match
+        whens = [(FlashcardMode.id == card_id, s) for card_id, s in by_id.items()]
+        whens += [(FlashcardMode.term == term, s) for term, s in by_term.items()]
+        rows = db.session.execute(
+            update(FlashcardMode).where(
+                FlashcardMode.topic_id == _topic_id_subquery(topic_name),
+                or_(FlashcardMode.id.in_(list(by_id)), FlashcardMode.term.in_(list(by_term)))
+            ).values(time_spent=_added_time(FlashcardMode.time_spent, case(*whens, else_=0))))
+        return rows.rowcount > 0
+
+    return _atomic_update('record_flashcard_progress', topic_name, write)
+
+
+def add_chat_time(topic_name, seconds):
+    """
+    Add ``seconds`` to the Chat mode session's time_spent.
+
+    Returns:
+        bool: True if the topic has a chat session.
+    """
+    def write():
+        rows = db.session.execute(
+            update(ChatMode).where(ChatMode.topic_id == _topic_id_subquery(topic_name))
+            .values(time_spent=_added_time(ChatMode.time_spent, seconds), version=ChatMode.version + 1))
+        return rows.rowcount > 0
+
+    return _atomic_update('add_chat_time', topic_name, write)
+
+
+def resolve_podcast_audio_path(audio_path):
+    """
+    Locate a stored podcast file.
+
+    Older rows may hold a path relative to a previous working directory; those
+    are looked up by file name in app/static.
+
+    Args:
+        audio_path (str): Path saved in ``ChapterMode.podcast_audio_path``.
+
+    Returns:
+        str | None: An existing file path, or None if the file is missing.
+    """
+    if not audio_path:
         return None
+    if os.path.exists(audio_path):
+        return audio_path
+    candidate_path = os.path.join(os.getcwd(), 'app', 'static', os.path.basename(audio_path))
+    if os.path.exists(candidate_path):
+        return candidate_path
+    logging.getLogger(__name__).warning(f"Audio file not found at path: {audio_path}")
+    return None
 
-    if update_timestamp:
-        try:
-            topic.modified_at = datetime.datetime.utcnow()
-            db.session.commit()
-        except Exception as e:
-            logging.warning(f"Failed to update modify time for {topic_name}: {e}")
 
-    data = {
-        "name": topic.name,
-        "plan": topic.study_plan or [], # Map model 'study_plan' back to app 'plan'
-        "last_quiz_result": None, # Will populate from Quiz
-        "chat_history": (topic.chat_mode.history or []) if topic.chat_mode else [],
-        "chat_history_summary": (topic.chat_mode.history_summary or []) if topic.chat_mode else [],
-        "popup_chat_history": (topic.chat_mode.popup_chat_history or []) if topic.chat_mode else [],
-        "chapter_mode": [],
-        "quiz_mode": None,
-        "flashcard_mode": []
+def get_podcast_audio_path(topic_name, step_index):
+    """
+    Resolve the podcast file of one step for the current user (single-row query).
+
+    Returns:
+        str | None: Existing file path, or None if the step has no podcast.
+    """
+    step = ChapterMode.query.join(Topic).filter(
+        Topic.name == topic_name,
+        Topic.user_id == current_user.userid,
+        ChapterMode.step_index == step_index
+    ).with_entities(ChapterMode.podcast_audio_path).first()
+    return resolve_podcast_audio_path(step.podcast_audio_path) if step else None
+
+
+def podcast_audio_url(topic_name, step_index, audio_path):
+    """
+    URL of the streaming endpoint for a step's podcast, or None if there is none.
+
+    The file's modification time is added as a version so a regenerated podcast
+    gets a new URL and is not served from the browser cache.
+    """
+    from flask import has_request_context, url_for
+
+    path = resolve_podcast_audio_path(audio_path)
+    if not path or not has_request_context():
+        return None
+    return url_for(
+        'chapter.podcast_audio',
+        topic_name=topic_name,
+        step_index=step_index,
+        v=int(os.path.getmtime(path)))
+
+
+# Sections load_topic can project. 'step_outline' is chapter_mode without the
+# teaching material, questions and popup chats (those columns stay deferred).
+TOPIC_FIELDS = frozenset({
+    'plan', 'chapter_mode', 'step_outline', 'quiz_mode', 'flashcard_mode',
+    'chat_history', 'chat_history_summary', 'popup_chat_history', 'chat_time_spent'
+})
+
+# load_topic chat history field -> ChatMessage thread it is read from
+CHAT_THREAD_FIELDS = {
+    'chat_history': ChatMessage.CHAT,
+    'chat_history_summary': ChatMessage.CHAT,
+    'popup_chat_history': ChatMessage.POPUP,
+}
+
+STEP_OUTLINE_COLUMNS = (
+    ChapterMode.id, ChapterMode.step_index, ChapterMode.title, ChapterMode.user_answers,
+    ChapterMode.score, ChapterMode.time_spent, ChapterMode.podcast_audio_path, ChapterMode.version
+)
+
+
+def _step_outline(topic_name, step_model, has_content):
+    """Dictionary for a step loaded without its material, questions and popup chat."""
+    return {
+        "step_index": step_model.step_index,
+        "id": step_model.id,
+        "title": step_model.title,
+        "user_answers": step_model.user_answers,
+        "score": step_model.score,
+        "time_spent": step_model.time_spent or 0,
+        "has_content": bool(has_content),
+        "podcast_audio_path": step_model.podcast_audio_path,
+        "podcast_audio_url": podcast_audio_url(
+            topic_name, step_model.step_index, step_model.podcast_audio_path)
     }
 
 
-    # Initialize steps list matching the plan length
-    plan = topic.study_plan or []
-    # Create a map of existing steps by index
-    existing_steps = {s.step_index: s for s in topic.chapter_mode}
-
-    steps_data = []
-    # If we have a plan, we want to return a list of steps matching that plan
-    for i in range(len(plan)):
-        step_model = existing_steps.get(i)
-        if step_model:
-            steps_data.append({
-                "step_index": step_model.step_index,
-                "id": step_model.id,
-                "title": step_model.title,
-                "content": step_model.content,
-                "questions": step_model.questions,
-                "user_answers": step_model.user_answers,
-                "score": step_model.score,
-                "popup_chat_history": step_model.popup_chat_history or [],
-                "time_spent": step_model.time_spent or 0,
-                # Include derived fields if needed, e.g. teaching_material is actually 'content' in model?
-                # In model: content = db.Column(db.Text) # Markdown content
-                # In app: key is 'teaching_material'
-                "teaching_material": step_model.content,
-                "podcast_audio_path": step_model.podcast_audio_path,
-                "podcast_audio_content": None
-            })
-
-            # Load audio content if path exists
-            if step_model.podcast_audio_path:
-                audio_path = step_model.podcast_audio_path
-                logging.info(f"DEBUG: Processing audio for step {step_model.step_index}. Raw path: {audio_path}")
-
-                # If path doesn't exist as is, check if it's relative to app/static
-                if not os.path.exists(audio_path):
-                     # Try resolving relative to app/static
-                     # Assuming project root is cwd. app/static is standard.
-                     # We can also rely on flask static folder if available context, but here we are in storage.
-                     candidate_path = os.path.join(os.getcwd(), 'app', 'static', os.path.basename(audio_path))
-                     logging.info(f"DEBUG: Path not found. Trying candidate: {candidate_path}")
-                     if os.path.exists(candidate_path):
-                         audio_path = candidate_path
-                         logging.info("DEBUG: Candidate found!")
-                     else:
-                         logging.debug("DEBUG: Candidate also not found.")
-
-                if os.path.exists(audio_path):
-                    try:
-                        with open(audio_path, 'rb') as audio_file:
-                            encoded_string = base64.b64encode(audio_file.read()).decode('utf-8')
-                            steps_data[-1]["podcast_audio_content"] = encoded_string
-                            logging.info(f"DEBUG: Successfully loaded and encoded audio for step {step_model.step_index}")
-                    except Exception as e:
-                         logging.warning(f"Failed to load audio file for topic {topic_name} step {step_model.step_index}: {e}")
-                else:
-                    logging.warning(f"Audio file not found at path: {step_model.podcast_audio_path} or resolved path {audio_path}")
-
-            # Populate feedback from Feedback table
-            content_ref = f"topic_{topic.id}_step_{step_model.step_index}"
-            feedbacks = Feedback.query.filter_by(
-                user_id=current_user.userid,
-                content_reference=content_ref
-            ).all()
-
-            # Format back to list of strings or dicts as expected by frontend
-            # Assuming simple strings for now or dicts if rating present
-            steps_data[-1]['feedback'] = [f.comment for f in feedbacks]
-        else:
-            # Placeholder for steps not yet started/saved
-            steps_data.append({})
+def step_feedback_reference(topic_id, step_index):
+    """``Feedback.content_reference`` for a chapter step."""
+    return f"topic_{topic_id}_step_{step_index}"
+
+
+def _load_step_feedback(topic_id, step_indices):
+    """
+    Fetch the feedback comments for several steps in one query.
+
+    Returns:
+        dict: step_index -> list of comments (oldest first).
+    """
+    refs = {step_feedback_reference(topic_id, i): i for i in step_indices}
+    feedback = {i: [] for i in step_indices}
+    if not refs:
+        return feedback
+
+    rows = db.session.query(Feedback.content_reference, Feedback.comment).filter(
+        Feedback.user_id == current_user.userid,
+        Feedback.content_reference.in_(list(refs))
+    ).order_by(Feedback.id).all()
+    for content_ref, comment in rows:
+        feedback[refs[content_ref]].append(comment)
+    return feedback
+
+
+def _step_details(topic_name, step_model, feedback, popup):
+    """Full dictionary for a step, including its feedback comments and popup chat."""
+    step = _step_outline(topic_name, step_model, step_model.content)
+    step.update({
+        "content": step_model.content,
+        # In app: key is 'teaching_material'
+        "teaching_material": step_model.content,
+        "questions": step_model.questions,
+        "popup_chat_history": [_message_entry(m) for m in popup],
+        "feedback": feedback,
+    })
+    return step
+
+
+def _load_steps(topic_name, topic_id, indices, outline, versions):
+    """
+    Load chapter steps for load_topic.
+
+    Args:
+        indices (iterable | None): Step indices to load; None loads every step.
+        outline (bool): Build light outline dicts (see ``_step_outline``).
+        versions (dict): Filled with step id -> version for the loaded steps
+            (a step already in it keeps the version it was first read at).
+
+    Returns:
+        dict: step_index -> step dict, for the steps that exist.
+    """
+    query = ChapterMode.query.filter(ChapterMode.topic_id == topic_id)
+    if indices is not None:
+        query = query.filter(ChapterMode.step_index.in_(list(indices)))
+
+    by_index = {}
+    if outline:
+        has_content = ChapterMode.content.isnot(None) & (ChapterMode.content != '')
+        rows = query.options(load_only(*STEP_OUTLINE_COLUMNS)).add_columns(has_content).all()
+        for step_model, step_has_content in rows:
+            by_index[step_model.step_index] = _step_outline(topic_name, step_model, step_has_content)
+            versions.setdefault(step_model.id, step_model.version)
+    else:
+        step_models = query.all()
+        feedback = _load_step_feedback(topic_id, [m.step_index for m in step_models])
+        popups = _load_threads(topic_id, (), [m.id for m in step_models])
+        for step_model in step_models:
+            by_index[step_model.step_index] = _step_details(
+                topic_name, step_model, feedback[step_model.step_index],
+                popups[(ChatMessage.STEP, step_model.id)])
+            versions.setdefault(step_model.id, step_model.version)
+    return by_index
+
+
+# --- Topic cache ---
+# load_topic keeps the sections it reads in a per-topic entry, so a request
+# that loads the same topic again (e.g. a route and then a helper, or another
+# projection) only queries the sections it has not read yet. Entries live in
+# a request-local map in ``g`` and, optionally, in a process-wide LRU. Every
+# storage write to a topic invalidates both (see ``invalidate_topic_cache``).
+
+TOPIC_CACHE_MAX_ENTRIES = int(os.getenv("TOPIC_CACHE_MAX_ENTRIES", 0))
+
+# Keys of a full step dict that make up its outline (see ``_step_outline``)
+STEP_OUTLINE_KEYS = (
+    'step_index', 'id', 'title', 'user_answers', 'score', 'time_spent',
+    'has_content', 'podcast_audio_path', 'podcast_audio_url'
+)
+
+
+class TopicCache:
+    """
+    Process-wide LRU of loaded topics, keyed by (user_id, topic_name, version).
+
+    A write bumps the topic's version, so an entry read before it can no
+    longer be found and ages out of the LRU. Versions are counted per
+    process: with several worker processes a write in one does not reach the
+    others, so the LRU is off unless ``TOPIC_CACHE_MAX_ENTRIES`` is set. The
+    request-local map and the hit counters work either way.
+    """
+
+    def __init__(self, max_entries=TOPIC_CACHE_MAX_ENTRIES):
+        """
+        Initializes the cache.
+
+        Args:
+            max_entries (int): Capacity of the LRU; 0 disables it.
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (user_id, topic_name, version) -> entry
+        self._versions = {}  # (user_id, topic_name) -> writes seen
+        self._user_versions = {}  # user_id -> user-wide invalidations
+        self._lock = threading.Lock()
+        self._stats = {'request_hits': 0, 'process_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _version(self, user_id, topic_name):
+        """Current version of a topic (caller holds the lock)."""
+        return self._user_versions.get(user_id, 0), self._versions.get((user_id, topic_name), 0)
+
+    def version(self, user_id, topic_name):
+        """Return the current version of a topic, to tag an entry before it is read."""
+        with self._lock:
+            return self._version(user_id, topic_name)
+
+    def get(self, user_id, topic_name):
+        """
+        Look up the entry for the topic's current version.
+
+        Returns:
+            dict | None: The shared entry (never handed to callers as-is).
+        """
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            key = (user_id, topic_name, self._version(user_id, topic_name))
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, entry):
+        """Store an entry unless a write has superseded its version since it was read."""
+        if self.max_entries <= 0:
+            return
+        user_id, topic_name = entry['user_id'], entry['name']
+        with self._lock:
+            if entry['version'] != self._version(user_id, topic_name):
+                return
+            key = (user_id, topic_name, entry['version'])
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id, topic_name=None):
+        """Bump the version of one topic, or of all the user's topics if ``topic_name`` is None."""
+        with self._lock:
+            if topic_name is None:
+                self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+                for key in [k for k in self._entries if k[0] == user_id]:
+                    del self._entries[key]
+            else:
+                self._entries.pop((user_id, topic_name, self._version(user_id, topic_name)), None)
+                self._versions[(user_id, topic_name)] = self._versions.get((user_id, topic_name), 0) + 1
+            self._stats['invalidations'] += 1
+
+    def record(self, outcome):
+        """Count a load_topic call: 'request_hits', 'process_hits' or 'misses'."""
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def clear(self):
+        """Drop every entry (versions are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return hit/miss counters.
+
+        Returns:
+            dict: Counters plus the current LRU size and overall hit rate. A
+            load_topic call is a hit only if it ran no query for topic data.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['request_hits'] + stats['process_hits'] + stats['misses']
+        stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+_topic_cache = None
+_topic_cache_lock = threading.Lock()
+
+
+def get_topic_cache():
+    """
+    Get the process-wide topic cache.
+
+    Returns:
+        TopicCache: The shared cache.
+    """
+    global _topic_cache
+    if _topic_cache is None:
+        with _topic_cache_lock:
+            if _topic_cache is None:
+                _topic_cache = TopicCache()
+    return _topic_cache
 
-    data["plan"] = plan
-    data["chapter_mode"] = steps_data
 
-    # QuizMode
-    # Assuming one quiz per topic for now, similar to previous JSON usually
-    if topic.quiz_mode:
+def _request_topics():
+    """Request-local map (user_id, topic_name) -> entry; a throwaway dict outside an app context."""
+    return g.setdefault('_topic_cache', {}) if has_app_context() else {}
+
+
+def invalidate_topic_cache(user_id, topic_name=None):
+    """
+    Forget cached copies of a topic after writing it.
+
+    Args:
+        user_id (str): Owner of the topic.
+        topic_name (str, optional): Topic written; None for all of the user's
+            topics (when the topic is not known, e.g. a background write).
+    """
+    if has_app_context():
+        cached = g.get('_topic_cache', {})
+        for key in [k for k in cached if k[0] == user_id and topic_name in (None, k[1])]:
+            del cached[key]
+    get_topic_cache().invalidate(user_id, topic_name)
+
+
+def _invalidate_topic(topic_name):
+    """Forget cached copies of one of the current user's topics."""
+    invalidate_topic_cache(current_user.userid, topic_name)
+
+
+def _cached_topic(topic_name, fresh=False):
+    """
+    Find or create the cache entry of a topic for load_topic.
+
+    Args:
+        topic_name (str): Topic name.
+        fresh (bool): Ignore the request-local and process entries and read anew.
+
+    Returns:
+        tuple: (entry or None if the topic does not exist, hit outcome or None).
+    """
+    user_id = current_user.userid
+    cached = _request_topics()
+    if fresh:
+        cached.pop((user_id, topic_name), None)
+    entry = cached.get((user_id, topic_name))
+    if entry is not None:
+        return entry, 'request_hits'
+
+    cache = get_topic_cache()
+    entry = None if fresh else cache.get(user_id, topic_name)
+    if entry is not None:
+        cached[(user_id, topic_name)] = entry
+        return entry, 'process_hits'
+
+    # Tag the entry with the version before reading, so a write landing
+    # while it is filled makes it unreachable rather than stale
+    version = cache.version(user_id, topic_name)
+    topic = Topic.query.options(
+        load_only(Topic.id, Topic.name, Topic.study_plan, Topic.version)
+    ).filter_by(name=topic_name, user_id=user_id).first()
+    if not topic:
+        return None, None
+
+    entry = {
+        'user_id': user_id,
+        'name': topic_name,
+        'version': version,
+        'topic_id': topic.id,
+        'plan': topic.study_plan or [],
+        'sections': {},  # section field -> value as load_topic returns it
+        'steps': {},  # step_index -> full step dict, None if the step has no row
+        'all_steps': False,
+        'outlines': {},  # step_index -> outline step dict, None if no row
+        'all_outlines': False,
+        'versions': _new_versions(),  # of the rows read into the sections above
+    }
+    cached[(user_id, topic_name)] = entry
+    return entry, None
+
+
+def _fill_steps(entry, indices, outline):
+    """
+    Load the steps ``entry`` is missing for ``indices`` (None = every step).
+
+    Returns:
+        bool: True if a query was run.
+    """
+    if outline:
+        have = lambda i: i in entry['steps'] or i in entry['outlines']  # noqa: E731
+        complete = entry['all_steps'] or entry['all_outlines']
+        store, flag = entry['outlines'], 'all_outlines'
+    else:
+        have = lambda i: i in entry['steps']  # noqa: E731
+        complete = entry['all_steps']
+        store, flag = entry['steps'], 'all_steps'
+
+    if indices is None:
+        if complete:
+            return False
+        loaded = _load_steps(entry['name'], entry['topic_id'], None, outline, entry['versions']['steps'])
+        store.update(loaded)
+        for i in range(len(entry['plan'])):
+            store.setdefault(i, None)
+        entry[flag] = True
+        return True
+
+    missing = [i for i in indices if not complete and not have(i)]
+    if not missing:
+        return False
+    loaded = _load_steps(entry['name'], entry['topic_id'], missing, outline, entry['versions']['steps'])
+    for i in missing:
+        store[i] = loaded.get(i)
+    return True
+
+
+def _cached_step(entry, index, outline):
+    """Step dict from the cache entry, projected to its outline if asked; None if no row."""
+    if index in entry['steps'] or entry['all_steps']:
+        step = entry['steps'].get(index)
+        if step is not None and outline:
+            step = {key: step[key] for key in STEP_OUTLINE_KEYS}
+        return step
+    return entry['outlines'].get(index)
+
+
+def _fill_sections(entry, fields):
+    """
+    Load the non-step sections ``entry`` is missing for ``fields``.
+
+    Returns:
+        bool: True if a query was run.
+    """
+    sections = entry['sections']
+    topic_id = entry['topic_id']
+    queried = False
+
+    if 'quiz_mode' in fields and 'quiz_mode' not in sections:
         # Quiz is 1-to-1
-        latest_quiz = topic.quiz_mode
-        data["quiz_mode"] = {
-            "questions": latest_quiz.questions,
-            "score": latest_quiz.score,
-            "date": latest_quiz.created_at.isoformat() if latest_quiz.created_at else None,
-            "time_spent": latest_quiz.time_spent or 0
-        }
-        # Populate last_quiz_result from the quiz
-        data["last_quiz_result"] = latest_quiz.result
-
-    # Flashcards
-    for card in topic.flashcard_mode:
-        data["flashcard_mode"].append({
+        latest_quiz = QuizMode.query.filter_by(topic_id=topic_id).first()
+        sections['quiz_mode'] = None
+        sections['last_quiz_result'] = None
+        if latest_quiz:
+            sections['quiz_mode'] = {
+                "questions": latest_quiz.questions,
+                "score": latest_quiz.score,
+                "date": latest_quiz.created_at.isoformat() if latest_quiz.created_at else None,
+                "time_spent": latest_quiz.time_spent or 0
+            }
+            sections['last_quiz_result'] = latest_quiz.result
+            entry['versions']['quiz'] = latest_quiz.version
+        queried = True
+
+    if 'flashcard_mode' in fields and 'flashcard_mode' not in sections:
+        cards = FlashcardMode.query.filter_by(topic_id=topic_id).order_by(FlashcardMode.id).all()
+        sections['flashcard_mode'] = [{
             "term": card.term,
             "definition": card.definition,
             "time_spent": card.time_spent or 0,
             "id": card.id
-        })
+        } for card in cards]
+        queried = True
+
+    if 'chat_time_spent' in fields and 'chat_time_spent' not in sections:
+        # Only present once the chat exists (None here)
+        chat_time = db.session.execute(
+            select(ChatMode.time_spent, ChatMode.version).where(ChatMode.topic_id == topic_id)).first()
+        sections['chat_time_spent'] = (chat_time.time_spent or 0) if chat_time else None
+        if chat_time:
+            entry['versions']['chat'] = chat_time.version
+        queried = True
+
+    thread_fields = [f for f in CHAT_THREAD_FIELDS if f in fields and f not in sections]
+    if thread_fields:
+        threads = _load_threads(topic_id, {CHAT_THREAD_FIELDS[f] for f in thread_fields})
+        if (ChatMessage.CHAT, None) in threads:
+            chat = threads[(ChatMessage.CHAT, None)]
+            sections['chat_history'] = [_message_entry(m) for m in chat]
+            sections['chat_history_summary'] = [_summary_entry(m) for m in chat]
+        if (ChatMessage.POPUP, None) in threads:
+            sections['popup_chat_history'] = [
+                _message_entry(m) for m in threads[(ChatMessage.POPUP, None)]]
+        queried = True
+
+    return queried
+
+
+@_instrumented('load_topic')
+def load_topic(topic_name, update_timestamp=False, fields=None, steps=None, fresh=False):
+    """
+    Load topic data from PostgreSQL and reconstruct dictionary structure.
+    Returns None if topic doesn't exist or user not authenticated (normal behavior for new topics).
 
-    # Chat Mode time
-    if topic.chat_mode:
-        data["chat_time_spent"] = topic.chat_mode.time_spent or 0
+    Only the requested sections are queried, and the large columns (teaching
+    material, questions, chat histories) are read only for sections that need them.
+    Sections already read for this topic (earlier in the request, or from the
+    process cache) are reused; see ``TopicCache``.
+
+    Args:
+        topic_name (str): Topic name.
+        update_timestamp (bool): Mark the topic as recently opened.
+        fields (iterable, optional): Sections to load, from ``TOPIC_FIELDS``; None
+            loads all of them. 'name' is always included. 'quiz_mode' also sets
+            'last_quiz_result'; 'step_outline' fills 'chapter_mode' with light
+            step dicts that carry 'has_content' instead of the material.
+        steps (iterable, optional): Step indices to load into 'chapter_mode';
+            the other positions are ``{}`` placeholders (kept as-is by save_topic).
+        fresh (bool): Read from the database even if the topic was loaded
+            earlier in this request, e.g. after waiting for another request
+            that may have written it meanwhile.
+
+    Returns:
+        dict | None: Topic data with the requested sections (a copy the caller
+        may change and pass to save_topic).
+    """
+    fields = TOPIC_FIELDS if fields is None else frozenset(fields)
+    unknown = fields - TOPIC_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown topic fields: {', '.join(sorted(unknown))}")
+
+    entry, outcome = _cached_topic(topic_name, fresh)
+    if entry is None:
+        get_topic_cache().record('misses')
+        return None
 
+    queried = _fill_sections(entry, fields)
+    plan = entry['plan']
+    data = {"name": topic_name}
+    if 'plan' in fields:
+        data["plan"] = copy.deepcopy(plan)
+
+    if 'chapter_mode' in fields or 'step_outline' in fields:
+        outline = 'chapter_mode' not in fields
+        queried = _fill_steps(entry, None if steps is None else list(steps), outline) or queried
+        wanted = range(len(plan)) if steps is None else set(steps)
+        data["chapter_mode"] = [
+            copy.deepcopy(_cached_step(entry, i, outline) or {}) if i in wanted else {}
+            for i in range(len(plan))]
+
+    sections = entry['sections']
+    if 'quiz_mode' in fields:
+        data["quiz_mode"] = copy.deepcopy(sections['quiz_mode'])
+        data["last_quiz_result"] = copy.deepcopy(sections['last_quiz_result'])
+    if 'flashcard_mode' in fields:
+        data["flashcard_mode"] = copy.deepcopy(sections['flashcard_mode'])
+    if 'chat_time_spent' in fields and sections['chat_time_spent'] is not None:
+        data['chat_time_spent'] = sections['chat_time_spent']
+    for field in CHAT_THREAD_FIELDS:
+        if field in fields:
+            data[field] = copy.deepcopy(sections[field])
+
+    if update_timestamp:
+        try:
+            db.session.execute(update(Topic).where(Topic.id == entry['topic_id']).values(
+                modified_at=datetime.datetime.utcnow()))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.warning(f"Failed to update modify time for {topic_name}: {e}")
+
+    cache = get_topic_cache()
+    cache.record('misses' if queried or outcome is None else outcome)
+    cache.put(entry)
+    _remember_snapshot(topic_name, entry['topic_id'], data, entry['versions'])
     return data
 
 def get_all_topics():
@@ -573,33 +1925,73 @@ def get_all_topics():
             error_code="DB108"
         )
 
-def get_topics_metadata():
+def get_topics_page(page=1, per_page=None):
     """
-    Get metadata for all topics belonging to the current user.
-    Returns a list of dictionaries with name and status flags (has_plan, has_chat, etc.).
-    Sorted by modified_at DESC (Recently Opened/Modified).
+    Get one page of the current user's topics with their status flags.
+
+    The flags are EXISTS subqueries and the total a scalar COUNT subquery,
+    so the page is a single query that walks ``ix_topics_user_modified`` for
+    just ``per_page`` rows, however many topics (or chat messages and
+    flashcards) the user has.
+
+    Args:
+        page (int): 1-based page number.
+        per_page (int, optional): Page size; None returns every topic.
+
+    Returns:
+        tuple: (list of dicts with name and has_plan/has_chat/... flags,
+        sorted by modified_at DESC; total number of topics).
     """
     if not current_user.is_authenticated:
-        return []
+        return [], 0
+
+    def exists_for(model, *criteria):
+        return select(model.id).where(model.topic_id == Topic.id, *criteria).exists()
+
+    total = select(func.count(Topic.id)).where(Topic.user_id == current_user.userid)
+    query = (
+        select(
+            Topic.name,
+            Topic.study_plan,
+            exists_for(ChatMessage, ChatMessage.channel == ChatMessage.CHAT).label('has_chat'),
+            exists_for(QuizMode).label('has_quiz'),
+            exists_for(FlashcardMode).label('has_flashcards'),
+            total.scalar_subquery().label('total'))
+        .where(Topic.user_id == current_user.userid)
+        .order_by(Topic.modified_at.desc(), Topic.id.desc()))
+    if per_page:
+        query = query.limit(per_page).offset((max(page, 1) - 1) * per_page)
 
     try:
-        topics = Topic.query.filter_by(user_id=current_user.userid).order_by(Topic.modified_at.desc()).all()
-
-        metadata = []
-        for t in topics:
-            metadata.append({
-                'name': t.name,
-                'has_plan': bool(t.study_plan),
-                'has_chat': bool(t.chat_mode and t.chat_mode.history),
-                'has_quiz': bool(t.quiz_mode),
-                'has_flashcards': bool(t.flashcard_mode),
-                'has_reels': False # Reels not yet persistent in separate table
-            })
-        return metadata
+        rows = db.session.execute(query).all()
+        if rows:
+            total = rows[0].total
+        elif per_page and page > 1:
+            # Past the last page: there is no row to carry the count
+            total = db.session.execute(total).scalar()
+        else:
+            total = 0
     except Exception as e:
-        import logging
         logging.getLogger(__name__).error(f"Error fetching topics metadata: {e}")
-        return []
+        return [], 0
+
+    metadata = [{
+        'name': row.name,
+        'has_plan': bool(row.study_plan),
+        'has_chat': bool(row.has_chat),
+        'has_quiz': bool(row.has_quiz),
+        'has_flashcards': bool(row.has_flashcards),
+        'has_reels': False # Reels not yet persistent in separate table
+    } for row in rows]
+    return metadata, total
+
+def get_topics_metadata():
+    """
+    Get metadata for all topics belonging to the current user.
+    Returns a list of dictionaries with name and status flags (has_plan, has_chat, etc.).
+    Sorted by modified_at DESC (Recently Opened/Modified).
+    """
+    return get_topics_page()[0]
 
 def delete_topic(topic_name):
     """Delete a topic and all its related  data."""
@@ -617,23 +2009,29 @@ def delete_topic(topic_name):
 
         # Delete related chat sessions, chapter modes, quiz modes, flashcard modes, and plan revisions
         # before deleting the topic itself to avoid foreign key constraints.
-        if topic.chat_mode:
-            db.session.delete(topic.chat_mode)
-
-        # Delete items in collections
-        for item in topic.chapter_mode:
-            db.session.delete(item)
-        for item in topic.flashcard_mode:
-            db.session.delete(item)
-        for item in topic.plan_revisions:
-            db.session.delete(item)
-
-        # QuizMode is a one-to-one relationship (uselist=False), so no loop needed
-        if topic.quiz_mode:
-            db.session.delete(topic.quiz_mode)
-
-        db.session.delete(topic)
+        ChatMessage.query.filter_by(topic_id=topic.id).delete(synchronize_session=False)
+        # One flush at commit: an autoflush while the collections load would
+        # delete the steps, and the topic's cascade would then delete them again
+        # (a versioned row deleted twice raises StaleDataError)
+        with db.session.no_autoflush:
+            if topic.chat_mode:
+                db.session.delete(topic.chat_mode)
+
+            # Delete items in collections
+            for item in topic.chapter_mode:
+                db.session.delete(item)
+            for item in topic.flashcard_mode:
+                db.session.delete(item)
+            for item in topic.plan_revisions:
+                db.session.delete(item)
+
+            # QuizMode is a one-to-one relationship (uselist=False), so no loop needed
+            if topic.quiz_mode:
+                db.session.delete(topic.quiz_mode)
+
+            db.session.delete(topic)
         db.session.commit()
+        _invalidate_topic(topic_name)
         logger.info(f"Successfully deleted topic: {topic_name}")
 
     except OperationalError as e:
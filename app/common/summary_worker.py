@@ -0,0 +1,244 @@
+"""
+Summary Worker - summarises chat answers off the request path.
+
+``send_message`` used to call ``summarize_text`` before replying, a second
+full LLM round trip per turn. Now the answer is saved as a ``ChatMessage``
+without a summary and a job is queued here. A single daemon thread summarises
+it (through the scheduler's background lane) and fills in the message's
+summary. Until then the context builder simply sees the full message, so
+nothing is lost if a job fails or the process exits first.
+
+The same worker computes the context builder's block roll-ups (``RollupJob``),
+so chat requests never wait on a roll-up LLM call.
+
+The queue is bounded by ``SUMMARY_QUEUE_SIZE``: under a slow LLM new jobs are
+dropped and counted rather than piling up. Once the queue has drained, the
+worker looks the dropped messages up again (assistant messages still without
+a summary, from the first dropped one on) and queues them. Jobs still queued
+when the process exits get up to ``SUMMARY_EXIT_TIMEOUT`` seconds to finish.
+
+Set ``CHAT_SUMMARY_ASYNC = False`` in the app config to summarise inline.
+"""
+import os
+import queue
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_QUEUE_SIZE = int(os.getenv("SUMMARY_QUEUE_SIZE", 1000))
+SUMMARY_EXIT_TIMEOUT = float(os.getenv("SUMMARY_EXIT_TIMEOUT", 5.0))
+
+
+class SummaryJob:
+    """One assistant message waiting for its summary."""
+
+    def __init__(self, app, user_id, message_id, content):
+        """
+        Initializes the job.
+
+        Args:
+            app: Flask application (the worker runs outside any request).
+            user_id (str): Owner of the chat.
+            message_id (int): ``ChatMessage`` id of the message.
+            content (str): Full message text.
+        """
+        self.app = app
+        self.user_id = user_id
+        self.message_id = message_id
+        self.content = content
+
+    def run(self):
+        """
+        Summarise the message and write it back.
+
+        Returns:
+            str: 'stored', 'deleted' (message deleted meanwhile) or 'failed'.
+        """
+        from app.common.utils import summarize_text
+        from app.common.storage import backfill_chat_summary
+
+        with self.app.app_context():
+            summary = summarize_text(self.content)
+            if not summary:
+                return 'failed'
+            stored = backfill_chat_summary(self.user_id, self.message_id, summary)
+            return 'stored' if stored else 'deleted'
+
+
+class RollupJob:
+    """One block of chat history waiting for its context roll-up."""
+
+    def __init__(self, app, store, text):
+        """
+        Initializes the job.
+
+        Args:
+            app: Flask application, or None outside an app context.
+            store (RollupStore): Store that receives the roll-up.
+            text (str): Block text to condense.
+        """
+        self.app = app
+        self.store = store
+        self.text = text
+
+    def run(self):
+        """
+        Compute and store the roll-up.
+
+        Returns:
+            str: 'stored' or 'failed'.
+        """
+        if self.app is None:
+            return 'stored' if self.store.compute(self.text) else 'failed'
+        with self.app.app_context():
+            return 'stored' if self.store.compute(self.text) else 'failed'
+
+
+class SummaryWorker:
+    """Bounded queue plus a lazily started daemon thread that backfills summaries."""
+
+    def __init__(self, max_queue=SUMMARY_QUEUE_SIZE):
+        """
+        Initializes an idle worker.
+
+        Args:
+            max_queue (int): Jobs that may wait before new ones are dropped.
+        """
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        # (app, message id) of the first job dropped since the last recovery
+        self._first_dropped = None
+        self._stats = {'queued': 0, 'stored': 0, 'deleted': 0, 'failed': 0, 'dropped': 0, 'requeued': 0}
+
+    def submit(self, job):
+        """
+        Queue a summary job without blocking, starting the worker thread on first use.
+
+        Args:
+            job (SummaryJob or RollupJob): The job.
+
+        Returns:
+            bool: False if the queue was full and the job was dropped (a
+            message summary is queued again once the backlog has drained, a
+            roll-up is requested again by a later chat turn).
+        """
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+                if isinstance(job, SummaryJob) and (
+                        self._first_dropped is None or job.message_id < self._first_dropped[1]):
+                    self._first_dropped = (job.app, job.message_id)
+            return False
+        with self._lock:
+            self._stats['queued'] += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._loop,
+                    name="ChatSummaryWorker",
+                    daemon=True)
+                self._thread.start()
+        return True
+
+    def join(self, timeout=None):
+        """
+        Block until every queued job has been processed (used by tests, benchmarks and at exit).
+
+        Args:
+            timeout (float, optional): Give up after this many seconds.
+
+        Returns:
+            bool: True if nothing is left to process.
+        """
+        with self.queue.all_tasks_done:
+            return self.queue.all_tasks_done.wait_for(lambda: not self.queue.unfinished_tasks, timeout)
+
+    def stats(self):
+        """
+        Return job counters.
+
+        Returns:
+            dict: queued, stored, deleted (message deleted meanwhile), failed,
+            dropped (queue full), requeued (dropped jobs queued again) and pending.
+        """
+        with self._lock:
+            return dict(self._stats, pending=self.queue.unfinished_tasks)
+
+    def _loop(self):
+        """Process jobs forever."""
+        while True:
+            job = self.queue.get()
+            try:
+                try:
+                    outcome = job.run()
+                except Exception as e:
+                    logger.warning(f"{job.__class__.__name__} failed: {e}")
+                    outcome = 'failed'
+                with self._lock:
+                    self._stats[outcome] += 1
+                # Before task_done, so join() also waits for the requeued jobs
+                if self.queue.empty():
+                    self._requeue_dropped()
+            finally:
+                self.queue.task_done()
+
+    def _requeue_dropped(self):
+        """Queue the messages of dropped jobs that still have no summary."""
+        from app.common.storage import unsummarised_chat_messages
+
+        with self._lock:
+            dropped, self._first_dropped = self._first_dropped, None
+        if dropped is None:
+            return
+        app, first_id = dropped
+        try:
+            with app.app_context():
+                pending = unsummarised_chat_messages(first_id, limit=self.queue.maxsize)
+        except Exception as e:
+            logger.warning(f"Could not look up dropped chat summaries: {e}")
+            return
+        requeued = sum(self.submit(SummaryJob(app, user_id, message_id, content))
+                       for user_id, message_id, content in pending)
+        with self._lock:
+            self._stats['requeued'] += requeued
+
+
+_worker = SummaryWorker()
+atexit.register(_worker.join, timeout=SUMMARY_EXIT_TIMEOUT)
+
+
+def get_summary_worker():
+    """
+    Get the process-wide summary worker.
+
+    Returns:
+        SummaryWorker: The shared worker.
+    """
+    return _worker
+
+
+def enqueue_chat_summary(message_id, content):
+    """
+    Queue a background summary for one of the current user's chat messages.
+
+    Must be called inside a request; the app and user are captured for the worker.
+
+    Args:
+        message_id (int): ``ChatMessage`` id.
+        content (str): Full message text.
+
+    Returns:
+        bool: False if the queue was full (see ``SummaryWorker.submit``).
+    """
+    from flask import current_app
+    from flask_login import current_user
+
+    return _worker.submit(SummaryJob(
+        current_app._get_current_object(),
+        current_user.userid,
+        message_id,
+        content))
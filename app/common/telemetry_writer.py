@@ -0,0 +1,184 @@
+"""
+Telemetry Writer - batched, off-request inserts for metrics and events.
+
+``log_telemetry`` and the model performance hooks of ``call_llm``, TTS and
+STT used to ``db.session.add`` a row and commit it on the request thread:
+one extra write transaction per LLM call and UI event, on the route's own
+session (so the commit also flushed whatever the route had pending).
+
+Now they queue the row's values here, which only costs a dict and a
+non-blocking put. A single daemon thread collects rows for up to
+``TELEMETRY_FLUSH_INTERVAL`` seconds (or ``TELEMETRY_BATCH_SIZE`` rows) and
+inserts each table's rows with one executemany on its own connection.
+
+The queue is bounded by ``TELEMETRY_QUEUE_SIZE``: when the database cannot
+keep up, new rows are dropped and counted rather than slowing requests.
+Rows still queued when the process exits are written by an ``atexit`` flush.
+"""
+import os
+import time
+import queue
+import atexit
+import logging
+import datetime
+import threading
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_QUEUE_SIZE = int(os.getenv("TELEMETRY_QUEUE_SIZE", 10000))
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", 500))
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", 1.0))
+
+# Columns stamped when a row is queued, not when its batch is written
+EVENT_TIME_COLUMNS = ('timestamp', 'created_at', 'modified_at')
+
+
+class TelemetryWriter:
+    """Bounded queue plus a lazily started daemon thread that bulk-inserts rows."""
+
+    def __init__(self, max_queue=TELEMETRY_QUEUE_SIZE, batch_size=TELEMETRY_BATCH_SIZE,
+                 flush_interval=TELEMETRY_FLUSH_INTERVAL):
+        """
+        Initializes an idle writer.
+
+        Args:
+            max_queue (int): Rows that may wait before new ones are dropped.
+            batch_size (int): Most rows written per batch.
+            flush_interval (float): Seconds a batch waits to fill up.
+        """
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'queued': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'batches': 0}
+
+    def submit(self, app, model, values):
+        """
+        Queue one row without blocking.
+
+        Args:
+            app: Flask application whose database receives the row.
+            model: Model class of the row (e.g. ``TelemetryLog``).
+            values (dict): Column values.
+
+        Returns:
+            bool: False if the queue was full and the row was dropped.
+        """
+        try:
+            self.queue.put_nowait((app, model, values))
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+            return False
+        with self._lock:
+            self._stats['queued'] += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._loop,
+                    name="TelemetryWriter",
+                    daemon=True)
+                self._thread.start()
+        return True
+
+    def join(self, timeout=None):
+        """
+        Block until every queued row has been written (used by tests and at exit).
+
+        Args:
+            timeout (float, optional): Give up after this many seconds.
+
+        Returns:
+            bool: True if nothing is left to write.
+        """
+        with self.queue.all_tasks_done:
+            return self.queue.all_tasks_done.wait_for(lambda: not self.queue.unfinished_tasks, timeout)
+
+    def stats(self):
+        """
+        Return row counters.
+
+        Returns:
+            dict: queued, written, dropped (queue full), failed (insert error),
+            batches and pending.
+        """
+        with self._lock:
+            return dict(self._stats, pending=self.queue.unfinished_tasks)
+
+    def _loop(self):
+        """Collect and write batches forever."""
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write(self, batch):
+        """Insert a batch: one executemany per (app, table, column set)."""
+        from sqlalchemy import insert
+        from app.core.extensions import db
+
+        groups = {}
+        for app, model, values in batch:
+            groups.setdefault((app, model, tuple(sorted(values))), []).append(values)
+
+        for (app, model, _), rows in groups.items():
+            try:
+                with app.app_context(), db.engine.begin() as connection:
+                    connection.execute(insert(model.__table__), rows)
+                outcome = 'written'
+            except Exception as e:
+                logger.warning(f"Failed to write {len(rows)} {model.__tablename__} row(s): {e}")
+                outcome = 'failed'
+            with self._lock:
+                self._stats[outcome] += len(rows)
+                self._stats['batches'] += 1
+
+
+_writer = TelemetryWriter()
+atexit.register(_writer.join, timeout=5.0)
+
+
+def get_telemetry_writer():
+    """
+    Get the process-wide telemetry writer.
+
+    Returns:
+        TelemetryWriter: The shared writer.
+    """
+    return _writer
+
+
+def enqueue_record(model, **values):
+    """
+    Queue a TelemetryLog / AIModelPerformance style row for the background writer.
+
+    Must be called inside an app context; the app is captured for the writer.
+    Event time columns the model has are stamped now (see ``EVENT_TIME_COLUMNS``).
+
+    Args:
+        model: Model class of the row.
+        **values: Column values.
+
+    Returns:
+        bool: False if the row was dropped because the queue is full.
+    """
+    from flask import current_app
+
+    now = datetime.datetime.utcnow()
+    columns = model.__table__.columns
+    for column in EVENT_TIME_COLUMNS:
+        if column in columns:
+            values.setdefault(column, now)
+    return _writer.submit(current_app._get_current_object(), model, values)
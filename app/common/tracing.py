@@ -0,0 +1,569 @@
+"""
+Tracing - per-request spans across routes, LLM calls, SQL, audio and the sandbox.
+
+The metrics at ``/metrics`` say how slow each component is on average, not
+why one particular request was slow. Each request now gets a trace: a root
+span started in a ``before_request`` hook and held in a ``ContextVar``, with
+child spans for ``call_llm``, every SQL statement (SQLAlchemy cursor events),
+TTS chunks, transcriptions and sandbox subprocesses.
+
+Traces slower than ``TRACE_SLOW_MS`` are kept in a small ring buffer shown at
+``/api/debug/traces`` (each user sees only their own requests) and, if
+``TRACE_EXPORT_PATH`` is set, appended to that file as OTLP/JSON lines (one
+``ExportTraceServiceRequest`` per trace), which an OpenTelemetry collector's
+file receiver can ingest. Fast traces are dropped when the request ends.
+
+Spans are only recorded inside a trace, so background threads (sync, writers,
+summary worker) pay a ``ContextVar`` lookup and nothing else.
+"""
+import os
+import json
+import time
+import logging
+import secrets
+import datetime
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+# Requests at least this slow are kept and exported (0 = all)
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", 500))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 50))
+# Spans past this are counted as dropped (e.g. a request issuing thousands of statements)
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 500))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+
+SQL_STATEMENT_MAX_CHARS = 500
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+# OTLP status codes
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+SERVICE_NAME = 'personal-guru'
+
+
+class _NoopSpan:
+    """Span handed out outside a trace or for a dropped span; ignores everything."""
+
+    def set_attribute(self, key, value):
+        """Ignore the attribute."""
+
+    def set_error(self, message):
+        """Ignore the error."""
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span = ContextVar('tracing_current_span', default=None)
+
+
+class Trace:
+    """Spans of one request."""
+
+    def __init__(self, max_spans):
+        """
+        Initializes an empty trace.
+
+        Args:
+            max_spans (int): Spans recorded before further spans are dropped.
+        """
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self.max_spans = max_spans
+        self.dropped = 0
+        self.finished = False
+
+    @property
+    def root(self):
+        """The request's root span."""
+        return self.spans[0]
+
+    @property
+    def duration_ms(self):
+        """Duration of the root span in milliseconds."""
+        return self.root.duration_ms
+
+    def to_dict(self):
+        """
+        Summarize the trace for the debug endpoint.
+
+        Returns:
+            dict: trace_id, name, start, duration_ms, status, dropped_spans and
+            spans with offsets (ms) relative to the request start.
+        """
+        root = self.root
+        return {
+            'trace_id': self.trace_id,
+            'name': root.name,
+            'start': datetime.datetime.fromtimestamp(
+                root.start_ns / 1e9, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'duration_ms': round(root.duration_ms, 3),
+            'status': 'error' if root.status == STATUS_ERROR else 'ok',
+            'dropped_spans': self.dropped,
+            'spans': [span.to_dict(root.start_ns) for span in self.spans],
+        }
+
+    def to_otlp(self):
+        """
+        Encode the trace as an OTLP/JSON ``ExportTraceServiceRequest``.
+
+        Returns:
+            dict: resourceSpans with one scope holding every span.
+        """
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': _otlp_attributes({'service.name': SERVICE_NAME})},
+                'scopeSpans': [{
+                    'scope': {'name': __name__},
+                    'spans': [span.to_otlp() for span in self.spans],
+                }],
+            }],
+        }
+
+
+class Span:
+    """One timed operation within a trace."""
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'attributes',
+                 'start_ns', 'end_ns', 'status', 'status_message')
+
+    def __init__(self, trace, name, parent=None, kind=KIND_INTERNAL, attributes=None):
+        """
+        Starts the span now.
+
+        Args:
+            trace (Trace): Trace the span belongs to.
+            name (str): Operation name.
+            parent (Span, optional): Enclosing span; None for the root.
+            kind (int): OTLP span kind.
+            attributes (dict, optional): Initial attributes.
+        """
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = STATUS_UNSET
+        self.status_message = None
+
+    @property
+    def duration_ms(self):
+        """Duration in milliseconds (so far, if the span is still open)."""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def set_attribute(self, key, value):
+        """
+        Set an attribute; None values are skipped.
+
+        Args:
+            key (str): Attribute name (OpenTelemetry semantic names where one exists).
+            value: str, bool, int or float.
+        """
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_error(self, message):
+        """
+        Mark the span as failed.
+
+        Args:
+            message (str): Error description.
+        """
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    def end(self):
+        """Stop the span's clock (idempotent)."""
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    def to_dict(self, origin_ns):
+        """
+        Summarize the span for the debug endpoint.
+
+        Args:
+            origin_ns (int): Trace start, the zero of ``offset_ms``.
+
+        Returns:
+            dict: span_id, parent_id, name, offset_ms, duration_ms, status, attributes.
+        """
+        return {
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'offset_ms': round((self.start_ns - origin_ns) / 1e6, 3),
+            'duration_ms': round(self.duration_ms, 3),
+            'status': 'error' if self.status == STATUS_ERROR else 'ok',
+            'error': self.status_message,
+            'attributes': dict(self.attributes),
+        }
+
+    def to_otlp(self):
+        """
+        Encode the span as an OTLP/JSON span.
+
+        Returns:
+            dict: Span with hex ids and nanosecond timestamps as strings.
+        """
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or self.start_ns),
+            'attributes': _otlp_attributes(self.attributes),
+            'status': {'code': self.status},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.status_message:
+            span['status']['message'] = self.status_message
+        return span
+
+
+def _otlp_attributes(attributes):
+    """Encode attributes as OTLP/JSON key/value pairs."""
+    encoded = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            typed = {'boolValue': value}
+        elif isinstance(value, int):
+            typed = {'intValue': str(value)}
+        elif isinstance(value, float):
+            typed = {'doubleValue': value}
+        else:
+            typed = {'stringValue': str(value)}
+        encoded.append({'key': key, 'value': typed})
+    return encoded
+
+
+def current_span():
+    """
+    Get the innermost open span of this context.
+
+    Returns:
+        Span: The span, or ``NOOP_SPAN`` outside a trace or inside a dropped span.
+    """
+    return _current_span.get() or NOOP_SPAN
+
+
+def _child_span(name, kind, attributes):
+    """Start a child of the current span, or return None outside a trace (or when full)."""
+    parent = _current_span.get()
+    if parent is None or parent is NOOP_SPAN or parent.trace.finished:
+        return None
+    trace = parent.trace
+    if len(trace.spans) >= trace.max_spans:
+        trace.dropped += 1
+        return None
+    child = Span(trace, name, parent, kind, attributes)
+    trace.spans.append(child)
+    return child
+
+
+@contextmanager
+def span(name, kind=KIND_INTERNAL, **attributes):
+    """
+    Time the ``with`` block as a child of the current span.
+
+    Outside a trace nothing is recorded and ``NOOP_SPAN`` is yielded; the
+    same goes for a trace that is full, whose nested spans are then dropped
+    too. An exception marks the span as failed and propagates.
+
+    Args:
+        name (str): Operation name.
+        kind (int): OTLP span kind (``KIND_CLIENT`` for calls to other services).
+        **attributes: Initial attributes.
+
+    Yields:
+        Span: The open span.
+    """
+    if _current_span.get() is None:
+        yield NOOP_SPAN
+        return
+
+    child = _child_span(name, kind, attributes)
+    # A dropped span stays current as NOOP_SPAN so attributes don't land on its parent
+    token = _current_span.set(child or NOOP_SPAN)
+    try:
+        yield child or NOOP_SPAN
+    except BaseException as e:
+        if child is not None:
+            child.set_error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        if child is not None:
+            child.end()
+        _current_span.reset(token)
+
+
+def traced(name, kind=KIND_INTERNAL):
+    """
+    Decorator running each call of a function in a child span.
+
+    Args:
+        name (str): Operation name.
+        kind (int): OTLP span kind.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Tracer:
+    """Starts and finishes traces, keeps the slow ones and exports them."""
+
+    def __init__(self, slow_ms=TRACE_SLOW_MS, buffer_size=TRACE_BUFFER_SIZE,
+                 export_path=TRACE_EXPORT_PATH, max_spans=TRACE_MAX_SPANS):
+        """
+        Initializes an empty ring buffer.
+
+        Args:
+            slow_ms (float): Traces at least this long are kept and exported.
+            buffer_size (int): Slow traces kept in memory.
+            export_path (str): OTLP/JSON lines file; empty disables the export.
+            max_spans (int): Spans recorded per trace.
+        """
+        self.slow_ms = slow_ms
+        self.export_path = export_path
+        self.max_spans = max_spans
+        self._slow = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._stats = {'traces': 0, 'slow': 0, 'exported': 0, 'export_errors': 0}
+
+    def start(self, name, kind=KIND_SERVER, **attributes):
+        """
+        Start a trace and make its root span current.
+
+        Args:
+            name (str): Root span name.
+            kind (int): OTLP span kind of the root.
+            **attributes: Root span attributes.
+
+        Returns:
+            tuple: (root Span, context token for ``finish``).
+        """
+        trace = Trace(self.max_spans)
+        root = Span(trace, name, kind=kind, attributes=attributes)
+        trace.spans.append(root)
+        return root, _current_span.set(root)
+
+    def finish(self, root, token, error=None):
+        """
+        End a trace, restore the previous context and keep it if it was slow.
+
+        Args:
+            root (Span): Root span from ``start``.
+            token: Context token from ``start``.
+            error (BaseException, optional): Unhandled exception of the request.
+        """
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Finished from another context; just clear this one
+            _current_span.set(None)
+
+        if error is not None:
+            root.set_error(f"{type(error).__name__}: {error}")
+        root.end()
+        trace = root.trace
+        trace.finished = True
+
+        slow = trace.duration_ms >= self.slow_ms
+        with self._lock:
+            self._stats['traces'] += 1
+            if slow:
+                self._stats['slow'] += 1
+                self._slow.append(trace)
+        if slow and self.export_path:
+            self._export(trace)
+
+    def _export(self, trace):
+        """Append the trace to the export file as one OTLP/JSON line."""
+        line = json.dumps(trace.to_otlp(), separators=(',', ':')) + '\n'
+        try:
+            with self._export_lock:
+                directory = os.path.dirname(self.export_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.export_path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            outcome = 'exported'
+        except OSError as e:
+            logger.warning(f"Trace export to {self.export_path} failed: {e}")
+            outcome = 'export_errors'
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def recent(self, limit=None, user_id=None):
+        """
+        List the slow traces kept in the ring buffer.
+
+        Args:
+            limit (int, optional): Return at most this many.
+            user_id (str, optional): Only traces whose root span records this
+                ``enduser.id``; the buffer holds every user's requests.
+
+        Returns:
+            list: ``Trace.to_dict()`` summaries, newest first.
+        """
+        with self._lock:
+            traces = list(self._slow)[::-1]
+        if user_id is not None:
+            traces = [t for t in traces if t.root.attributes.get('enduser.id') == user_id]
+        if limit is not None:
+            traces = traces[:limit]
+        return [trace.to_dict() for trace in traces]
+
+    def stats(self):
+        """
+        Return tracing counters.
+
+        Returns:
+            dict: traces finished, slow traces kept, exported and export_errors,
+            plus the threshold and buffer size.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['buffered'] = len(self._slow)
+        stats['slow_ms'] = self.slow_ms
+        stats['buffer_size'] = self._slow.maxlen
+        stats['export_path'] = self.export_path or None
+        return stats
+
+
+_tracer = Tracer()
+
+
+def get_tracer():
+    """
+    Get the process-wide tracer.
+
+    Returns:
+        Tracer: The shared tracer.
+    """
+    return _tracer
+
+
+# --- SQL statement spans ---
+
+_listening = False
+_listening_lock = threading.Lock()
+
+
+def _before_statement(conn, cursor, statement, parameters, context, executemany):
+    """SQLAlchemy ``before_cursor_execute`` hook: open a span for the statement."""
+    words = statement.split(None, 1)
+    child = _child_span(words[0].upper() if words else 'SQL', KIND_CLIENT, {
+        'db.system': conn.dialect.name,
+        'db.statement': statement[:SQL_STATEMENT_MAX_CHARS],
+    })
+    if child is not None and executemany:
+        child.set_attribute('db.executemany', True)
+    # Pushed even when None so the after/error hooks always pop their own entry
+    conn.info.setdefault('tracing_spans', []).append(child)
+
+
+def _after_statement(conn, cursor, statement, parameters, context, executemany):
+    """SQLAlchemy ``after_cursor_execute`` hook: close the statement's span."""
+    stack = conn.info.get('tracing_spans')
+    child = stack.pop() if stack else None
+    if child is not None:
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            child.set_attribute('db.rowcount', cursor.rowcount)
+        child.end()
+
+
+def _statement_failed(exception_context):
+    """SQLAlchemy ``handle_error`` hook: close the failed statement's span as an error."""
+    conn = exception_context.connection
+    stack = conn.info.get('tracing_spans') if conn is not None else None
+    child = stack.pop() if stack else None
+    if child is not None:
+        error = exception_context.original_exception
+        child.set_error(f"{type(error).__name__}: {error}")
+        child.end()
+
+
+def _listen_for_statements():
+    """Install the statement hooks on all engines, once per process."""
+    global _listening
+    if _listening:
+        return
+    with _listening_lock:
+        if not _listening:
+            from sqlalchemy import event
+            from sqlalchemy.engine import Engine
+            event.listen(Engine, 'before_cursor_execute', _before_statement)
+            event.listen(Engine, 'after_cursor_execute', _after_statement)
+            event.listen(Engine, 'handle_error', _statement_failed)
+            _listening = True
+
+
+# --- Flask integration ---
+
+def init_app(app):
+    """
+    Trace every request of an app (unless ``TRACE_ENABLED`` is false).
+
+    Register before other ``before_request`` hooks so their time is included.
+
+    Args:
+        app: Flask application.
+    """
+    if not TRACE_ENABLED:
+        return
+
+    from flask import g, request
+    from flask_login import current_user
+
+    _listen_for_statements()
+    tracer = get_tracer()
+
+    @app.before_request
+    def start_request_trace():
+        if request.endpoint == 'static':
+            return
+        rule = request.url_rule.rule if request.url_rule else request.path
+        g.trace_root = tracer.start(
+            f"{request.method} {rule}",
+            **{'http.method': request.method, 'http.route': rule, 'http.target': request.path})
+
+    @app.after_request
+    def record_response_status(response):
+        trace_root = g.get('trace_root')
+        if trace_root is not None:
+            root = trace_root[0]
+            root.set_attribute('http.status_code', response.status_code)
+            # Owner of the trace, so /api/debug/traces only shows users their own requests
+            if current_user and current_user.is_authenticated:
+                root.set_attribute('enduser.id', current_user.userid)
+            if response.status_code >= 500:
+                root.set_error(f"HTTP {response.status_code}")
+            response.headers.setdefault('X-Trace-Id', root.trace.trace_id)
+        return response
+
+    @app.teardown_request
+    def finish_request_trace(error=None):
+        trace_root = g.pop('trace_root', None)
+        if trace_root is not None:
+            tracer.finish(*trace_root, error=error)
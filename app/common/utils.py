@@ -7,6 +7,8 @@ import tempfile
 import subprocess
 import logging
 import platform
+import threading
+import weakref
 import psutil
 from datetime import datetime
 from dotenv import load_dotenv
@@ -18,6 +20,18 @@ from app.core.exceptions import (
     QuizValidationError,
     STTError
 )
+from app.common.llm_transport import (
+    get_llm_transport,
+    get_llm_breaker,
+    get_retry_policy,
+    post_with_resilience,
+    LLM_CONNECT_TIMEOUT,
+    LLM_READ_TIMEOUT
+)
+from app.common.llm_backends import get_backend_pool, route_for_task
+from app.common.llm_cache import get_llm_cache, get_single_flight, make_cache_key
+from app.common.llm_scheduler import get_llm_scheduler, lane_for_task
+from app.common import metrics, tracing
 
 logger = logging.getLogger(__name__)
 
@@ -40,12 +54,356 @@ TTS_VOICE_PODCAST_GUEST = os.getenv("TTS_VOICE_PODCAST_GUEST", "am_michael")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "not-required")
 
 
-def call_llm(prompt_or_messages, is_json=False):
+class StreamingTagFilter:
+    """
+    Incrementally removes ``<tag>...</tag>`` blocks from streamed text.
+
+    Tags may be split across chunks, so any trailing text that could be the
+    start of an opening/closing tag is held back until the next chunk.
+    """
+
+    def __init__(self, tag='think'):
+        """
+        Initializes the filter.
+
+        Args:
+            tag (str): Name of the tag whose blocks should be removed.
+        """
+        self.open_tag = f"<{tag}>"
+        self.close_tag = f"</{tag}>"
+        self._buffer = ""
+        self._inside = False
+
+    @staticmethod
+    def _partial_suffix_len(text, tag):
+        """Length of the longest suffix of ``text`` that is a proper prefix of ``tag``."""
+        for k in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:k]):
+                return k
+        return 0
+
+    def feed(self, text):
+        """
+        Feed a chunk of text and return the part that is safe to emit.
+
+        Args:
+            text (str): The next chunk of streamed text.
+
+        Returns:
+            str: Visible text with tagged blocks removed.
+        """
+        self._buffer += text
+        out = []
+        while self._buffer:
+            tag = self.close_tag if self._inside else self.open_tag
+            idx = self._buffer.find(tag)
+            if idx == -1:
+                keep = self._partial_suffix_len(self._buffer, tag)
+                if not self._inside:
+                    out.append(self._buffer[:len(self._buffer) - keep])
+                self._buffer = self._buffer[len(self._buffer) - keep:] if keep else ""
+                break
+            if not self._inside:
+                out.append(self._buffer[:idx])
+            self._buffer = self._buffer[idx + len(tag):]
+            self._inside = not self._inside
+        return "".join(out)
+
+    def flush(self):
+        """
+        Return any held-back text at the end of the stream.
+
+        Returns:
+            str: Remaining visible text (an unterminated block is dropped).
+        """
+        rest = "" if self._inside else self._buffer
+        self._buffer = ""
+        return rest
+
+
+def _log_model_performance(model_type, model_name, latency_ms, input_tokens, output_tokens):
+    """
+    Queue an AIModelPerformance row for the current user (best effort).
+
+    The row is written by the background telemetry writer, so this neither
+    blocks on the database nor touches the caller's session.
+    """
+    try:
+        # Local imports to avoid circular dependency
+        from app.core.models import AIModelPerformance
+        from app.common.telemetry_writer import enqueue_record
+        from flask_login import current_user
+
+        # Only log if user is authenticated and we are in a request context
+        if current_user and current_user.is_authenticated:
+            enqueue_record(
+                AIModelPerformance,
+                user_id=current_user.userid,
+                model_type=model_type,
+                model_name=model_name,
+                latency_ms=latency_ms,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens
+            )
+
+    except Exception as e:
+        # We catch generic exception because this is non-critical logging
+        # and we don't want to fail the model call if it cannot be queued
+        # (e.g. if outside of app context)
+        logger.warning(f"Failed to log {model_type} performance: {e}")
+
+
+def _log_llm_performance(model_name, latency_ms, input_tokens, output_tokens):
+    """Queue an AIModelPerformance row for an LLM call (best effort)."""
+    _log_model_performance('LLM', model_name, latency_ms, input_tokens, output_tokens)
+
+
+class _ReleaseOnce:
+    """Idempotent wrapper so a scheduler slot is released exactly once."""
+
+    def __init__(self, release):
+        """
+        Initializes the wrapper.
+
+        Args:
+            release (callable): Function freeing the slot.
+        """
+        self._release = release
+        self._lock = threading.Lock()
+        self._done = False
+
+    def __call__(self):
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+        self._release()
+
+
+def _current_user_id():
+    """Return the logged-in user's id, or None outside an authenticated request."""
+    try:
+        from flask_login import current_user
+        if current_user and current_user.is_authenticated:
+            return current_user.userid
+    except Exception:
+        pass
+    return None
+
+
+def _record_llm_call(task, backend, outcome, seconds=None, input_tokens=0, output_tokens=0):
+    """Update the LLM request, latency and token metrics for one completion."""
+    metrics.LLM_REQUESTS.inc(task=task, backend=backend, outcome=outcome)
+    if seconds is not None:
+        metrics.LLM_REQUEST_SECONDS.observe(seconds, task=task, backend=backend)
+    if input_tokens:
+        metrics.LLM_TOKENS.inc(input_tokens, task=task, backend=backend, direction='input')
+    if output_tokens:
+        metrics.LLM_TOKENS.inc(output_tokens, task=task, backend=backend, direction='output')
+
+
+def _iter_llm_stream(response, api_url, start_time, on_close=None, model_name=None,
+                     task='default', backend_name=''):
+    """
+    Yield content deltas from an OpenAI-compatible SSE completion stream.
+
+    ``<think>`` blocks are removed incrementally and leading whitespace is
+    dropped, matching what the non-streaming callers strip after the fact.
+    ``on_close`` is called once the stream ends, fails or is closed.
+    ``task`` and ``backend_name`` label the stream's metrics.
+
+    Raises:
+        LLMTimeoutError: If the stream stalls past the read timeout
+        LLMConnectionError: If the connection drops mid-stream
+        LLMResponseError: If a chunk cannot be parsed
+    """
+    think_filter = StreamingTagFilter('think')
+    usage = {}
+    started = False
+    outcome = 'ok'
+    # SSE responses usually omit a charset; the OpenAI protocol is UTF-8
+    response.encoding = 'utf-8'
+
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            payload = line[len('data:'):].strip()
+            if payload == '[DONE]':
+                break
+
+            chunk = json.loads(payload)
+            if chunk.get('usage'):
+                usage = chunk['usage']
+            choices = chunk.get('choices') or []
+            if not choices:
+                continue
+
+            text = think_filter.feed(choices[0].get('delta', {}).get('content') or '')
+            if not started:
+                text = text.lstrip()
+                started = bool(text)
+            if text:
+                yield text
+
+        tail = think_filter.flush()
+        if not started:
+            tail = tail.lstrip()
+        if tail:
+            yield tail
+
+    except requests.exceptions.Timeout as e:
+        logger.error(f"LLM stream timed out: {e}")
+        outcome = 'error'
+        raise LLMTimeoutError(
+            f"LLM stream stalled after {LLM_READ_TIMEOUT:g} seconds",
+            timeout=LLM_READ_TIMEOUT,
+            error_code="LLM011",
+            debug_info={"endpoint": api_url}
+        )
+    except requests.exceptions.RequestException as e:
+        logger.error(f"LLM stream interrupted: {e}")
+        outcome = 'error'
+        raise LLMConnectionError(
+            "Connection to LLM service lost while streaming",
+            endpoint=api_url,
+            error_code="LLM012",
+            debug_info={"original_error": str(e)}
+        )
+    except (json.JSONDecodeError, KeyError, IndexError, AttributeError) as e:
+        logger.error(f"Invalid LLM stream chunk: {e}")
+        outcome = 'error'
+        raise LLMResponseError(
+            "LLM stream has unexpected structure",
+            error_code="LLM014",
+            debug_info={"error": str(e)}
+        )
+    finally:
+        response.close()
+        if on_close:
+            on_close()
+        elapsed = time.time() - start_time
+        _record_llm_call(task, backend_name, outcome, elapsed,
+                         usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+        _log_llm_performance(
+            model_name or LLM_MODEL_NAME,
+            int(elapsed * 1000),
+            usage.get('prompt_tokens', 0),
+            usage.get('completion_tokens', 0))
+
+
+def sse_event(data, event=None):
+    """
+    Format a Server-Sent Event frame.
+
+    Args:
+        data: JSON-serialisable payload.
+        event (str, optional): Event name; omitted for the default 'message' event.
+
+    Returns:
+        str: The encoded SSE frame.
+    """
+    frame = f"event: {event}\n" if event else ""
+    return f"{frame}data: {json.dumps(data)}\n\n"
+
+
+def sse_response(events):
+    """
+    Wrap a generator of SSE frames in a streaming Flask response.
+
+    The generator runs inside the request context, so it may use
+    ``current_user`` and the database session.
+    """
+    from flask import Response, stream_with_context
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # Disable proxy buffering (nginx) so deltas reach the client immediately
+            'X-Accel-Buffering': 'no'
+        })
+
+
+def _parse_json_content(content):
+    """
+    Parse a JSON object out of an LLM completion.
+
+    Raises:
+        LLMResponseError: If no JSON object can be extracted
+    """
+    # The content is a string of JSON, so parse it
+    # Sometimes LLMs wrap in markdown code blocks
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
+
+    try:
+        # First, try to parse the entire content as JSON
+        return json.loads(content)
+    except json.JSONDecodeError:
+        # If that fails, try to find a JSON object embedded in the text
+        logger.warning(
+            "Failed to parse content directly, attempting to extract JSON object.")
+        try:
+            # Regex to find a JSON object within the text.
+            match = re.search(r'\{.*\}', content, re.DOTALL)
+            if match:
+                json_str = match.group(0)
+                return json.loads(json_str)
+        except json.JSONDecodeError:
+            pass
+
+        # Parsing failed
+        raise LLMResponseError(
+            "Failed to parse JSON from LLM response",
+            error_code="LLM010",
+            debug_info={"content_preview": content[:200]}
+        )
+
+
+def get_llm_backends():
+    """
+    Get the pool of LLM backends ``call_llm`` balances across.
+
+    Returns:
+        BackendPool | None: ``LLM_BACKENDS`` if configured, else a single backend
+        from ``LLM_BASE_URL``/``LLM_MODEL_NAME``; None if neither is set.
+    """
+    return get_backend_pool(LLM_BASE_URL, LLM_MODEL_NAME, LLM_API_KEY, get_llm_breaker())
+
+
+def chat_model_name():
+    """
+    Name of the model chat prompts are sent to (used to pick the context budget).
+
+    Returns:
+        str: The 'chat' route's model, else LLM_MODEL_NAME.
+    """
+    return route_for_task('chat').get('model') or LLM_MODEL_NAME
+
+
+@tracing.traced('call_llm', kind=tracing.KIND_CLIENT)
+def call_llm(prompt_or_messages, is_json=False, stream=False, task=None, cache=True):
     """
     A helper function to call the LLM API using OpenAI-compatible protocol.
     Works with OpenAI, Ollama, LMStudio, VLLM, etc.
     Accepts specific 'messages' list for chat history or a simple string 'prompt'.
 
+    With ``stream=True`` the request is sent immediately (so connection errors
+    still raise here) and a generator of text deltas is returned, with
+    ``<think>`` blocks already stripped. ``is_json`` is ignored when streaming.
+
+    ``task`` names the prompt type. Deterministic types (see
+    ``app.common.llm_cache.CACHE_TTLS``) are served from the response cache;
+    pass ``cache=False`` to force a fresh completion.
+
+    ``task`` also selects the route (model, backends, max_tokens, temperature)
+    from ``app.common.llm_backends.TASK_ROUTES``. Requests go to the
+    least-loaded healthy backend of ``get_llm_backends()`` and fail over to the
+    next one on connection errors.
+
     Raises:
         MissingConfigError: If LLM environment variables are not set
         LLMConnectionError: If cannot connect to LLM service
@@ -54,7 +412,8 @@ def call_llm(prompt_or_messages, is_json=False):
     """
     logger = logging.getLogger(__name__)
 
-    if not LLM_BASE_URL or not LLM_MODEL_NAME:
+    pool = get_llm_backends()
+    if pool is None:
         raise MissingConfigError(
             "LLM configuration missing",
             missing_vars=[
@@ -63,46 +422,48 @@ def call_llm(prompt_or_messages, is_json=False):
                     'LLM_MODEL_NAME'] if not os.getenv(v)],
             error_code="CFG010")
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {LLM_API_KEY}"
-    }
+    # Per-task overrides (utility model, dedicated backends, max_tokens, temperature)
+    route = route_for_task(task)
+    route_model = route.get('model')
+    route_backends = route.get('backends')
 
-    # Ensure the endpoint targets the chat completion path if not provided
-    # Standard OpenAI base is like 'https://api.openai.com/v1'
-    # Users might provide 'http://localhost:11434/v1' or just 'http://localhost:11434'
-    # We will try to be smart or strictly follow a convention.
-    # Convention: LLM_BASE_URL should be the base URL ending in /v1 (or similar root).
-    # We append /chat/completions.
-
-    # However, to be robust against trailing slashes:
-    base_url = LLM_BASE_URL.rstrip('/')
-    if not base_url.endswith('/v1'):
-        # some users might just put the host.
-        # For ollama: http://localhost:11434/v1/chat/completions is valid.
-        # IF user put http://localhost:11434, we might need to append /v1 if it's missing?
-        # Let's assume the user follows the instruction to provide base url.
-        # But commonly for ollama, they might forget.
-        if "11434" in base_url and "/v1" not in base_url:
-            base_url += "/v1"
-
-    api_url = f"{base_url}/chat/completions"
+    # Logical model name (cache key); individual backends may serve it under their own name
+    model_name = route_model or LLM_MODEL_NAME or pool.backends[0].model
+    api_url = pool.backends[0].chat_url
+    task_label = task or 'default'
+    # Streams: the span ends once the response headers arrived and the generator is returned
+    llm_span = tracing.current_span()
+    llm_span.set_attribute('llm.task', task_label)
+    llm_span.set_attribute('llm.stream', stream)
 
     try:
-        start_time = time.time()
-        print(f"Calling LLM: {api_url}")
-
         if isinstance(prompt_or_messages, list):
             messages = prompt_or_messages
         else:
             messages = [{"role": "user", "content": prompt_or_messages}]
 
         data = {
-            "model": LLM_MODEL_NAME,
+            "model": model_name,
             "messages": messages,
-            "temperature": 0.7,
-            "max_tokens": LLM_MAX_OUTPUT_TOKENS,
+            "temperature": route.get('temperature', 0.7),
+            "max_tokens": route.get('max_tokens', LLM_MAX_OUTPUT_TOKENS),
         }
+        if stream:
+            data["stream"] = True
+
+        # Identical requests share a key for both the response cache and single-flight
+        request_key = make_cache_key(model_name, messages, data["temperature"], is_json)
+
+        # Response cache: only for deterministic prompt types (see llm_cache.CACHE_TTLS)
+        llm_cache = get_llm_cache() if cache and not stream else None
+        cacheable = bool(llm_cache) and llm_cache.ttl_for(task) > 0
+        if cacheable:
+            hit, cached = llm_cache.get(request_key)
+            if hit:
+                logger.debug(f"LLM cache hit for task '{task}'")
+                metrics.LLM_REQUESTS.inc(task=task_label, backend='', outcome='cached')
+                llm_span.set_attribute('llm.cached', True)
+                return cached
 
         # Note: Ollama via OpenAI-compat supports 'json_object' in recent versions.
         # But standard prompt engineering is safer for broader compatibility
@@ -113,110 +474,144 @@ def call_llm(prompt_or_messages, is_json=False):
             # data["response_format"] = {"type": "json_object"}
             pass
 
-        response = requests.post(
-            api_url,
-            headers=headers,
-            json=data,
-            timeout=300)
+        def post(backend, model):
+            print(f"Calling LLM: {backend.chat_url}")
+            # Retries transient failures; fails fast (LLM016) while the circuit is open
+            response = post_with_resilience(
+                get_llm_transport(),
+                backend.chat_url,
+                backend.breaker,
+                get_retry_policy(),
+                headers=backend.headers(),
+                json=dict(data, model=model),
+                timeout=(LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT),
+                stream=stream)
+
+            # Check specifically for model not found (404 from Ollama often means this)
+            if response.status_code == 404:
+                try:
+                    err_body = response.json()
+                    if "model" in err_body.get('error', {}).get('message', '').lower():
+                        logger.error(f"Model not found: {model}")
+                        raise LLMConnectionError(
+                            f"Model '{model}' not found. Please pull it first.",
+                            endpoint=backend.chat_url,
+                            error_code="LLM015", # New code for Model Not Found
+                            debug_info={"model": model, "backend": backend.name}
+                        )
+                except (json.JSONDecodeError, AttributeError):
+                    pass
 
-        # Check specifically for model not found (404 from Ollama often means this)
-        if response.status_code == 404:
-            try:
-                err_body = response.json()
-                if "model" in err_body.get('error', {}).get('message', '').lower():
-                    logger.error(f"Model not found: {LLM_MODEL_NAME}")
+            response.raise_for_status()
+            return response
+
+        def dispatch():
+            """Send to the least-loaded healthy backend, failing over on connection errors."""
+            nonlocal api_url
+            tried = []
+            last_error = None
+            while True:
+                backend = pool.acquire(exclude=tried, names=route_backends)
+                if backend is None:
+                    if last_error is not None:
+                        raise last_error
                     raise LLMConnectionError(
-                        f"Model '{LLM_MODEL_NAME}' not found. Please pull it first.",
+                        "All LLM backends are unavailable; please retry shortly",
                         endpoint=api_url,
-                        error_code="LLM015", # New code for Model Not Found
-                        debug_info={"model": LLM_MODEL_NAME}
+                        error_code="LLM016",
+                        debug_info={"backends": pool.stats()}
                     )
-            except (json.JSONDecodeError, AttributeError):
-                pass
-
-        response.raise_for_status()
-
-        response_json = response.json()
-        content = response_json['choices'][0]['message']['content']
-
-        # Calculate latency
-        end_time = time.time()
-        latency_ms = int((end_time - start_time) * 1000)
+                api_url = backend.chat_url
+                model = route_model or backend.model
+                llm_span.set_attribute('llm.backend', backend.name)
+                llm_span.set_attribute('llm.model', model)
+                try:
+                    return backend, model, post(backend, model)
+                except (requests.exceptions.ConnectionError, LLMConnectionError) as e:
+                    pool.release(backend)
+                    _record_llm_call(task_label, backend.name, 'error')
+                    # Fail over on unreachable or circuit-open backends only (not e.g. model missing)
+                    if isinstance(e, LLMConnectionError) and e.error_code != "LLM016":
+                        raise
+                    tried.append(backend)
+                    last_error = e
+                    if len(tried) < pool.count(route_backends):
+                        logger.warning(f"LLM backend '{backend.name}' unreachable, failing over: {e}")
+                except BaseException:
+                    pool.release(backend)
+                    _record_llm_call(task_label, backend.name, 'error')
+                    raise
+
+        # Admission control: global cap, priority lane by task, fair across users
+        scheduler = get_llm_scheduler()
+        lane = lane_for_task(task)
+        user_id = _current_user_id()
+
+        if stream:
+            # The slot is held until the stream is exhausted, closed or discarded
+            wait = scheduler.acquire(lane, user_id)
+            metrics.LLM_QUEUE_SECONDS.observe(wait, task=task_label, lane=lane)
+            llm_span.set_attribute('llm.queue_ms', round(wait * 1000, 3))
+            release = _ReleaseOnce(scheduler.release)
+            try:
+                start_time = time.time()
+                backend, model, response = dispatch()
+            except BaseException:
+                release()
+                raise
+            release = _ReleaseOnce(lambda: (pool.release(backend), scheduler.release()))
+            deltas = _iter_llm_stream(
+                response, backend.chat_url, start_time, on_close=release, model_name=model,
+                task=task_label, backend_name=backend.name)
+            weakref.finalize(deltas, release)
+            return deltas
+
+        def fetch():
+            with scheduler.slot(lane, user_id) as wait:
+                metrics.LLM_QUEUE_SECONDS.observe(wait, task=task_label, lane=lane)
+                llm_span.set_attribute('llm.queue_ms', round(wait * 1000, 3))
+                start_time = time.time()
+                backend, model, response = dispatch()
+                try:
+                    response_json = response.json()
+                finally:
+                    pool.release(backend)
+                end_time = time.time()
+            content = response_json['choices'][0]['message']['content']
 
-        # Extract token usage if available
-        usage = response_json.get('usage', {})
-        input_tokens = usage.get('prompt_tokens', 0)
-        output_tokens = usage.get('completion_tokens', 0)
+            # Calculate latency
+            latency_ms = int((end_time - start_time) * 1000)
 
-        logger.debug(f"LLM Response received: {len(content)} characters. Latency: {latency_ms}ms")
+            # Extract token usage if available
+            usage = response_json.get('usage', {})
+            input_tokens = usage.get('prompt_tokens', 0)
+            output_tokens = usage.get('completion_tokens', 0)
+            llm_span.set_attribute('llm.input_tokens', input_tokens)
+            llm_span.set_attribute('llm.output_tokens', output_tokens)
 
-        # Database Logging Hook
-        try:
-            # Local imports to avoid circular dependency
-            from app.core.extensions import db
-            from app.core.models import AIModelPerformance
-            from flask_login import current_user
-
-            # Only log if user is authenticated and we are in a request context
-            if current_user and current_user.is_authenticated:
-                perf_log = AIModelPerformance(
-                    user_id=current_user.userid,
-                    model_type='LLM',
-                    model_name=LLM_MODEL_NAME,
-                    latency_ms=latency_ms,
-                    input_tokens=input_tokens,
-                    output_tokens=output_tokens
-                )
-                db.session.add(perf_log)
-                db.session.commit()
-                logger.debug("Logged AI performance metrics to database.")
+            logger.debug(f"LLM Response received: {len(content)} characters. Latency: {latency_ms}ms")
 
-        except Exception as db_err:
-            # We catch generic exception because this is non-critical logging
-            # and we don't want to fail the LLM call if DB logging fails
-            # (e.g. if outside of app context or db lock)
-            logger.warning(f"Failed to log AI performance: {db_err}")
+            # Metrics and Database Logging Hooks
+            _record_llm_call(task_label, backend.name, 'ok', end_time - start_time, input_tokens, output_tokens)
+            _log_llm_performance(model, latency_ms, input_tokens, output_tokens)
 
-        if is_json:
-            # The content is a string of JSON, so parse it
-            # Sometimes LLMs wrap in markdown code blocks
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
+            result = _parse_json_content(content) if is_json else content
+            if cacheable:
+                llm_cache.set(request_key, result, task, model)
+            return result
 
-            try:
-                # First, try to parse the entire content as JSON
-                return json.loads(content)
-            except json.JSONDecodeError:
-                # If that fails, try to find a JSON object embedded in the text
-                logger.warning(
-                    "Failed to parse content directly, attempting to extract JSON object.")
-                try:
-                    # Regex to find a JSON object within the text.
-                    match = re.search(r'\{.*\}', content, re.DOTALL)
-                    if match:
-                        json_str = match.group(0)
-                        return json.loads(json_str)
-                except json.JSONDecodeError:
-                    pass
-
-                # Parsing failed
-                raise LLMResponseError(
-                    "Failed to parse JSON from LLM response",
-                    error_code="LLM010",
-                    debug_info={"content_preview": content[:200]}
-                )
-
-        return content
+        # Concurrent identical requests (double clicks, two tabs) share one upstream call
+        return get_single_flight().do(request_key, fetch)
 
     except requests.exceptions.Timeout as e:
         logger.error(f"LLM request timed out: {e}")
+        is_connect = isinstance(e, requests.exceptions.ConnectTimeout)
+        timeout = LLM_CONNECT_TIMEOUT if is_connect else LLM_READ_TIMEOUT
         raise LLMTimeoutError(
-            "Request to LLM timed out after 300 seconds",
-            timeout=300,
+            f"Request to LLM timed out after {timeout:g} seconds",
+            timeout=timeout,
             error_code="LLM011",
-            debug_info={"endpoint": api_url}
+            debug_info={"endpoint": api_url, "phase": "connect" if is_connect else "read"}
         )
     except requests.exceptions.ConnectionError as e:
         logger.error(f"Cannot connect to LLM: {e}")
@@ -357,6 +752,12 @@ def chunk_text(text, max_chars=300):
     return chunks
 
 
+def _tts_outcome(result):
+    """Outcome of a TTS helper from its return value (first item is falsy on failure)."""
+    return 'ok' if result[0] else 'error'
+
+
+@metrics.instrument(metrics.TTS_REQUESTS, outcome=_tts_outcome, operation='step')
 def generate_audio(text, step_index):
     """
     Generates audio from text using the configured TTS service.
@@ -397,7 +798,9 @@ def generate_audio(text, step_index):
             if not chunk.strip():
                 continue
 
-            result, sr = tts.generate(chunk)
+            with metrics.TTS_CHUNK_SECONDS.time(operation='step'), \
+                    tracing.span('tts.generate', tracing.KIND_CLIENT, operation='step', chars=len(chunk)):
+                result, sr = tts.generate(chunk)
 
             # Save segment to temp file
             fd, temp_path = tempfile.mkstemp(suffix=".wav")
@@ -480,26 +883,8 @@ def generate_audio(text, step_index):
                 os.remove(tf)
 
         # --- Logging Hook for TTS ---
-        try:
-            end_time = time.time()
-            latency_ms = int((end_time - start_time) * 1000)
-            from app.core.extensions import db
-            from app.core.models import AIModelPerformance
-            from flask_login import current_user
-
-            if current_user and current_user.is_authenticated:
-                perf_log = AIModelPerformance(
-                    user_id=current_user.userid,
-                    model_type='TTS',
-                    model_name=TTS_MODEL,
-                    latency_ms=latency_ms,
-                    input_tokens=len(text),
-                    output_tokens=0
-                )
-                db.session.add(perf_log)
-                db.session.commit()
-        except Exception as e:
-            logging.warning(f"Failed to log TTS performance: {e}")
+        latency_ms = int((time.time() - start_time) * 1000)
+        _log_model_performance('TTS', TTS_MODEL, latency_ms, len(text), 0)
 
         return f"step_{step_index}.wav", None
 
@@ -616,6 +1001,7 @@ def parse_podcast_script(transcript):
     return lines
 
 
+@metrics.instrument(metrics.TTS_REQUESTS, outcome=_tts_outcome, operation='podcast')
 def generate_podcast_audio(transcript, output_filename):
     """
     Generates a full podcast audio file from a transcript using the configured TTS service.
@@ -672,7 +1058,9 @@ def generate_podcast_audio(transcript, output_filename):
                 if not chunk.strip():
                     continue
 
-                result, sr = tts.generate(chunk, voice=voice)
+                with metrics.TTS_CHUNK_SECONDS.time(operation='podcast'), \
+                        tracing.span('tts.generate', tracing.KIND_CLIENT, operation='podcast', chars=len(chunk)):
+                    result, sr = tts.generate(chunk, voice=voice)
                 print(f"DEBUG: TTS Result Type: {type(result)}, chunk len: {len(chunk)}")
 
                 if isinstance(result, bytes):
@@ -744,29 +1132,10 @@ def generate_podcast_audio(transcript, output_filename):
             os.remove(list_file_path)
 
         # --- Logging Hook for Podcast TTS ---
-        try:
-            end_time = time.time()
-            latency_ms = int((end_time - start_time) * 1000)
-            from app.core.extensions import db
-            from app.core.models import AIModelPerformance
-            from flask_login import current_user
-
-            # Calculate approx input length from lines
-            total_chars = sum(len(txt) for _, txt in lines)
-
-            if current_user and current_user.is_authenticated:
-                perf_log = AIModelPerformance(
-                    user_id=current_user.userid,
-                    model_type='TTS',
-                    model_name=TTS_MODEL,
-                    latency_ms=latency_ms,
-                    input_tokens=total_chars,
-                    output_tokens=0
-                )
-                db.session.add(perf_log)
-                db.session.commit()
-        except Exception as e:
-            logging.warning(f"Failed to log Podcast TTS performance: {e}")
+        latency_ms = int((time.time() - start_time) * 1000)
+        # Approx input length from lines
+        total_chars = sum(len(txt) for _, txt in lines)
+        _log_model_performance('TTS', TTS_MODEL, latency_ms, total_chars, 0)
 
         return True, None
 
@@ -794,35 +1163,19 @@ def transcribe_audio(audio_file_path):
 
     try:
         stt = get_stt()
-        transcript = stt.transcribe(audio_file_path)
+        with tracing.span('stt.transcribe', tracing.KIND_CLIENT, bytes=os.path.getsize(audio_file_path)):
+            transcript = stt.transcribe(audio_file_path)
 
-        # --- Logging Hook for STT ---
-        try:
-            end_time = time.time()
-            latency_ms = int((end_time - start_time) * 1000)
-            from app.core.extensions import db
-            from app.core.models import AIModelPerformance
-            from flask_login import current_user
-
-            output_len = len(transcript) if transcript else 0
-
-            if current_user and current_user.is_authenticated:
-                perf_log = AIModelPerformance(
-                    user_id=current_user.userid,
-                    model_type='STT',
-                    model_name=STT_MODEL,
-                    latency_ms=latency_ms,
-                    input_tokens=0,
-                    output_tokens=output_len
-                )
-                db.session.add(perf_log)
-                db.session.commit()
-        except Exception as e:
-            logging.warning(f"Failed to log STT performance: {e}")
+        # --- Metrics and Logging Hooks for STT ---
+        elapsed = time.time() - start_time
+        metrics.STT_SECONDS.observe(elapsed)
+        metrics.STT_REQUESTS.inc(outcome='ok')
+        _log_model_performance('STT', STT_MODEL, int(elapsed * 1000), 0, len(transcript) if transcript else 0)
 
         return transcript
     except Exception as e:
         print(f"Error calling STT: {e}")
+        metrics.STT_REQUESTS.inc(outcome='error')
         raise STTError(f"Error calling STT: {e}")
 
 
@@ -845,7 +1198,7 @@ Text to summarize:
 {text}
 """
     try:
-        summary = call_llm(prompt)
+        summary = call_llm(prompt, task='summary')
         return summary.strip()
     except Exception as e:
         # Fallback if summarization fails: truncate or return original
@@ -859,17 +1212,22 @@ def log_telemetry(event_type: str, triggers: dict, payload: dict, installation_i
     Logs a telemetry event to the database.
     Fails silently on errors to avoid disrupting the user experience.
 
+    The event is queued for the background telemetry writer (see
+    ``app.common.telemetry_writer``) rather than committed on the request.
+
     Args:
         event_type (str): The type of event (e.g., 'user_login', 'quiz_submitted').
         triggers (dict): What triggered the event (e.g., {'source': 'web_ui', 'action': 'click'}).
         payload (dict): The data payload for the event.
-        installation_id (str, optional): The installation ID. If None, attempts to resolve from current_user or DB.
+        installation_id (str, optional): The installation ID. If None, attempts to resolve from
+            current_user or the cached installation identity.
     """
     import uuid
     from flask import session
     from flask_login import current_user
-    from app.core.extensions import db
-    from app.core.models import TelemetryLog, Installation
+    from app.core.models import TelemetryLog
+    from app.common.installation import get_installation_id
+    from app.common.telemetry_writer import enqueue_record
 
     logger = logging.getLogger(__name__)
 
@@ -884,10 +1242,8 @@ def log_telemetry(event_type: str, triggers: dict, payload: dict, installation_i
 
         # Resolve Installation ID (Non-Nullable)
         if not installation_id:
-            # Try to find any installation record (assuming single-tenant / personal use)
-            inst_record = Installation.query.first()
-            if inst_record:
-                installation_id = inst_record.installation_id
+            # The installation record (assuming single-tenant / personal use), cached per process
+            installation_id = get_installation_id()
 
         # If we still don't have an installation_id, we cannot log (Constraint Violation)
         if not installation_id:
@@ -900,7 +1256,8 @@ def log_telemetry(event_type: str, triggers: dict, payload: dict, installation_i
 
         session_id = session['telemetry_session_id']
 
-        log_entry = TelemetryLog(
+        queued = enqueue_record(
+            TelemetryLog,
             user_id=user_id,
             installation_id=installation_id,
             session_id=session_id,
@@ -908,10 +1265,7 @@ def log_telemetry(event_type: str, triggers: dict, payload: dict, installation_i
             triggers=triggers,
             payload=payload
         )
-
-        db.session.add(log_entry)
-        db.session.commit()
-        logger.debug(f"Telemetry logged: {event_type}")
+        logger.debug(f"Telemetry {'queued' if queued else 'dropped (queue full)'}: {event_type}")
 
     except Exception as e:
         # Log error but fail silently to avoid interrupting user flow
@@ -2,7 +2,7 @@ from app.core.extensions import db
 # from pgvector.sqlalchemy import Vector
 import datetime
 from sqlalchemy import JSON
-from sqlalchemy.orm import validates
+from sqlalchemy.orm import declared_attr, validates
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # UserMixin provides default implementations for the methods that Flask-Login expects user objects to have:
@@ -22,7 +22,25 @@ class SyncMixin:
     sync_status = db.Column(db.Text, default='pending', onupdate='pending', nullable=True)
 
 
-class Topic(TimestampMixin, SyncMixin, db.Model):
+class VersionMixin:
+    """
+    Mixin providing a version column for optimistic concurrency control.
+
+    The ORM adds the version to the WHERE clause of every UPDATE and DELETE
+    and increments it, so writing a row that another request changed since
+    it was read raises ``StaleDataError`` instead of overwriting that change.
+    Core UPDATE statements must increment it themselves.
+    """
+
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    @declared_attr.directive
+    def __mapper_args__(cls):
+        """Use ``version`` as the mapper's version counter."""
+        return {'version_id_col': cls.version}
+
+
+class Topic(TimestampMixin, SyncMixin, VersionMixin, db.Model):
     """User study topic with associated learning modes."""
 
     __tablename__ = 'topics'
@@ -34,6 +52,8 @@ class Topic(TimestampMixin, SyncMixin, db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('user_id', 'name', name='_user_topic_uc'),
+        # The home page lists a user's topics most recently modified first
+        db.Index('ix_topics_user_modified', 'user_id', 'modified_at', 'id'),
     )
 
     # Relationships
@@ -42,25 +62,57 @@ class Topic(TimestampMixin, SyncMixin, db.Model):
     flashcard_mode = db.relationship('FlashcardMode', back_populates='topic', cascade='all, delete-orphan')
     chat_mode = db.relationship('ChatMode', back_populates='topic', uselist=False, cascade='all, delete-orphan')
     plan_revisions = db.relationship('PlanRevision', back_populates='topic', uselist=True, cascade='all, delete-orphan')
+    chat_messages = db.relationship('ChatMessage', back_populates='topic', cascade='all, delete-orphan')
     login = db.relationship('Login', back_populates='topics')
 
-class ChatMode(TimestampMixin, SyncMixin, db.Model):
-    """Stores chat conversation history for a topic."""
+class ChatMode(TimestampMixin, SyncMixin, VersionMixin, db.Model):
+    """Stores the chat session of a topic (its messages are ChatMessage rows)."""
 
     __tablename__ = 'chat_mode'
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(100), db.ForeignKey('logins.userid'), nullable=False)
     topic_id = db.Column(db.Integer, db.ForeignKey('topics.id'), nullable=False, unique=True)
-    history = db.Column(JSON)
-    history_summary = db.Column(JSON)
-    popup_chat_history = db.Column(JSON)
     time_spent = db.Column(db.Integer, default=0) # Duration in seconds
 
     # Relationships
     topic = db.relationship('Topic', back_populates='chat_mode')
 
-class ChapterMode(TimestampMixin, SyncMixin, db.Model):
+class ChatMessage(TimestampMixin, SyncMixin, db.Model):
+    """One message of a chat thread; threads are append-only."""
+
+    __tablename__ = 'chat_messages'
+
+    # Channels
+    CHAT = 'chat'    # Chat mode conversation
+    POPUP = 'popup'  # Chat mode popup
+    STEP = 'step'    # Chapter step popup (step_id is set)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(100), db.ForeignKey('logins.userid'), nullable=False)
+    topic_id = db.Column(db.Integer, db.ForeignKey('topics.id'), nullable=False)
+    step_id = db.Column(db.Integer, db.ForeignKey('chapter_mode.id'), nullable=True)
+    channel = db.Column(db.String(20), nullable=False)
+    seq = db.Column(db.Integer, nullable=False) # Position in the thread
+    role = db.Column(db.String(20), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    summary = db.Column(db.Text) # Condensed content for LLM context; NULL until summarised
+
+    __table_args__ = (
+        # Threads are read, paged and appended to by (topic, channel, step) in seq order.
+        # Unique so concurrent appends cannot take the same position; split in two
+        # because NULL step_ids never compare equal in a unique index.
+        db.Index('ux_chat_messages_step_seq', 'topic_id', 'channel', 'step_id', 'seq', unique=True,
+                 postgresql_where=db.text('step_id IS NOT NULL'), sqlite_where=db.text('step_id IS NOT NULL')),
+        db.Index('ux_chat_messages_thread_seq', 'topic_id', 'channel', 'seq', unique=True,
+                 postgresql_where=db.text('step_id IS NULL'), sqlite_where=db.text('step_id IS NULL')),
+    )
+
+    # Relationships
+    topic = db.relationship('Topic', back_populates='chat_messages')
+    step = db.relationship('ChapterMode', back_populates='popup_messages')
+
+class ChapterMode(TimestampMixin, SyncMixin, VersionMixin, db.Model):
     """Stores chapter-based learning content and assessments."""
 
     __tablename__ = 'chapter_mode'
@@ -77,7 +129,6 @@ class ChapterMode(TimestampMixin, SyncMixin, db.Model):
     questions = db.Column(JSON)
     user_answers = db.Column(JSON)
     score = db.Column(db.Float)
-    popup_chat_history = db.Column(JSON) # Store chat history for this step
     time_spent = db.Column(db.Integer, default=0) # Duration in seconds
 
     __table_args__ = (
@@ -86,8 +137,9 @@ class ChapterMode(TimestampMixin, SyncMixin, db.Model):
 
     # Relationships
     topic = db.relationship('Topic', back_populates='chapter_mode')
+    popup_messages = db.relationship('ChatMessage', back_populates='step', cascade='all, delete-orphan')
 
-class QuizMode(TimestampMixin, SyncMixin, db.Model):
+class QuizMode(TimestampMixin, SyncMixin, VersionMixin, db.Model):
     """Stores quiz questions and results for a topic."""
 
     __tablename__ = 'quiz_mode'
@@ -117,6 +169,11 @@ class FlashcardMode(TimestampMixin, SyncMixin, db.Model):
     definition = db.Column(db.Text, nullable=False)
     time_spent = db.Column(db.Integer, default=0) # Duration in seconds
 
+    __table_args__ = (
+        # Cards are loaded per topic, and the topic list checks whether any exist
+        db.Index('ix_flashcard_mode_topic', 'topic_id'),
+    )
+
     # Relationships
     topic = db.relationship('Topic', back_populates='flashcard_mode')
 
@@ -233,6 +290,11 @@ class TelemetryLog(TimestampMixin, SyncMixin, db.Model):
     payload = db.Column(JSON, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
 
+    __table_args__ = (
+        # Analytics read one event type over a time range
+        db.Index('ix_telemetry_logs_event_time', 'event_type', 'timestamp'),
+    )
+
     # Relationships
     login = db.relationship('Login', back_populates='telemetry_logs')
     installation = db.relationship('Installation', back_populates='telemetry_logs')
@@ -249,6 +311,11 @@ class Feedback(TimestampMixin, SyncMixin, db.Model):
     rating = db.Column(db.Integer)
     comment = db.Column(db.Text)
 
+    __table_args__ = (
+        # Step feedback is read and replaced per (user, topic steps) in bulk
+        db.Index('ix_feedback_user_reference', 'user_id', 'content_reference'),
+    )
+
     # Relationships
     login = db.relationship('Login', back_populates='feedbacks')
 
@@ -267,10 +334,28 @@ class AIModelPerformance(TimestampMixin, SyncMixin, db.Model):
     output_tokens = db.Column(db.Integer)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
+    __table_args__ = (
+        # Per-user latency and token usage over time
+        db.Index('ix_ai_model_performance_user_time', 'user_id', 'timestamp'),
+    )
+
     # Relationships
     login = db.relationship('Login', back_populates='ai_model_performances')
 
 
+class LLMCacheEntry(db.Model):
+    """Persistent tier of the LLM response cache (see app.common.llm_cache)."""
+
+    __tablename__ = 'llm_response_cache'
+
+    cache_key = db.Column(db.String(64), primary_key=True)  # sha256 of model/messages/temperature/is_json
+    task = db.Column(db.String(50))
+    model_name = db.Column(db.String(255))
+    response = db.Column(JSON)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
 class PlanRevision(TimestampMixin, SyncMixin, db.Model):
     """Records changes made to study plans."""
 
@@ -284,6 +369,11 @@ class PlanRevision(TimestampMixin, SyncMixin, db.Model):
     new_plan_json = db.Column(JSON)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
+    __table_args__ = (
+        # PlannerAgent.update_study_plan reads a topic's latest revision to dedupe
+        db.Index('ix_plan_revisions_topic_user_time', 'topic_id', 'user_id', 'timestamp'),
+    )
+
     # Relationships
     topic = db.relationship('Topic', back_populates='plan_revisions')
     login = db.relationship('Login', back_populates='plan_revisions')
@@ -337,6 +427,17 @@ class Login(UserMixin, TimestampMixin, db.Model):
     plan_revisions = db.relationship('PlanRevision', back_populates='login', cascade='all, delete-orphan')
     user_profile = db.relationship('User', back_populates='login', uselist=False, cascade='all, delete-orphan')
 
+
+# DCS sync polls every SyncMixin table for rows still to upload, in key order.
+# On PostgreSQL the index only holds pending rows, so it stays as small as the
+# sync backlog; other databases get a plain (sync_status, primary key) index.
+for _model in SyncMixin.__subclasses__():
+    db.Index(
+        f'ix_{_model.__tablename__}_sync_pending',
+        _model.__table__.c.sync_status, *_model.__table__.primary_key.columns,
+        postgresql_where=_model.__table__.c.sync_status == 'pending')
+del _model
+
 # class VectorEmbedding(db.Model):
 #     __tablename__ = 'vector_embeddings'
 #
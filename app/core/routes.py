@@ -1,5 +1,5 @@
 from flask import Blueprint, render_template, request, session, redirect, url_for
-from app.common.storage import get_all_topics, load_topic
+from app.common.storage import get_topics_page, invalidate_topic_cache, load_topic
 from app.common.utils import log_telemetry
 from app.common.auth import create_jwe, decrypt_jwe
 from flask_login import login_user, logout_user, login_required, current_user
@@ -38,44 +38,25 @@ def index():
             self.prev_num = page - 1
             self.next_num = page + 1
 
+    def render_topics(page, error=None):
+        # One query for the page's rows, flags and total (see get_topics_page)
+        items, total = get_topics_page(page, per_page)
+        pagination = MockPagination(items, page, per_page, total)
+        return render_template(
+            'index.html', topics=items, pagination=pagination, per_page=per_page, error=error)
+
     if request.method == 'POST':
         topic_name = request.form.get('topic', '').strip()
         mode = request.form.get('mode', 'chapter')
 
         if not topic_name:
-            all_topics = get_all_topics()
             # Default to first page on error
-            start = 0
-            end = per_page
-            paginated_items = all_topics[start:end]
-            pagination = MockPagination(paginated_items, 1, per_page, len(all_topics))
-
-            topics_data = []
-            for topic in paginated_items:
-                data = load_topic(topic)
-                if data:
-                    has_plan = bool(data.get('plan'))
-                    topics_data.append({'name': topic, 'has_plan': has_plan})
-                else:
-                    topics_data.append({'name': topic, 'has_plan': True})
-
-            return render_template(
-                'index.html',
-                topics=topics_data,
-                pagination=pagination,
-                per_page=per_page,
-                error="Please enter a topic name.")
+            return render_topics(1, error="Please enter a topic name.")
 
         # Telemetry Hook: Topic Created/Opened (Intent)
         try:
-             # Check existence using get_all_topics since we have the list
-             # Note: get_all_topics() hits DB, but we need it eventually?
-             # For specific topic check, Model query is better but we want to avoid raw queries if possible.
-             # But here we are just logging log_telemetry.
-             # Let's just use load_topic check which is safe or assume new.
-             # Actually, simpler:
-             all_existing = get_all_topics()
-             exists = topic_name in all_existing
+             # A projection-free load is a single lookup of the topic row
+             exists = load_topic(topic_name, fields=()) is not None
 
              log_telemetry(
                 event_type='topic_created' if not exists else 'topic_opened',
@@ -106,35 +87,9 @@ def index():
 
             else:
                 # Valid existing topics needed for re-render
-                all_topics = get_all_topics()
-                start = 0
-                end = per_page
-                paginated_items = all_topics[start:end]
-                pagination = MockPagination(paginated_items, 1, per_page, len(all_topics))
-
-                topics_data = []
-                for t in paginated_items:
-                     topics_data.append({'name': t, 'has_plan': True})
-
-                return render_template(
-                    'index.html',
-                    topics=topics_data,
-                    pagination=pagination,
-                    per_page=per_page,
-                    error=f"Mode {mode} not available")
-
-
-    from app.common.storage import get_topics_metadata
-    all_topics_meta = get_topics_metadata()
-
-    total = len(all_topics_meta)
-    start = (page - 1) * per_page
-    end = start + per_page
-    paginated_items = all_topics_meta[start:end]
-
-    pagination = MockPagination(paginated_items, page, per_page, total)
+                return render_topics(1, error=f"Mode {mode} not available")
 
-    return render_template('index.html', topics=paginated_items, pagination=pagination, per_page=per_page)
+    return render_topics(page)
 
 
 @main_bp.route('/favicon.ico')
@@ -265,8 +220,8 @@ def signup():
         # Telemetry Hook: User Signup
         try:
             telemetry_payload = {}
-            from app.common.utils import get_system_info
-            sys_info = get_system_info()
+            from app.common.installation import get_cached_system_info
+            sys_info = get_cached_system_info()
             if isinstance(sys_info, dict) and 'install_method' in sys_info:
                 telemetry_payload['install_method'] = sys_info['install_method']
 
@@ -336,8 +291,10 @@ def delete_account():
 
     try:
         user = current_user
+        user_id = user.userid
         db.session.delete(user)
         db.session.commit()
+        invalidate_topic_cache(user_id)
         logout_user()
         return redirect(url_for('main.signup')) # Redirect to signup or home
     except Exception as e:
@@ -596,6 +553,168 @@ def settings():
     return render_template('setup.html', defaults=defaults, show_back_button=True, is_frozen=getattr(sys, 'frozen', False))
 
 
+@main_bp.route('/api/llm/status')
+@login_required
+def llm_status():
+    """
+    Report LLM client load: scheduler lanes, backends, response cache and request de-duplication.
+
+    ---
+    tags:
+      - System
+    responses:
+      200:
+        description: LLM client statistics
+        schema:
+          type: object
+          properties:
+            scheduler:
+              type: object
+              description: Concurrency cap, active calls and per-lane queue times (ms)
+            cache:
+              type: object
+              description: Response cache hit/miss counters (null if disabled)
+            single_flight:
+              type: object
+              description: Upstream calls made vs. calls that joined an in-flight one
+            backends:
+              type: array
+              description: Outstanding requests and circuit state per backend
+    """
+    from flask import jsonify
+    from app.common.llm_cache import get_llm_cache, get_single_flight
+    from app.common.llm_scheduler import get_llm_scheduler
+    from app.common.utils import get_llm_backends
+
+    llm_cache = get_llm_cache()
+    pool = get_llm_backends()
+    return jsonify({
+        'backends': pool.stats() if pool else [],
+        'scheduler': get_llm_scheduler().stats(),
+        'cache': llm_cache.stats() if llm_cache else None,
+        'single_flight': get_single_flight().stats(),
+    })
+
+
+@main_bp.route('/api/debug/traces')
+@login_required
+def debug_traces():
+    """
+    Show the current user's slowest recent requests with their spans (LLM, SQL, audio, sandbox).
+
+    Only requests slower than TRACE_SLOW_MS are kept, in a ring buffer of
+    TRACE_BUFFER_SIZE traces per process. Traces carry topic names, SQL and
+    sandbox packages, so other users' traces are never listed.
+    ---
+    tags:
+      - System
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Return at most this many traces
+    responses:
+      200:
+        description: The user's recent slow traces, newest first
+        schema:
+          type: object
+          properties:
+            stats:
+              type: object
+              description: Traces finished, kept and exported, threshold and buffer size
+            traces:
+              type: array
+              description: Traces with span offsets and durations (ms) and attributes
+    """
+    from flask import jsonify
+    from app.common.tracing import get_tracer
+
+    tracer = get_tracer()
+    limit = request.args.get('limit', type=int)
+    return jsonify({
+        'stats': tracer.stats(),
+        'traces': tracer.recent(limit, user_id=current_user.userid),
+    })
+
+
+@main_bp.route('/health')
+def health():
+    """
+    Liveness/readiness probe: database connectivity, plus LLM availability.
+
+    Public so load balancers and uptime monitors can call it without a session.
+    Only the database decides the status code: an LLM outage must not pull
+    every instance out of rotation while saved steps, quizzes and flashcards
+    still work, so the LLM state is informational.
+    ---
+    tags:
+      - System
+    responses:
+      200:
+        description: Database reachable
+      503:
+        description: Database unreachable
+        schema:
+          type: object
+          properties:
+            status:
+              type: string
+              enum: [ok, degraded]
+            database:
+              type: string
+            llm:
+              type: object
+              description: Whether any backend is available (details are in /api/llm/status)
+    """
+    from flask import jsonify
+    from sqlalchemy import text
+    from app.core.extensions import db
+    from app.common.utils import get_llm_backends
+
+    try:
+        db.session.execute(text('SELECT 1'))
+        database = 'ok'
+    except Exception as e:
+        db.session.rollback()
+        database = f'error: {e.__class__.__name__}'
+
+    # Backend URLs, models and breaker errors stay behind the login in /api/llm/status
+    pool = get_llm_backends()
+    backends = pool.stats() if pool else []
+    healthy = database == 'ok'
+    return jsonify({
+        'status': 'ok' if healthy else 'degraded',
+        'database': database,
+        'llm': {'available': any(b['breaker']['state'] != 'open' for b in backends)},
+    }), 200 if healthy else 503
+
+
+@main_bp.route('/metrics')
+def metrics():
+    """
+    Export in-process metrics in OpenMetrics text format for Prometheus.
+
+    LLM calls (per prompt type and backend, tokens, scheduler queue time), topic
+    load/save latency and SQL statement counts, TTS/STT, sandbox runs and DCS
+    sync passes, plus scheduler, cache and background writer gauges. Values are
+    per process. Public like ``/health`` so scrapers need no session; no series
+    carries user data.
+    ---
+    tags:
+      - System
+    produces:
+      - application/openmetrics-text
+    responses:
+      200:
+        description: Metrics exposition, terminated by "# EOF"
+    """
+    from flask import Response
+    from app.common.metrics import CONTENT_TYPE, get_metrics_registry
+
+    return Response(get_metrics_registry().render(), content_type=CONTENT_TYPE)
+
+
 @main_bp.route('/api/transcribe', methods=['POST'])
 @login_required
 def transcribe():
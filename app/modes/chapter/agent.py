@@ -40,7 +40,7 @@ class ChapterTeachingAgent(TopicTeachingAgent):
         from app.modes.chapter.prompts import get_teaching_material_prompt
         prompt = get_teaching_material_prompt(
             topic, full_plan, user_background, incorrect_questions)
-        teaching_material = call_llm(prompt)
+        teaching_material = call_llm(prompt, task='teaching')
         # Filter out <think> tags
         teaching_material = re.sub(
             r'<think>.*?</think>',
@@ -49,6 +49,25 @@ class ChapterTeachingAgent(TopicTeachingAgent):
             flags=re.DOTALL).strip()
         return teaching_material
 
+    def stream_teaching_material(
+            self,
+            topic,
+            full_plan,
+            user_background,
+            incorrect_questions=None):
+        """
+        Streams teaching material for the current topic as it is generated.
+
+        Takes the same arguments as ``generate_teaching_material``.
+
+        Returns:
+            generator: Markdown text deltas with <think> blocks removed.
+        """
+        from app.modes.chapter.prompts import get_teaching_material_prompt
+        prompt = get_teaching_material_prompt(
+            topic, full_plan, user_background, incorrect_questions)
+        return call_llm(prompt, stream=True, task='teaching')
+
 
 class AssessorAgent:
     """
@@ -72,7 +91,7 @@ class AssessorAgent:
         """
         from app.modes.chapter.prompts import get_assessment_prompt
         prompt = get_assessment_prompt(teaching_material, user_background)
-        question_data = call_llm(prompt, is_json=True)
+        question_data = call_llm(prompt, is_json=True, task='assessment')
 
         # Validate structure (basic check)
         if not question_data or "questions" not in question_data:
@@ -97,5 +116,5 @@ class PodcastAgent:
         transcript = call_llm([
             {"role": "system", "content": "You are a professional podcast script writer."},
             {"role": "user", "content": prompt}
-        ])
+        ], task='podcast')
         return transcript
@@ -1,15 +1,19 @@
-from flask import render_template, request, session, redirect, url_for, make_response
+from flask import render_template, request, session, redirect, url_for, make_response, send_file, abort
 import os
-import base64
 from . import chapter_bp
-from app.common.storage import load_topic, save_topic
+from app.common.storage import (
+    load_topic, save_topic, get_podcast_audio_path, podcast_audio_url,
+    add_step_time, record_step_assessment, reset_step_assessment
+)
 from app.common.agents import FeedbackAgent, PlannerAgent
 from .agent import ChapterTeachingAgent, AssessorAgent, PodcastAgent
 from app.common.utils import generate_audio
 from markdown_it import MarkdownIt
 import datetime
+import threading
+from contextlib import contextmanager
 from app.common.agents import CodeExecutionAgent
-from app.common.utils import log_telemetry
+from app.common.utils import log_telemetry, sse_event, sse_response
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,6 +26,9 @@ except (ImportError, OSError) as e:
     WEASYPRINT_AVAILABLE = False
     logger.warning(f"Warning: WeasyPrint not available (PDF export disabled): {e}")
 
+# Podcast URLs are versioned by file mtime, so they can be cached for a long time
+PODCAST_CACHE_SECONDS = 7 * 24 * 60 * 60
+
 # Instantiate agents
 teacher = ChapterTeachingAgent()
 planner = PlannerAgent()
@@ -47,7 +54,7 @@ def _log_plan_generated(topic_name: str, plan_steps: list) -> None:
 @chapter_bp.route('/<topic_name>')
 def mode(topic_name):
     """Render the chapter mode page for a specific topic."""
-    topic_data = load_topic(topic_name, update_timestamp=True)
+    topic_data = load_topic(topic_name, update_timestamp=True, fields={'plan', 'step_outline'})
 
     # Initialize Persistent Sandbox
     # Initialize Topic Sandbox (Background)
@@ -64,10 +71,8 @@ def mode(topic_name):
         steps = topic_data.get('chapter_mode', [])
         resume_step_index = 0
         for i, step in enumerate(steps):
-            # Check if step has content (teaching_material or questions)
-            has_content = bool(step.get('teaching_material')
-                               or step.get('questions'))
-            if has_content:
+            # Check if step has content (teaching material is generated before questions)
+            if step.get('has_content'):
                 resume_step_index = i
 
         return redirect(
@@ -149,7 +154,7 @@ def generate_plan():
         # Error will be caught by global handler
         raise
 
-    topic_data = load_topic(topic_name) or {"name": topic_name}
+    topic_data = load_topic(topic_name, fields=()) or {"name": topic_name}
     topic_data['plan'] = plan_steps
     # Initialize steps structure
     topic_data['chapter_mode'] = [{'title': step_title, 'step_index': i} for i, step_title in enumerate(plan_steps)]
@@ -174,7 +179,7 @@ def update_plan(topic_name):
                 topic_name=topic_name,
                 step_index=current_step_index))
 
-    topic_data = load_topic(topic_name)
+    topic_data = load_topic(topic_name, fields={'plan', 'step_outline'})
     if not topic_data:
         return "Topic not found", 404
 
@@ -227,7 +232,7 @@ def update_plan(topic_name):
 @chapter_bp.route('/learn/<topic_name>/<int:step_index>')
 def learn_topic(topic_name, step_index):
     """Render the learning content for a specific step."""
-    topic_data = load_topic(topic_name)
+    topic_data = load_topic(topic_name, fields={'plan', 'chapter_mode'}, steps=[step_index])
     if not topic_data:
         return "Topic not found", 404
 
@@ -248,40 +253,48 @@ def learn_topic(topic_name, step_index):
 
     current_step_data = topic_data['chapter_mode'][step_index]
 
-    if not current_step_data.get('teaching_material'):
-        incorrect_questions = session.get('incorrect_questions')
-        from app.common.utils import get_user_context
-        current_background = get_user_context()
-        try:
-            teaching_material = teacher.generate_teaching_material(
-                plan_steps[step_index], plan_steps, current_background, incorrect_questions)
-        except Exception as error:
-            return f"<h1>Error Generating Teaching Material</h1><p>{error}</p>"
-
-        current_step_data['teaching_material'] = teaching_material
-        from app.common.utils import get_user_context
-        current_background = get_user_context()
-        try:
-            question_data = assessor.generate_question(
-                teaching_material, current_background)
-            current_step_data['questions'] = question_data
-        except Exception:
-            # If question generation fails, continue without questions
-            current_step_data['questions'] = None
-
-        save_topic(topic_name, topic_data)
-        session.pop('incorrect_questions', None)
-
-    # Telemetry Hook: Step Viewed
+    # A step without material renders as a shell that learn_step.js fills from
+    # learn_topic_stream; ?wait=1 (the <noscript> fallback) generates it inline
+    stream_url = None
+    if not current_step_data.get('teaching_material') and not request.args.get('wait'):
+        stream_url = url_for('chapter.learn_topic_stream', topic_name=topic_name, step_index=step_index)
+    elif not current_step_data.get('teaching_material'):
+        with _step_generation_lock(topic_name, step_index) as waited:
+            if waited:
+                # A concurrent request (double click, second tab) held the lock;
+                # it has most likely generated this step already. Bypass the copy
+                # this request loaded before waiting.
+                topic_data = load_topic(
+                    topic_name, fields={'plan', 'chapter_mode'}, steps=[step_index], fresh=True)
+                current_step_data = topic_data['chapter_mode'][step_index]
+
+            if not current_step_data.get('teaching_material'):
+                incorrect_questions = session.get('incorrect_questions')
+                from app.common.utils import get_user_context
+                current_background = get_user_context()
+                try:
+                    teaching_material = teacher.generate_teaching_material(
+                        plan_steps[step_index], plan_steps, current_background, incorrect_questions)
+                except Exception as error:
+                    return f"<h1>Error Generating Teaching Material</h1><p>{error}</p>"
+
+                current_step_data['teaching_material'] = teaching_material
+                _generate_step_questions(current_step_data, teaching_material)
+
+                save_topic(topic_name, topic_data)
+                session.pop('incorrect_questions', None)
+
+    # Telemetry Hook: Step Viewed (the shell is logged when the stream redirects back)
     try:
-        log_telemetry(
-            event_type='chapter_step_viewed',
-            triggers={'source': 'web_ui', 'action': 'navigation'},
-            payload={
-                'topic': topic_name,
-                'step_index': step_index
-            }
-        )
+        if not stream_url:
+            log_telemetry(
+                event_type='chapter_step_viewed',
+                triggers={'source': 'web_ui', 'action': 'navigation'},
+                payload={
+                    'topic': topic_name,
+                    'step_index': step_index
+                }
+            )
     except Exception:
         pass # Telemetry failures must not block user flow; ignore logging errors.
 
@@ -309,13 +322,122 @@ def learn_topic(topic_name, step_index):
             None),
         show_assessment=show_assessment,
         tts_available=tts_available,
-        sandbox_available=is_sandbox_available())
+        sandbox_available=is_sandbox_available(),
+        stream_url=stream_url)
+
+
+@chapter_bp.route('/learn/<topic_name>/<int:step_index>/stream')
+def learn_topic_stream(topic_name, step_index):
+    """
+    Stream the teaching material for a step as Server-Sent Events.
+
+    If the step has no material yet, it is emitted as ``{"delta": ...}`` frames
+    while it is generated; assessment questions are then generated and the
+    step is saved. A final ``done`` event carries the URL of the rendered step
+    (immediately, if the material already exists). Generation failures emit an
+    ``error`` event and nothing is saved.
+    """
+    topic_data = load_topic(topic_name, fields={'plan', 'chapter_mode'}, steps=[step_index])
+    if not topic_data:
+        return {"error": "Topic not found"}, 404
+
+    plan_steps = topic_data.get('plan', [])
+    if not 0 <= step_index < len(plan_steps):
+        return {"error": "Invalid step index"}, 404
+
+    current_step_data = topic_data['chapter_mode'][step_index]
+    step_url = url_for('chapter.learn_topic', topic_name=topic_name, step_index=step_index)
+
+    if current_step_data.get('teaching_material'):
+        return sse_response(iter([sse_event({"url": step_url}, event="done")]))
+
+    # Consume the session state now: the session cookie is written before the body streams
+    incorrect_questions = session.pop('incorrect_questions', None)
+    from app.common.utils import get_user_context
+    current_background = get_user_context()
+
+    def events():
+        nonlocal topic_data, current_step_data
+        with _step_generation_lock(topic_name, step_index) as waited:
+            if waited:
+                topic_data = load_topic(
+                    topic_name, fields={'plan', 'chapter_mode'}, steps=[step_index], fresh=True)
+                current_step_data = topic_data['chapter_mode'][step_index]
+                if current_step_data.get('teaching_material'):
+                    yield sse_event({"url": step_url}, event="done")
+                    return
+
+            parts = []
+            try:
+                for delta in teacher.stream_teaching_material(
+                        plan_steps[step_index], plan_steps, current_background, incorrect_questions):
+                    parts.append(delta)
+                    yield sse_event({"delta": delta})
+            except Exception as error:
+                yield sse_event({"error": str(error)}, event="error")
+                return
+
+            teaching_material = "".join(parts).strip()
+            current_step_data['teaching_material'] = teaching_material
+            _generate_step_questions(current_step_data, teaching_material)
+            save_topic(topic_name, topic_data)
+        yield sse_event({"url": step_url}, event="done")
+
+    return sse_response(events())
+
+
+# Per-(user, topic, step) locks so concurrent requests for the same step
+# generate its material only once in this process: key -> [lock, holders]
+_generation_locks = {}
+_generation_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _step_generation_lock(topic_name, step_index):
+    """
+    Serialise teaching-material generation for one user's topic step.
+
+    Yields:
+        bool: True if another request held the lock and we had to wait, in which
+        case the caller should reload the step before generating.
+    """
+    from flask_login import current_user
+    key = (current_user.userid, topic_name, step_index)
+    with _generation_locks_guard:
+        entry = _generation_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+
+    lock = entry[0]
+    waited = not lock.acquire(blocking=False)
+    if waited:
+        lock.acquire()
+    try:
+        yield waited
+    finally:
+        lock.release()
+        with _generation_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _generation_locks.pop(key, None)
+
+
+def _generate_step_questions(current_step_data, teaching_material):
+    """Generate assessment questions for freshly generated teaching material."""
+    from app.common.utils import get_user_context
+    current_background = get_user_context()
+    try:
+        question_data = assessor.generate_question(
+            teaching_material, current_background)
+        current_step_data['questions'] = question_data
+    except Exception:
+        # If question generation fails, continue without questions
+        current_step_data['questions'] = None
 
 
 @chapter_bp.route('/assess/<topic_name>/<int:step_index>', methods=['POST'])
 def assess_step(topic_name, step_index):
     """Evaluate user answers for a step's assessment."""
-    topic_data = load_topic(topic_name)
+    topic_data = load_topic(topic_name, fields={'plan', 'chapter_mode'}, steps=[step_index])
     if not topic_data:
         return "Topic not found", 404
 
@@ -364,21 +486,15 @@ def assess_step(topic_name, step_index):
                 incorrect_questions.append(question)
             feedback_results.append(feedback_data)
 
-    current_step_data['user_answers'] = user_answers
-    current_step_data['popup_chat_history'] = current_step_data.get('popup_chat_history', []) # placeholder for template if needed
-    current_step_data['feedback'] = feedback_results
-
     answered_questions_count = len([ua for ua in user_answers if ua])
     score = (num_correct / answered_questions_count *
              100) if answered_questions_count > 0 else 0
-    current_step_data['score'] = score
-    if time_spent:
-         current_step_data['time_spent'] = (current_step_data.get('time_spent', 0) or 0) + time_spent
 
     if score < 50 and incorrect_questions:
         session['incorrect_questions'] = incorrect_questions
 
-    save_topic(topic_name, topic_data)
+    # Single-row update: a concurrent update_time beacon is not overwritten
+    record_step_assessment(topic_name, step_index, user_answers, score, time_spent)
 
     # Telemetry Hook: Step Assessed
     try:
@@ -418,45 +534,17 @@ def update_time(topic_name, step_index):
         time_spent = 0
 
     if time_spent > 0:
-        # Prevent race condition: Use direct DB update instead of load_topic/save_topic
-        # load_topic gets a snapshot. If another request (e.g. assess_step) updates
-        # user_answers in parallel, save_topic (which overwrites everything) would
-        # revert user_answers to the stale snapshot state (None).
-
-        from app.core.models import Topic, ChapterMode
-        from flask_login import current_user
-        from app.core.extensions import db
-
-        # We need to find the specific step.
-        # Note: step_index isn't unique globally, only per topic.
-
-        topic = Topic.query.filter_by(name=topic_name, user_id=current_user.userid).first()
-        if topic:
-             step = ChapterMode.query.filter_by(topic_id=topic.id, step_index=step_index).first()
-             if step:
-                 step.time_spent = (step.time_spent or 0) + time_spent
-                 db.session.commit()
+        add_step_time(topic_name, step_index, time_spent)
 
     return '', 204
 
 @chapter_bp.route('/reset_quiz/<topic_name>/<int:step_index>', methods=['POST'])
 def reset_quiz(topic_name, step_index):
     """Reset the quiz results for a specific step."""
-    topic_data = load_topic(topic_name)
-    if not topic_data:
+    if not load_topic(topic_name, fields=()):
         return "Topic not found", 404
 
-    if 0 <= step_index < len(topic_data['chapter_mode']):
-        current_step_data = topic_data['chapter_mode'][step_index]
-        if 'user_answers' in current_step_data:
-            current_step_data['user_answers'] = None
-        if 'feedback' in current_step_data:
-            current_step_data['feedback'] = None
-        if 'popup_chat_history' in current_step_data:
-            current_step_data['popup_chat_history'] = None
-        if 'score' in current_step_data:
-            current_step_data['score'] = None
-        save_topic(topic_name, topic_data)
+    reset_step_assessment(topic_name, step_index)
 
     return redirect(
         url_for(
@@ -489,7 +577,7 @@ def generate_audio_route(step_index):
                   methods=['POST'])
 def generate_podcast_route(topic_name, step_index):
     """Generate a podcast episode for the step."""
-    topic_data = load_topic(topic_name)
+    topic_data = load_topic(topic_name, fields={'chapter_mode'}, steps=[step_index])
     if not topic_data:
         return {"error": "Topic not found"}, 404
 
@@ -548,13 +636,6 @@ def generate_podcast_route(topic_name, step_index):
     except Exception as error:
         return {"error": f"Audio generation failed: {error}"}, 500
 
-    # 3. Read and Encode
-    try:
-        with open(output_path, 'rb') as audio_file:
-            encoded_string = base64.b64encode(audio_file.read()).decode('utf-8')
-    except Exception as e:
-        return {"error": f"Failed to encode audio: {e}"}, 500
-
     # Save the podcast path to the step
     current_step_data['podcast_audio_path'] = output_path
     save_topic(topic_name, topic_data)
@@ -573,7 +654,58 @@ def generate_podcast_route(topic_name, step_index):
     except Exception:
         pass # Telemetry failures must not block user flow; ignore logging errors.
 
-    return {"audio_url": f"data:audio/mp3;base64,{encoded_string}"}
+    return {"audio_url": podcast_audio_url(topic_name, step_index, output_path)}
+
+
+@chapter_bp.route('/podcast/<topic_name>/<int:step_index>/audio')
+def podcast_audio(topic_name, step_index):
+    """
+    Stream a step's podcast MP3.
+
+    Supports HTTP Range requests (seeking without downloading the whole file)
+    and conditional requests via ETag / Last-Modified. URLs carry the file's
+    mtime as a version, so responses may be cached privately.
+    ---
+    tags:
+      - Chapter
+    parameters:
+      - name: topic_name
+        in: path
+        type: string
+        required: true
+      - name: step_index
+        in: path
+        type: integer
+        required: true
+      - name: Range
+        in: header
+        type: string
+        required: false
+        description: Byte range, e.g. "bytes=0-1023"
+    responses:
+      200:
+        description: Full audio file (audio/mpeg)
+      206:
+        description: Requested byte range
+      304:
+        description: Not modified (ETag matched)
+      404:
+        description: The step has no podcast
+    """
+    audio_path = get_podcast_audio_path(topic_name, step_index)
+    if not audio_path:
+        abort(404)
+
+    response = send_file(
+        audio_path,
+        mimetype='audio/mpeg',
+        conditional=True,
+        etag=True,
+        max_age=PODCAST_CACHE_SECONDS)
+    # Per-user content: browsers may cache it, shared proxies may not
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
 
 
 @chapter_bp.route('/complete/<topic_name>')
@@ -594,7 +726,7 @@ def complete_topic(topic_name):
 @chapter_bp.route('/export/<topic_name>')
 def export_topic(topic_name):
     """Export the topic content as a Markdown file."""
-    topic_data = load_topic(topic_name)
+    topic_data = load_topic(topic_name, fields={'plan', 'chapter_mode'})
     if not topic_data:
         return "Topic not found", 404
 
@@ -617,7 +749,7 @@ def export_topic_pdf(topic_name):
         return ("PDF export is not available (WeasyPrint/GTK libraries missing). "
                 "Please use 'Export as Markdown' instead."), 503
 
-    topic_data = load_topic(topic_name)
+    topic_data = load_topic(topic_name, fields={'plan', 'flashcard_mode'})
     if not topic_data:
         return "Topic not found", 404
 
@@ -759,7 +891,7 @@ def execute_code():
 
 def _get_topic_data_and_score(topic_name):
     """Helper to calculate average score and retrieve topic data."""
-    topic_data = load_topic(topic_name)
+    topic_data = load_topic(topic_name, fields={'plan', 'chapter_mode'})
     if not topic_data:
         return None, 0
 
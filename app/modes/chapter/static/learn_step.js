@@ -26,6 +26,11 @@ function initLearnStep(cfg) {
     // Initialize Markdown Rendering
     const markdownContent = document.getElementById('step-content-markdown').textContent;
     const renderedContent = document.getElementById('step-content-rendered');
+    if (config.urls.learn_stream) {
+        // Material not generated yet: the page reloads with it once the stream is done
+        streamTeachingMaterial(config.urls.learn_stream, renderedContent);
+        return;
+    }
     renderedContent.innerHTML = md.render(markdownContent);
 
     setupCodeExecution(renderedContent);
@@ -35,6 +40,34 @@ function initLearnStep(cfg) {
     setupThemeObserver();
 }
 
+async function streamTeachingMaterial(streamUrl, renderedContent) {
+    let material = '';
+    let error = null;
+    renderedContent.innerHTML = '<p><em>Preparing this step...</em></p>';
+    try {
+        const response = await fetch(streamUrl);
+        if (!response.ok) {
+            throw new Error(`Request failed with status ${response.status} ${response.statusText}`);
+        }
+        await readEventStream(response, (event, data) => {
+            if (event === 'message') {
+                material += data.delta;
+                renderedContent.innerHTML = md.render(material);
+            } else if (event === 'done') {
+                window.location.replace(data.url);
+            } else if (event === 'error') {
+                error = new Error(data.error);
+            }
+        });
+    } catch (e) {
+        error = e;
+    }
+    if (error) {
+        renderedContent.innerHTML = '<h1>Error Generating Teaching Material</h1><p></p>';
+        renderedContent.querySelector('p').textContent = error.message;
+    }
+}
+
 function setupThemeObserver() {
     const themeLink = document.getElementById('highlight-theme');
     if (!themeLink) return;
@@ -27,7 +27,7 @@ class ChatModeMainChatAgent(ChatAgent):
         # We override/implement this here since it's specific to the main chat
         # start
         prompt = get_welcome_prompt(topic_name, user_background, plan)
-        answer = call_llm(prompt)
+        answer = call_llm(prompt, task='chat')
         return answer
 
 
@@ -1,8 +1,11 @@
-from flask import render_template, request, redirect, url_for
+from flask import render_template, request, redirect, url_for, current_app
 from . import chat_bp
-from app.common.storage import load_topic, save_chat_history, save_topic
+from app.common.storage import (
+    load_topic, save_topic, add_chat_time, append_chat_messages, append_popup_messages, load_chat_messages)
+from app.core.models import ChatMessage
 from app.common.agents import PlannerAgent
-from app.common.utils import summarize_text
+from app.common.utils import summarize_text, sse_event, sse_response
+from app.common.summary_worker import enqueue_chat_summary
 from app.modes.chat.agent import ChatModeMainChatAgent, ChatModeChatPopupAgent
 from app.modes.chapter.agent import ChapterModeChatAgent
 
@@ -15,11 +18,11 @@ popup_agent = ChatModeChatPopupAgent()
 def mode(topic_name):
     """Render the main chat interface for a topic."""
     # Try to load from DB first
-    topic_data = load_topic(topic_name, update_timestamp=True)
+    topic_data = load_topic(topic_name, update_timestamp=True, fields={'plan', 'chat_history'})
     if not topic_data:
         topic_data = {"name": topic_name}
         save_topic(topic_name, topic_data)
-        topic_data = load_topic(topic_name)
+        topic_data = load_topic(topic_name, fields={'plan', 'chat_history'})
 
     chat_history = topic_data.get('chat_history', []) if topic_data else []
 
@@ -47,7 +50,7 @@ def mode(topic_name):
             topic_data['steps'] = [{'step_index': i} for i in range(len(plan_steps))]
             save_topic(topic_name, topic_data)
             # Reload to ensure consistency
-            topic_data = load_topic(topic_name)
+            topic_data = load_topic(topic_name, fields={'plan'})
 
         plan = topic_data.get('plan', []) if topic_data else []
         try:
@@ -60,10 +63,10 @@ def mode(topic_name):
         chat_history.append({"role": "assistant", "content": welcome_message})
 
         # Save to DB immediately so the topic is created and persisted
-        save_chat_history(topic_name, chat_history)
+        append_chat_messages(topic_name, chat_history[-1:])
 
     # Always load plan to pass to the template
-    topic_data = load_topic(topic_name)
+    topic_data = load_topic(topic_name, fields={'plan'})
     plan = topic_data.get('plan', []) if topic_data else []
 
     return render_template(
@@ -80,7 +83,7 @@ def update_plan(topic_name):
     if not comment or not comment.strip():
         return redirect(url_for('chat.mode', topic_name=topic_name))
 
-    topic_data = load_topic(topic_name)
+    topic_data = load_topic(topic_name, fields={'plan', 'step_outline'})
     if not topic_data:
         # Handle case where topic doesn't exist
         return redirect(url_for('chat.mode', topic_name=topic_name))
@@ -103,43 +106,32 @@ def update_plan(topic_name):
     # Save the new plan
     topic_data['plan'] = new_plan
 
-    # Sync steps with new plan
-    current_steps = topic_data.get('steps', [])
-    # Note: Chat mode might not have loaded 'steps' if it wasn't accessed via load_topic deeply?
-    # load_topic DOES load steps.
-
-    topic_data['steps'] = reconcile_plan_steps(
-        current_steps, current_plan, new_plan)
+    # Sync steps with new plan (outline steps: material is kept by save_topic)
+    topic_data['chapter_mode'] = reconcile_plan_steps(
+        topic_data.get('chapter_mode', []), current_plan, new_plan)
 
     save_topic(topic_name, topic_data)
 
     # Add a system message to the chat
-    # Reload history from DB to be safe
-    topic_data = load_topic(topic_name)
-    chat_history = topic_data.get('chat_history', [])
-
     system_message = "Based on your feedback, I've updated the study plan."
-    chat_history.append({"role": "assistant", "content": system_message})
-    save_chat_history(topic_name, chat_history)
+    append_chat_messages(topic_name, [{"role": "assistant", "content": system_message}])
 
     # Redirect back to the chat interface
     return redirect(url_for('chat.mode', topic_name=topic_name))
 
 
-@chat_bp.route('/<topic_name>/send', methods=['POST'])
-def send_message(topic_name):
-    """Process and respond to a user chat message."""
-    user_message = request.form.get('message')
-    try:
-        time_spent = int(request.form.get('time_spent', 0))
-    except (ValueError, TypeError):
-        time_spent = 0
+def _prepare_chat_turn(topic_name, user_message):
+    """
+    Load the chat state for a topic and build the LLM context for a new message.
 
-    # Prevent empty or whitespace-only messages from being processed
-    if not user_message or not user_message.strip():
-        return redirect(url_for('chat.mode', topic_name=topic_name))
+    The agent's context builder decides which turns go in full and which are
+    summarised or rolled up.
 
-    topic_data = load_topic(topic_name)
+    Returns:
+        dict: ``chat_history`` and ``chat_history_summary`` (with the user message
+        appended), plus ``context``, ``user_background`` and ``plan`` for the agent.
+    """
+    topic_data = load_topic(topic_name, fields={'plan', 'chat_history', 'chat_history_summary'})
     if topic_data:
         context = topic_data.get('description', f'The topic is {topic_name}')
         plan = topic_data.get('plan', [])
@@ -154,58 +146,84 @@ def send_message(topic_name):
     chat_history = topic_data.get('chat_history', []) if topic_data else []
     chat_history_summary = topic_data.get('chat_history_summary', []) if topic_data else []
 
-    # Initialize summary if missing (for backward compatibility)
-    if chat_history and not chat_history_summary:
-        chat_history_summary = list(chat_history)
-
     # Add user message to both
     chat_history.append({"role": "user", "content": user_message.strip()})
     chat_history_summary.append({"role": "user", "content": user_message.strip()})
 
-    # Construct context for LLM
-    # We want last 2 interactions (4 messages) + current message from full history
-    # And everything older from summary history.
-    # Total recent messages = 4 (prev interactions) + 1 (current) = 5
-    KEEP_FULL_COUNT = 5
+    return {
+        "chat_history": chat_history,
+        "chat_history_summary": chat_history_summary,
+        "context": context,
+        "user_background": user_background,
+        "plan": plan,
+    }
 
-    if len(chat_history) <= KEEP_FULL_COUNT:
-        messages_for_llm = chat_history
-    else:
-        # Slicing:
-        # Older = Summary[:-5]
-        # Recent = Full[-5:]
-        older_part = chat_history_summary[:-KEEP_FULL_COUNT]
-        recent_part = chat_history[-KEEP_FULL_COUNT:]
-        messages_for_llm = older_part + recent_part
 
-    # Get answer from agent
-    try:
-        answer = chat_agent.get_answer(
-            user_message, # passed for logic, but agent should use full history from msg
-            messages_for_llm, # Passing constructed history
-            context,
-            user_background,
-            plan)
+def _record_chat_answer(topic_name, turn, answer, time_spent, failed=False):
+    """
+    Append the user message and assistant answer to the stored chat.
 
-        # Append full answer to full history
-        chat_history.append({"role": "assistant", "content": answer})
+    The answer is stored unsummarised; the summary worker fills in its summary
+    in the background so the reply is not held up by a second LLM call.
+    """
+    turn['chat_history'].append({"role": "assistant", "content": answer})
+    summarize_later = not failed and current_app.config.get('CHAT_SUMMARY_ASYNC', True)
 
-        # Generate summary for the answer
+    summary = None
+    if not failed and not summarize_later:
         try:
             summary = summarize_text(answer)
-            chat_history_summary.append({"role": "assistant", "content": summary})
         except Exception as e:
             # Fallback: just use full answer
             print(f"Failed to summarize answer: {e}")
-            chat_history_summary.append({"role": "assistant", "content": answer})
+    turn['chat_history_summary'].append({"role": "assistant", "content": summary or answer})
+
+    message_ids = append_chat_messages(
+        topic_name,
+        turn['chat_history'][-2:],
+        summaries=[None, summary],
+        time_spent=time_spent)
+
+    if summarize_later:
+        enqueue_chat_summary(message_ids[-1], answer)
+
+
+def _get_time_spent(source):
+    """Parse ``time_spent`` from form/JSON data, defaulting to 0."""
+    try:
+        return int(source.get('time_spent', 0))
+    except (ValueError, TypeError):
+        return 0
+
 
+@chat_bp.route('/<topic_name>/send', methods=['POST'])
+def send_message(topic_name):
+    """Process and respond to a user chat message."""
+    user_message = request.form.get('message')
+    time_spent = _get_time_spent(request.form)
+
+    # Prevent empty or whitespace-only messages from being processed
+    if not user_message or not user_message.strip():
+        return redirect(url_for('chat.mode', topic_name=topic_name))
+
+    turn = _prepare_chat_turn(topic_name, user_message)
+
+    # Get answer from agent
+    failed = False
+    try:
+        answer = chat_agent.get_answer(
+            user_message,
+            turn['chat_history'],
+            turn['context'],
+            turn['user_background'],
+            turn['plan'],
+            history_summary=turn['chat_history_summary'])
     except Exception as error:
         # Add an error message to the chat instead of crashing
         answer = f"Sorry, I encountered an error: {error}"
-        chat_history.append({"role": "assistant", "content": answer})
-        chat_history_summary.append({"role": "assistant", "content": answer})
+        failed = True
 
-    save_chat_history(topic_name, chat_history, history_summary=chat_history_summary, time_spent=time_spent)
+    _record_chat_answer(topic_name, turn, answer, time_spent, failed=failed)
 
     # Check for AJAX request (JSON accepted or X-Requested-With header)
     is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest' or \
@@ -216,6 +234,49 @@ def send_message(topic_name):
 
     return redirect(url_for('chat.mode', topic_name=topic_name))
 
+
+@chat_bp.route('/<topic_name>/send/stream', methods=['POST'])
+def send_message_stream(topic_name):
+    """
+    Stream the answer to a user chat message as Server-Sent Events.
+
+    Emits ``{"delta": ...}`` frames while the answer is generated, then a
+    ``done`` event carrying the full answer once the history is saved. An
+    ``error`` event is emitted if generation fails.
+    """
+    user_message = request.form.get('message')
+    time_spent = _get_time_spent(request.form)
+
+    if not user_message or not user_message.strip():
+        return {"error": "Missing or empty message"}, 400
+
+    turn = _prepare_chat_turn(topic_name, user_message)
+
+    def events():
+        parts = []
+        failed = False
+        try:
+            for delta in chat_agent.stream_answer(
+                    user_message,
+                    turn['chat_history'],
+                    turn['context'],
+                    turn['user_background'],
+                    turn['plan'],
+                    history_summary=turn['chat_history_summary']):
+                parts.append(delta)
+                yield sse_event({"delta": delta})
+            answer = "".join(parts).strip()
+        except Exception as error:
+            answer = f"Sorry, I encountered an error: {error}"
+            failed = True
+            yield sse_event({"error": str(error)}, event="error")
+
+        _record_chat_answer(topic_name, turn, answer, time_spent, failed=failed)
+        yield sse_event({"answer": answer}, event="done")
+
+    return sse_response(events())
+
+
 @chat_bp.route('/<topic_name>/update_time', methods=['POST'])
 def update_time(topic_name):
     """Update time spent on chat session."""
@@ -225,13 +286,75 @@ def update_time(topic_name):
         time_spent = 0
 
     if time_spent > 0:
-        topic_data = load_topic(topic_name)
-        if topic_data:
-            chat_history = topic_data.get('chat_history', [])
-            save_chat_history(topic_name, chat_history, time_spent=time_spent)
+        add_chat_time(topic_name, time_spent)
 
     return '', 204
 
+
+@chat_bp.route('/<topic_name>/history', methods=['GET'])
+def history(topic_name):
+    """
+    Page through a chat thread, newest messages first.
+
+    ---
+    tags:
+      - Chat
+    parameters:
+      - name: topic_name
+        in: path
+        type: string
+        required: true
+      - name: channel
+        in: query
+        type: string
+        enum: [chat, popup, step]
+        default: chat
+      - name: step_index
+        in: query
+        type: integer
+        description: Chapter step, for the step channel
+      - name: before
+        in: query
+        type: integer
+        description: Cursor from the previous page's next_before
+      - name: limit
+        in: query
+        type: integer
+        default: 50
+    responses:
+      200:
+        description: One page of messages, oldest first
+        schema:
+          type: object
+          properties:
+            messages:
+              type: array
+              items:
+                type: object
+                properties:
+                  seq:
+                    type: integer
+                  role:
+                    type: string
+                  content:
+                    type: string
+            next_before:
+              type: integer
+      400:
+        description: Invalid request
+    """
+    channel = request.args.get('channel', ChatMessage.CHAT)
+    if channel not in (ChatMessage.CHAT, ChatMessage.POPUP, ChatMessage.STEP):
+        return {"error": "Unknown channel"}, 400
+    step_index = request.args.get('step_index', type=int)
+    if channel == ChatMessage.STEP and step_index is None:
+        return {"error": "Missing step_index"}, 400
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+
+    return load_chat_messages(
+        topic_name, channel=channel, step_index=step_index,
+        before=request.args.get('before', type=int), limit=limit)
+
 @chat_bp.route('/<topic_name>/<int:step_index>', methods=['GET', 'POST'])
 def chat(topic_name, step_index):
     """
@@ -284,7 +407,7 @@ def chat(topic_name, step_index):
       500:
         description: Processing error
     """
-    topic_data = load_topic(topic_name)
+    topic_data = _load_popup_topic(topic_name, step_index)
     if not topic_data:
         return {"error": "Topic not found"}, 400
 
@@ -306,78 +429,132 @@ def chat(topic_name, step_index):
 
     # HANDLE POST REQUEST: Process Message
     user_question = request.json.get('question')
-    try:
-        time_spent = int(request.json.get('time_spent', 0))
-    except (ValueError, TypeError):
-        time_spent = 0
+    time_spent = _get_time_spent(request.json)
 
     if not user_question:
         return {"error": "Missing or empty question"}, 400
 
-    if step_index == 9999:
-        # Chat Mode Popup Logic
-        popup_history = topic_data.get('popup_chat_history') or []
-        popup_history.append({"role": "user", "content": user_question})
+    turn, error_response = _start_popup_turn(topic_name, topic_data, step_index, user_question)
+    if error_response:
+        return error_response
 
-        from app.common.utils import get_user_context
-        user_background = get_user_context()
+    try:
+        answer = turn['agent'].get_answer(
+            user_question,
+            turn['history'],
+            turn['context'],
+            turn['user_background'],
+            turn['plan'])
+    except Exception as error:
+        return {"error": str(error)}, 500
 
-        # Context for Chat Mode popup is general topic context
-        context = topic_data.get('description', f'The topic is {topic_name}')
-        plan = topic_data.get('plan', [])
+    _save_popup_turn(topic_name, step_index, turn, answer, time_spent)
+    return {"answer": answer}
 
+
+@chat_bp.route('/<topic_name>/<int:step_index>/stream', methods=['POST'])
+def chat_stream(topic_name, step_index):
+    """
+    Stream a popup chat answer as Server-Sent Events.
+
+    Accepts the same JSON body as the popup chat POST. Emits ``{"delta": ...}``
+    frames, then a ``done`` event with the full answer once it is saved, or an
+    ``error`` event if generation fails (nothing is saved in that case).
+    """
+    topic_data = _load_popup_topic(topic_name, step_index)
+    if not topic_data:
+        return {"error": "Topic not found"}, 400
+
+    body = request.get_json(silent=True) or {}
+    user_question = body.get('question')
+    time_spent = _get_time_spent(body)
+
+    if not user_question:
+        return {"error": "Missing or empty question"}, 400
+
+    turn, error_response = _start_popup_turn(topic_name, topic_data, step_index, user_question)
+    if error_response:
+        return error_response
+
+    def events():
+        parts = []
         try:
-            answer = popup_agent.get_answer(
-                user_question,
-                popup_history,
-                context,
-                user_background,
-                plan
-            )
+            for delta in turn['agent'].stream_answer(
+                    user_question,
+                    turn['history'],
+                    turn['context'],
+                    turn['user_background'],
+                    turn['plan']):
+                parts.append(delta)
+                yield sse_event({"delta": delta})
         except Exception as error:
-            return {"error": str(error)}, 500
+            yield sse_event({"error": str(error)}, event="error")
+            return
 
-        popup_history.append({"role": "assistant", "content": answer})
-        save_chat_history(topic_name, topic_data.get('chat_history', []), popup_history=popup_history)
-        return {"answer": answer}
+        answer = "".join(parts).strip()
+        _save_popup_turn(topic_name, step_index, turn, answer, time_spent)
+        yield sse_event({"answer": answer}, event="done")
 
-    if 'chapter_mode' not in topic_data:
-        return {"error": "Topic has no steps defined"}, 400
+    return sse_response(events())
 
-    if step_index < 0 or step_index >= len(topic_data['chapter_mode']):
-        return {"error": "Step index out of range"}, 400
-    current_step_data = topic_data['chapter_mode'][step_index]
-    teaching_material = current_step_data.get('teaching_material', '')
 
-    # Load step-specific chat history
-    step_history = current_step_data.get('popup_chat_history') or []
-    step_history.append({"role": "user", "content": user_question})
+def _load_popup_topic(topic_name, step_index):
+    """Load what a popup chat needs: the Chat mode histories (9999) or a single chapter step."""
+    if step_index == 9999:
+        return load_topic(topic_name, fields={'plan', 'popup_chat_history'})
+    return load_topic(topic_name, fields={'chapter_mode'}, steps=[step_index])
 
-    from app.common.utils import get_user_context
-    current_background = get_user_context()
 
-    # Pass the history to the agent.
-    # Note: We pass 'plan=[]' effectively because chapter mode context is the
-    # teaching material itself.
-    try:
-        answer = chapter_agent.get_answer(
-            user_question,
-            conversation_history=step_history,
-            context=teaching_material,
-            user_background=current_background,
-            plan=[],
-        )
-    except Exception as error:
-        return {"error": str(error)}, 500
+def _start_popup_turn(topic_name, topic_data, step_index, user_question):
+    """
+    Resolve the agent, history and context for a popup chat message.
 
-    # Append assistant answer
-    step_history.append({"role": "assistant", "content": answer})
+    Step index 9999 is the Chat mode popup; any other index is a chapter step.
 
-    # Save back to topic data
-    current_step_data['popup_chat_history'] = step_history
-    if time_spent:
-         current_step_data['time_spent'] = (current_step_data.get('time_spent', 0) or 0) + int(time_spent)
-    # We must save the whole topic to persist the step update
-    save_topic(topic_name, topic_data)
+    Returns:
+        tuple: ``(turn, None)`` with the user question appended to ``turn['history']``,
+        or ``(None, error_response)`` if the step is invalid.
+    """
+    if step_index == 9999:
+        # Context for Chat Mode popup is general topic context
+        turn = {
+            "agent": popup_agent,
+            "history": topic_data.get('popup_chat_history') or [],
+            "context": topic_data.get('description', f'The topic is {topic_name}'),
+            "plan": topic_data.get('plan', []),
+        }
+    else:
+        if 'chapter_mode' not in topic_data:
+            return None, ({"error": "Topic has no steps defined"}, 400)
 
-    return {"answer": answer}
+        if step_index < 0 or step_index >= len(topic_data['chapter_mode']):
+            return None, ({"error": "Step index out of range"}, 400)
+
+        current_step_data = topic_data['chapter_mode'][step_index]
+        # Note: We pass 'plan=[]' effectively because chapter mode context is the
+        # teaching material itself.
+        turn = {
+            "agent": chapter_agent,
+            "history": current_step_data.get('popup_chat_history') or [],
+            "context": current_step_data.get('teaching_material', ''),
+            "plan": [],
+        }
+
+    turn['history'].append({"role": "user", "content": user_question})
+
+    from app.common.utils import get_user_context
+    turn['user_background'] = get_user_context()
+    return turn, None
+
+
+def _save_popup_turn(topic_name, step_index, turn, answer, time_spent):
+    """Append the question and answer to the stored popup history."""
+    turn['history'].append({"role": "assistant", "content": answer})
+
+    # Only the new exchange is written; the rest of the topic is untouched
+    if step_index == 9999:
+        # Time on the Chat mode page is tracked by its own update_time beacon
+        append_popup_messages(topic_name, turn['history'][-2:])
+    else:
+        append_popup_messages(topic_name, turn['history'][-2:], step_index=step_index,
+                              time_spent=time_spent)
@@ -207,61 +207,84 @@ document.addEventListener('DOMContentLoaded', function () {
         if (micButton) micButton.disabled = true;
 
         try {
-            // 3. Send AJAX Request
             // Ensure time_spent is sent if needed, usually passed by hidden input logic, but let's trust formData
 
-            // We need to send it as form data but expect JSON
-            // Using fetch with FormData automatically sets Content-Type (multipart)
-            // But routes.py expects form data for 'message', so this works.
-            // Just need headers for JSON acceptance.
-
-            console.log('Sending AJAX request to:', this.action);
-            const response = await fetch(this.action, {
-                method: 'POST',
-                headers: {
-                    'Accept': 'application/json',
-                    'X-Requested-With': 'XMLHttpRequest',
-                    'X-CSRFToken': document.querySelector('meta[name="csrf-token"]')?.getAttribute('content') || ''
-                },
-                body: formData
-            });
-
-            console.log('Response status:', response.status);
-            if (!response.ok) {
-                const errorText = await response.text();
-                console.error('Response error body:', errorText);
-                throw new Error(`Network response was not ok: ${response.status}`);
-            }
-
-            const data = await response.json();
-            console.log('Received data:', data);
-            const answer = data.answer;
-
-            // 4. Replace Skeleton with Real Message
-            skeletonWrapper.remove();
-
-            const aiWrapper = document.createElement('div');
-            aiWrapper.className = 'message-wrapper assistant-wrapper';
-            aiWrapper.innerHTML = `
-                <div class="message-label assistant-label">AI Tutor</div>
-                <div class="message assistant-message">
-                    <div class="message-content"></div>
-                    <div class="raw-markdown" style="display: none;"></div>
-                </div>
-            `;
-
-            // Set content safely
-            const rawDiv = aiWrapper.querySelector('.raw-markdown');
-            rawDiv.textContent = answer;
+            // 4. Replace Skeleton with the assistant message (on first delta when streaming)
+            let contentDiv = null;
+            let rawDiv = null;
+            const showAnswer = (answer) => {
+                if (!contentDiv) {
+                    skeletonWrapper.remove();
+
+                    const aiWrapper = document.createElement('div');
+                    aiWrapper.className = 'message-wrapper assistant-wrapper';
+                    aiWrapper.innerHTML = `
+                        <div class="message-label assistant-label">AI Tutor</div>
+                        <div class="message assistant-message">
+                            <div class="message-content"></div>
+                            <div class="raw-markdown" style="display: none;"></div>
+                        </div>
+                    `;
+                    chatWindow.appendChild(aiWrapper);
+                    contentDiv = aiWrapper.querySelector('.message-content');
+                    rawDiv = aiWrapper.querySelector('.raw-markdown');
+                }
 
-            chatWindow.appendChild(aiWrapper);
+                // Set content safely, then render Markdown
+                rawDiv.textContent = answer;
+                contentDiv.innerHTML = md.render(answer);
+                contentDiv.dataset.rendered = "true";
+                scrollToBottom();
+            };
+
+            const headers = {
+                'X-Requested-With': 'XMLHttpRequest',
+                'X-CSRFToken': document.querySelector('meta[name="csrf-token"]')?.getAttribute('content') || ''
+            };
+            const streamUrl = this.dataset.streamAction;
+
+            if (streamUrl && window.readEventStream) {
+                // Stream the answer token by token (Server-Sent Events over fetch)
+                const response = await fetch(streamUrl, {
+                    method: 'POST',
+                    headers: { ...headers, 'Accept': 'text/event-stream' },
+                    body: formData
+                });
+                if (!response.ok) {
+                    throw new Error(`Network response was not ok: ${response.status}`);
+                }
 
-            // Render Markdown
-            const contentDiv = aiWrapper.querySelector('.message-content');
-            contentDiv.innerHTML = md.render(answer);
-            contentDiv.dataset.rendered = "true";
+                let answer = '';
+                await readEventStream(response, (event, data) => {
+                    if (event === 'message') {
+                        answer += data.delta;
+                        showAnswer(answer);
+                    } else if (event === 'done') {
+                        showAnswer(data.answer);
+                    }
+                });
+                if (!contentDiv) throw new Error('Stream ended without an answer');
+            } else {
+                // 3. Send AJAX Request
+                // We need to send it as form data but expect JSON
+                // Using fetch with FormData automatically sets Content-Type (multipart)
+                console.log('Sending AJAX request to:', this.action);
+                const response = await fetch(this.action, {
+                    method: 'POST',
+                    headers: { ...headers, 'Accept': 'application/json' },
+                    body: formData
+                });
+
+                console.log('Response status:', response.status);
+                if (!response.ok) {
+                    const errorText = await response.text();
+                    console.error('Response error body:', errorText);
+                    throw new Error(`Network response was not ok: ${response.status}`);
+                }
 
-            scrollToBottom();
+                const data = await response.json();
+                showAnswer(data.answer);
+            }
 
         } catch (error) {
             console.error('Chat error:', error);
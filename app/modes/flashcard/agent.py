@@ -22,7 +22,7 @@ class FlashcardTeachingAgent(TopicTeachingAgent):
 
         from app.modes.flashcard.prompts import get_flashcard_generation_prompt
         prompt = get_flashcard_generation_prompt(topic, count, user_background)
-        data = call_llm(prompt, is_json=True)
+        data = call_llm(prompt, is_json=True, task='flashcards')
 
         if not isinstance(
                 data,
@@ -61,7 +61,7 @@ class FlashcardTeachingAgent(TopicTeachingAgent):
             from app.modes.flashcard.prompts import get_additional_flashcards_prompt
             extra_prompt = get_additional_flashcards_prompt(
                 topic, remaining, user_background, seen_terms)
-            extra_data = call_llm(extra_prompt, is_json=True)
+            extra_data = call_llm(extra_prompt, is_json=True, task='flashcards')
             if not isinstance(
                     extra_data, dict) or 'flashcards' not in extra_data:
                 break
@@ -101,7 +101,10 @@ class FlashcardTeachingAgent(TopicTeachingAgent):
 
         from app.modes.flashcard.prompts import get_flashcard_count_prompt
         prompt = get_flashcard_count_prompt(topic, user_background)
-        data, error = call_llm(prompt, is_json=True)
+        try:
+            data = call_llm(prompt, is_json=True, task='flashcard_count')
+        except Exception:
+            return 25
 
         if isinstance(
                 data,
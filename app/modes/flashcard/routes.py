@@ -1,6 +1,6 @@
 from flask import render_template, request, make_response, redirect, url_for
 from . import flashcard_bp
-from app.common.storage import load_topic, save_topic
+from app.common.storage import load_topic, save_topic, add_flashcard_time, record_flashcard_progress
 from .agent import FlashcardTeachingAgent
 
 # WeasyPrint requires GTK native libraries - make it optional
@@ -17,7 +17,7 @@ teacher = FlashcardTeachingAgent()
 @flashcard_bp.route('/<topic_name>')
 def mode(topic_name):
     """Display flashcard mode with saved flashcards or generation UI."""
-    topic_data = load_topic(topic_name, update_timestamp=True)
+    topic_data = load_topic(topic_name, update_timestamp=True, fields={'flashcard_mode'})
     if not topic_data:
         # Topic doesn't exist yet, allow user to generate content
         flashcards = []
@@ -99,7 +99,7 @@ def generate_flashcards_route():
         return {"error": str(error)}, 500
 
     # Persist flashcards
-    topic_data = load_topic(topic_name) or {
+    topic_data = load_topic(topic_name, fields=()) or {
         "name": topic_name, "plan": [], "steps": []}
     topic_data['flashcard_mode'] = cards
     save_topic(topic_name, topic_data)
@@ -115,11 +115,8 @@ def update_time(topic_name):
         time_spent = 0
 
     if time_spent > 0:
-        topic_data = load_topic(topic_name)
-        if topic_data and topic_data.get('flashcard_mode'):
-             if len(topic_data['flashcard_mode']) > 0:
-                 topic_data['flashcard_mode'][0]['time_spent'] = (topic_data['flashcard_mode'][0].get('time_spent', 0) or 0) + time_spent
-                 save_topic(topic_name, topic_data)
+        # Deck-level time is kept on the first card
+        add_flashcard_time(topic_name, time_spent)
 
     return '', 204
 
@@ -153,13 +150,11 @@ def update_progress(topic_name):
         description: Topic not found
     """
     data = request.json
-    topic_data = load_topic(topic_name)
-    if not topic_data:
+    if not load_topic(topic_name, fields=()):
         return {"error": "Topic not found"}, 404
 
-    # Re-reading logic:
-    # incoming data['flashcards'] is list of {term:..., time_spent:...}
-    # Let's map incoming by ID and Term
+    # incoming data['flashcards'] is list of {id/term:..., time_spent:...};
+    # a card matched by ID is not matched again by term
     incoming_by_id = {}
     incoming_by_term = {}
     for item in data.get('flashcards', []):
@@ -168,17 +163,7 @@ def update_progress(topic_name):
         if 'term' in item:
             incoming_by_term[item['term']] = item.get('time_spent', 0)
 
-    for card in topic_data.get('flashcard_mode', []):
-        added_time = 0
-        if card.get('id') in incoming_by_id:
-            added_time = incoming_by_id[card['id']]
-        elif card.get('term') in incoming_by_term:
-            added_time = incoming_by_term[card['term']]
-
-        if added_time > 0:
-            card['time_spent'] = (card.get('time_spent', 0) or 0) + added_time
-
-    save_topic(topic_name, topic_data)
+    record_flashcard_progress(topic_name, incoming_by_id, incoming_by_term)
     return {"status": "success"}
 
 @flashcard_bp.route('/<topic_name>/export/pdf')
@@ -188,7 +173,7 @@ def export_pdf(topic_name):
         return ("PDF export is not available (WeasyPrint/GTK libraries missing). "
                 "Please use 'Export as Markdown' instead."), 503
 
-    topic_data = load_topic(topic_name)
+    topic_data = load_topic(topic_name, fields={'flashcard_mode'})
     if not topic_data:
         return "Topic not found", 404
 
@@ -209,8 +194,8 @@ def export_pdf(topic_name):
 @flashcard_bp.route('/<topic_name>/reset', methods=['POST'])
 def reset_flashcards(topic_name):
     """Reset the flashcards to allow regeneration."""
-    topic_data = load_topic(topic_name)
-    if topic_data and 'flashcard_mode' in topic_data:
-        del topic_data['flashcard_mode']
+    topic_data = load_topic(topic_name, fields=())
+    if topic_data:
+        topic_data['flashcard_mode'] = []
         save_topic(topic_name, topic_data)
     return redirect(url_for('flashcard.mode', topic_name=topic_name))
@@ -26,7 +26,7 @@ class QuizAgent:
 
         from app.modes.quiz.prompts import get_quiz_generation_prompt
         prompt = get_quiz_generation_prompt(topic, count, user_background)
-        quiz_data = call_llm(prompt, is_json=True)
+        quiz_data = call_llm(prompt, is_json=True, task='quiz')
 
         # Attempt fallback parsing if the returned data is not in expected
         # format
@@ -63,7 +63,7 @@ class QuizAgent:
         from app.modes.quiz.prompts import get_quiz_count_prompt
         prompt = get_quiz_count_prompt(topic, user_background)
         try:
-            data = call_llm(prompt, is_json=True)
+            data = call_llm(prompt, is_json=True, task='quiz_count')
         except Exception:
             return 10
 
@@ -1,6 +1,6 @@
 from flask import render_template, request, session, make_response, redirect, url_for
 from . import quiz_bp
-from app.common.storage import load_topic, save_topic
+from app.common.storage import load_topic, save_topic, record_quiz_result, extend_quiz_time
 from app.common.agents import FeedbackAgent
 from .agent import QuizAgent
 import datetime
@@ -39,7 +39,7 @@ def generate_quiz(topic_name, count):
         raise
 
     # Save quiz to topic data
-    topic_data = load_topic(topic_name) or {
+    topic_data = load_topic(topic_name, fields=()) or {
         "name": topic_name, "plan": [], "steps": []}
     topic_data['quiz_mode'] = quiz_data
     save_topic(topic_name, topic_data)
@@ -54,7 +54,7 @@ def generate_quiz(topic_name, count):
 @quiz_bp.route('/<topic_name>')
 def mode(topic_name):
     """Load quiz from saved data or generate new one."""
-    topic_data = load_topic(topic_name, update_timestamp=True)
+    topic_data = load_topic(topic_name, update_timestamp=True, fields={'quiz_mode'})
 
     # If quiz exists in saved data, use it
     if topic_data and topic_data.get('quiz_mode'):
@@ -136,25 +136,16 @@ def submit_quiz(topic_name):
 
     score = (num_correct / len(questions) * 100) if questions else 0
 
-    # Store results in topic data (server-side)
-    topic_data = load_topic(topic_name)
-    if topic_data:
-        topic_data['last_quiz_result'] = {
-            'topic_name': topic_name,
-            'score': score,
-            'feedback_results': feedback_results,
-            'date': datetime.date.today().isoformat(),
-            'time_spent': time_spent
-        }
-
-        # Ensure the score is also saved to the Quiz table
-        if topic_data.get('quiz_mode'):
-            topic_data['quiz_mode']['score'] = score
-            # Store time for this attempt (matches last_quiz_result behavior)
-            topic_data['quiz_mode']['time_spent'] = time_spent
-
-        save_topic(topic_name, topic_data)
-
+    # Store results in the topic's quiz row (server-side)
+    last_quiz_result = {
+        'topic_name': topic_name,
+        'score': score,
+        'feedback_results': feedback_results,
+        'date': datetime.date.today().isoformat(),
+        'time_spent': time_spent
+    }
+    # Time for this attempt is stored, as in last_quiz_result
+    if record_quiz_result(topic_name, last_quiz_result, score, time_spent):
         # Telemetry Hook: Quiz Submitted
         try:
             log_telemetry(
@@ -185,21 +176,7 @@ def update_time(topic_name):
         time_spent = 0
 
     if time_spent > 0:
-        # Avoid load_topic/save_topic race condition by updating DB directly
-        from app.core.models import Topic, QuizMode
-        from app.core.extensions import db
-        from flask_login import current_user
-
-        if current_user.is_authenticated:
-            # Join Topic and QuizMode to find the specific quiz
-            quiz = QuizMode.query.join(Topic).filter(
-                Topic.name == topic_name,
-                Topic.user_id == current_user.userid
-            ).first()
-
-            if quiz:
-                quiz.time_spent = max((quiz.time_spent or 0), time_spent)
-                db.session.commit()
+        extend_quiz_time(topic_name, time_spent)
     return '', 204
 
 @quiz_bp.route('/<topic_name>/export/pdf')
@@ -209,7 +186,7 @@ def export_quiz_pdf(topic_name):
         return ("PDF export is not available (WeasyPrint/GTK libraries missing). "
                 "Please use 'Export as Markdown' instead."), 503
 
-    topic_data = load_topic(topic_name)
+    topic_data = load_topic(topic_name, fields={'quiz_mode'})
     quiz_results = topic_data.get('last_quiz_result') if topic_data else None
 
     if not quiz_results:
@@ -235,9 +212,9 @@ def export_quiz_pdf(topic_name):
 @quiz_bp.route('/<topic_name>/reset', methods=['POST'])
 def reset_quiz(topic_name):
     """Reset the quiz to allow regeneration."""
-    topic_data = load_topic(topic_name)
-    if topic_data and 'quiz_mode' in topic_data:
-        del topic_data['quiz_mode']
+    topic_data = load_topic(topic_name, fields=())
+    if topic_data:
+        topic_data['quiz_mode'] = None
         save_topic(topic_name, topic_data)
         session.pop('quiz_questions', None)
     return redirect(url_for('quiz.mode', topic_name=topic_name))
@@ -13,7 +13,7 @@ active_sessions = {}
 def mode(topic_name):
     """Render the Reel mode interface."""
     # Ensure Last Opened/Modified is updated
-    load_topic(topic_name, update_timestamp=True)
+    load_topic(topic_name, update_timestamp=True, fields=())
     return render_template('reel/mode.html', topic_name=topic_name)
 
 
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 def load_environment_variables():
@@ -68,10 +69,18 @@ class Config:
     # App Settings
     USER_BACKGROUND = os.environ.get('USER_BACKGROUND', 'a beginner')
     ENABLE_TELEMETRY_LOGGING = os.environ.get('ENABLE_TELEMETRY_LOGGING', 'True').lower() == 'true'
+    # Summarise chat answers in a background worker instead of before replying
+    CHAT_SUMMARY_ASYNC = os.environ.get('CHAT_SUMMARY_ASYNC', 'True').lower() == 'true'
     SANDBOX_PATH = os.environ.get('SANDBOX_PATH') or os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data', 'sandbox')
+    # Captured terminal output: rotating gzip segments plus index.json
+    LOG_CAPTURE_PATH = os.environ.get('LOG_CAPTURE_PATH') or os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data', 'logs')
 
 class TestConfig(Config):
     """Configuration for running tests."""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    CHAT_SUMMARY_ASYNC = False
+    # Don't wrap pytest's stdout or write log segments into the checkout
+    ENABLE_TELEMETRY_LOGGING = False
+    LOG_CAPTURE_PATH = os.path.join(tempfile.gettempdir(), 'samosa-test-logs')
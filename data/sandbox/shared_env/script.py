@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import sys
+try:
+    import matplotlib
+    import matplotlib.pyplot as plt
+    import uuid
+
+    _original_show = plt.show
+
+    def _custom_show(*args, **kwargs):
+        is_interactive = False
+        try:
+            for fig_num in plt.get_fignums():
+                fig = plt.figure(fig_num)
+                for ax in fig.get_axes():
+                    if getattr(ax, 'name', '') == '3d':
+                        is_interactive = True
+                        break
+        except Exception:
+            pass
+
+        if is_interactive:
+            print("Interactive plot detected. Opening window...")
+            _original_show(*args, **kwargs)
+        else:
+            filename = f"plot_{uuid.uuid4().hex[:8]}.png"
+            plt.savefig(filename)
+            plt.close()
+
+    plt.show = _custom_show
+except ImportError:
+    pass
+
+import numpy; import pandas; import matplotlib; print('Libs OK')
\ No newline at end of file
@@ -0,0 +1,27 @@
+"""Index feedback by user and content reference
+
+Revision ID: 4c1f9a2d7e10
+Revises: 83b5ab7a7eb7
+Create Date: 2026-10-17 09:12:41.208315
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1f9a2d7e10'
+down_revision = '83b5ab7a7eb7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Upgrade the database schema."""
+    with op.batch_alter_table('feedback', schema=None) as batch_op:
+        batch_op.create_index('ix_feedback_user_reference', ['user_id', 'content_reference'], unique=False)
+
+
+def downgrade():
+    """Downgrade the database schema."""
+    with op.batch_alter_table('feedback', schema=None) as batch_op:
+        batch_op.drop_index('ix_feedback_user_reference')
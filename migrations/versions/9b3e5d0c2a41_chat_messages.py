@@ -0,0 +1,129 @@
+"""Move chat histories from JSON columns into chat_messages
+
+Revision ID: 9b3e5d0c2a41
+Revises: 4c1f9a2d7e10
+Create Date: 2026-10-17 14:03:27.551902
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3e5d0c2a41'
+down_revision = '4c1f9a2d7e10'
+branch_labels = None
+depends_on = None
+
+
+chat_mode = sa.table(
+    'chat_mode',
+    sa.column('id', sa.Integer), sa.column('user_id', sa.String), sa.column('topic_id', sa.Integer),
+    sa.column('history', sa.JSON), sa.column('history_summary', sa.JSON),
+    sa.column('popup_chat_history', sa.JSON))
+
+chapter_mode = sa.table(
+    'chapter_mode',
+    sa.column('id', sa.Integer), sa.column('user_id', sa.String), sa.column('topic_id', sa.Integer),
+    sa.column('popup_chat_history', sa.JSON))
+
+chat_messages = sa.table(
+    'chat_messages',
+    sa.column('user_id', sa.String), sa.column('topic_id', sa.Integer), sa.column('step_id', sa.Integer),
+    sa.column('channel', sa.String), sa.column('seq', sa.Integer), sa.column('role', sa.String),
+    sa.column('content', sa.Text), sa.column('summary', sa.Text),
+    sa.column('created_at', sa.DateTime), sa.column('modified_at', sa.DateTime),
+    sa.column('sync_status', sa.Text))
+
+
+def _message_rows(user_id, topic_id, step_id, channel, history, summaries=None):
+    """Build chat_messages rows for one JSON history."""
+    now = datetime.datetime.utcnow()
+    summaries = summaries or []
+    rows = []
+    for seq, message in enumerate(history or []):
+        content = message.get('content') or ''
+        summary = summaries[seq].get('content') if seq < len(summaries) else None
+        rows.append({
+            'user_id': user_id, 'topic_id': topic_id, 'step_id': step_id, 'channel': channel,
+            'seq': seq, 'role': message.get('role') or 'user', 'content': content,
+            'summary': summary if summary != content else None,
+            'created_at': now, 'modified_at': now, 'sync_status': 'pending',
+        })
+    return rows
+
+
+def upgrade():
+    """Upgrade the database schema."""
+    op.create_table('chat_messages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.String(length=100), nullable=False),
+    sa.Column('topic_id', sa.Integer(), nullable=False),
+    sa.Column('step_id', sa.Integer(), nullable=True),
+    sa.Column('channel', sa.String(length=20), nullable=False),
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('role', sa.String(length=20), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('summary', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('modified_at', sa.DateTime(), nullable=False),
+    sa.Column('sync_status', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['step_id'], ['chapter_mode.id'], ),
+    sa.ForeignKeyConstraint(['topic_id'], ['topics.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['logins.userid'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('chat_messages', schema=None) as batch_op:
+        batch_op.create_index('ix_chat_messages_thread', ['topic_id', 'channel', 'step_id', 'seq'], unique=False)
+
+    conn = op.get_bind()
+    rows = []
+    for chat in conn.execute(sa.select(chat_mode)).all():
+        rows += _message_rows(chat.user_id, chat.topic_id, None, 'chat', chat.history, chat.history_summary)
+        rows += _message_rows(chat.user_id, chat.topic_id, None, 'popup', chat.popup_chat_history)
+    for step in conn.execute(sa.select(chapter_mode).where(chapter_mode.c.popup_chat_history.isnot(None))).all():
+        rows += _message_rows(step.user_id, step.topic_id, step.id, 'step', step.popup_chat_history)
+    if rows:
+        op.bulk_insert(chat_messages, rows)
+
+    with op.batch_alter_table('chat_mode', schema=None) as batch_op:
+        batch_op.drop_column('history')
+        batch_op.drop_column('history_summary')
+        batch_op.drop_column('popup_chat_history')
+    with op.batch_alter_table('chapter_mode', schema=None) as batch_op:
+        batch_op.drop_column('popup_chat_history')
+
+
+def downgrade():
+    """Downgrade the database schema."""
+    with op.batch_alter_table('chapter_mode', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('popup_chat_history', sa.JSON(), nullable=True))
+    with op.batch_alter_table('chat_mode', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('popup_chat_history', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('history_summary', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('history', sa.JSON(), nullable=True))
+
+    conn = op.get_bind()
+    threads = {}
+    for m in conn.execute(sa.select(chat_messages).order_by(chat_messages.c.seq)):
+        threads.setdefault((m.topic_id, m.channel, m.step_id), []).append(m)
+
+    def messages(key):
+        return [{'role': m.role, 'content': m.content} for m in threads.get(key, [])]
+
+    for step in conn.execute(sa.select(chapter_mode.c.id, chapter_mode.c.topic_id)).all():
+        conn.execute(chapter_mode.update().where(chapter_mode.c.id == step.id).values(
+            popup_chat_history=messages((step.topic_id, 'step', step.id))))
+    for chat in conn.execute(sa.select(chat_mode.c.id, chat_mode.c.topic_id)).all():
+        chat_key = (chat.topic_id, 'chat', None)
+        conn.execute(chat_mode.update().where(chat_mode.c.id == chat.id).values(
+            history=messages(chat_key),
+            history_summary=[{'role': m.role, 'content': m.summary or m.content}
+                             for m in threads.get(chat_key, [])],
+            popup_chat_history=messages((chat.topic_id, 'popup', None))))
+
+    with op.batch_alter_table('chat_messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_messages_thread')
+    op.drop_table('chat_messages')
@@ -0,0 +1,50 @@
+"""Make chat message positions unique within a thread
+
+Revision ID: a6d4e2b8c913
+Revises: f3b9d6a1c284
+Create Date: 2026-10-18 09:12:37.481206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d4e2b8c913'
+down_revision = 'f3b9d6a1c284'
+branch_labels = None
+depends_on = None
+
+
+# Concurrent appends may already have given two messages the same seq; number
+# each thread 0..n-1 again in (seq, id) order so the unique indexes can be built
+RENUMBER_SEQ = """
+UPDATE chat_messages SET seq = numbered.position
+FROM (
+    SELECT id, ROW_NUMBER() OVER (
+        PARTITION BY topic_id, channel, step_id ORDER BY seq, id) - 1 AS position
+    FROM chat_messages
+) AS numbered
+WHERE numbered.id = chat_messages.id AND chat_messages.seq <> numbered.position
+"""
+
+
+def upgrade():
+    """Upgrade the database schema."""
+    op.execute(RENUMBER_SEQ)
+    op.drop_index('ix_chat_messages_thread', table_name='chat_messages')
+    # NULL step_ids never compare equal in a unique index, hence two partial indexes
+    op.create_index(
+        'ux_chat_messages_step_seq', 'chat_messages', ['topic_id', 'channel', 'step_id', 'seq'], unique=True,
+        postgresql_where=sa.text('step_id IS NOT NULL'), sqlite_where=sa.text('step_id IS NOT NULL'))
+    op.create_index(
+        'ux_chat_messages_thread_seq', 'chat_messages', ['topic_id', 'channel', 'seq'], unique=True,
+        postgresql_where=sa.text('step_id IS NULL'), sqlite_where=sa.text('step_id IS NULL'))
+
+
+def downgrade():
+    """Downgrade the database schema."""
+    op.drop_index('ux_chat_messages_thread_seq', table_name='chat_messages')
+    op.drop_index('ux_chat_messages_step_seq', table_name='chat_messages')
+    op.create_index(
+        'ix_chat_messages_thread', 'chat_messages', ['topic_id', 'channel', 'step_id', 'seq'], unique=False)
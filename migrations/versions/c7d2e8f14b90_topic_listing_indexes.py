@@ -0,0 +1,33 @@
+"""Index topics by user and modification time, flashcards by topic
+
+Revision ID: c7d2e8f14b90
+Revises: 9b3e5d0c2a41
+Create Date: 2026-10-17 16:41:08.903114
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2e8f14b90'
+down_revision = '9b3e5d0c2a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Upgrade the database schema."""
+    with op.batch_alter_table('topics', schema=None) as batch_op:
+        batch_op.create_index('ix_topics_user_modified', ['user_id', 'modified_at', 'id'], unique=False)
+
+    with op.batch_alter_table('flashcard_mode', schema=None) as batch_op:
+        batch_op.create_index('ix_flashcard_mode_topic', ['topic_id'], unique=False)
+
+
+def downgrade():
+    """Downgrade the database schema."""
+    with op.batch_alter_table('flashcard_mode', schema=None) as batch_op:
+        batch_op.drop_index('ix_flashcard_mode_topic')
+
+    with op.batch_alter_table('topics', schema=None) as batch_op:
+        batch_op.drop_index('ix_topics_user_modified')
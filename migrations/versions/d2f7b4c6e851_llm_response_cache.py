@@ -0,0 +1,38 @@
+"""Add the llm_response_cache table (persistent tier of the LLM response cache)
+
+Revision ID: d2f7b4c6e851
+Revises: a6d4e2b8c913
+Create Date: 2026-10-18 10:04:51.902364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f7b4c6e851'
+down_revision = 'a6d4e2b8c913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Upgrade the database schema."""
+    op.create_table('llm_response_cache',
+    sa.Column('cache_key', sa.String(length=64), nullable=False),
+    sa.Column('task', sa.String(length=50), nullable=True),
+    sa.Column('model_name', sa.String(length=255), nullable=True),
+    sa.Column('response', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('cache_key')
+    )
+    with op.batch_alter_table('llm_response_cache', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_llm_response_cache_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    """Downgrade the database schema."""
+    with op.batch_alter_table('llm_response_cache', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_llm_response_cache_expires_at'))
+    op.drop_table('llm_response_cache')
@@ -0,0 +1,57 @@
+"""Index pending sync rows, telemetry, model performance and plan revisions
+
+Revision ID: e5a8c3f9d217
+Revises: c7d2e8f14b90
+Create Date: 2026-10-17 18:22:54.130467
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a8c3f9d217'
+down_revision = 'c7d2e8f14b90'
+branch_labels = None
+depends_on = None
+
+
+# SyncMixin tables and their primary key
+SYNC_TABLES = {
+    'topics': 'id',
+    'chat_mode': 'id',
+    'chat_messages': 'id',
+    'chapter_mode': 'id',
+    'quiz_mode': 'id',
+    'flashcard_mode': 'id',
+    'users': 'id',
+    'installations': 'installation_id',
+    'telemetry_logs': 'id',
+    'feedback': 'id',
+    'ai_model_performance': 'id',
+    'plan_revisions': 'id',
+}
+
+
+def upgrade():
+    """Upgrade the database schema."""
+    for table, key in SYNC_TABLES.items():
+        # Partial on PostgreSQL: only rows still waiting for DCS sync
+        op.create_index(
+            f'ix_{table}_sync_pending', table, ['sync_status', key], unique=False,
+            postgresql_where=sa.text("sync_status = 'pending'"))
+
+    op.create_index('ix_telemetry_logs_event_time', 'telemetry_logs', ['event_type', 'timestamp'], unique=False)
+    op.create_index('ix_ai_model_performance_user_time', 'ai_model_performance', ['user_id', 'timestamp'], unique=False)
+    op.create_index(
+        'ix_plan_revisions_topic_user_time', 'plan_revisions', ['topic_id', 'user_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    """Downgrade the database schema."""
+    op.drop_index('ix_plan_revisions_topic_user_time', table_name='plan_revisions')
+    op.drop_index('ix_ai_model_performance_user_time', table_name='ai_model_performance')
+    op.drop_index('ix_telemetry_logs_event_time', table_name='telemetry_logs')
+
+    for table in reversed(list(SYNC_TABLES)):
+        op.drop_index(f'ix_{table}_sync_pending', table_name=table)
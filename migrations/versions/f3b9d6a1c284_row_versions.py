@@ -0,0 +1,34 @@
+"""Add version columns for optimistic concurrency on topics, steps, quizzes and chats
+
+Revision ID: f3b9d6a1c284
+Revises: e5a8c3f9d217
+Create Date: 2026-10-17 20:41:08.273915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9d6a1c284'
+down_revision = 'e5a8c3f9d217'
+branch_labels = None
+depends_on = None
+
+
+# Tables whose model uses VersionMixin
+VERSIONED_TABLES = ('topics', 'chapter_mode', 'quiz_mode', 'chat_mode')
+
+
+def upgrade():
+    """Upgrade the database schema."""
+    for table in VERSIONED_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    """Downgrade the database schema."""
+    for table in reversed(VERSIONED_TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('version')
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+Benchmark chat reply latency with inline vs background summarisation.
+
+Runs the real ``/chat/<topic>/send`` route against an in-memory database and
+a local stub of the OpenAI-compatible endpoint that sleeps ``--llm-latency``
+seconds per completion. With ``CHAT_SUMMARY_ASYNC`` off, every reply waits
+for a second completion (the summary); with it on, the summary is produced
+by the background worker after the reply has been sent.
+
+Usage:
+    python scripts/benchmark_chat_summary.py --turns 10 --llm-latency 0.5
+"""
+import sys
+import os
+import json
+import time
+import uuid
+import logging
+import argparse
+import statistics
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(level=logging.WARNING, format='%(message)s')
+logger = logging.getLogger("benchmark")
+logger.setLevel(logging.INFO)
+
+# Add the project root to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import TestConfig  # noqa: E402
+
+
+class BenchConfig(TestConfig):
+    """In-memory app without background telemetry capture."""
+    ENABLE_TELEMETRY_LOGGING = False
+
+
+def make_stub_handler(latency):
+    """Build a handler class that answers every completion after ``latency`` seconds."""
+    body = json.dumps({
+        "choices": [{"message": {"role": "assistant", "content": "A detailed answer. " * 40}}],
+        "usage": {"prompt_tokens": 200, "completion_tokens": 160}
+    }).encode()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        """Slow stub of /v1/chat/completions."""
+
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+        wbufsize = 64 * 1024
+
+        def do_POST(self):
+            """Drain the request, wait, and return the canned completion."""
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            """Silence per-request access logging."""
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(latency):
+    """Start the stub server on a free port and return (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_stub_handler(latency))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}/v1"
+
+
+def login(app):
+    """Create a user and return a logged-in test client."""
+    from app.core.extensions import db
+    from app.core.models import Login, User
+    from app.common.auth import create_jwe
+
+    uid = str(uuid.uuid4())
+    with app.app_context():
+        account = Login(userid=uid, username='bench', name='Bench User')
+        account.set_password('password')
+        db.session.add(account)
+        db.session.add(User(login_id=uid))
+        db.session.commit()
+        token = create_jwe({'user_id': uid})
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'bench', 'password': 'password'})
+    client.environ_base['HTTP_X_JWE_TOKEN'] = token.decode() if isinstance(token, bytes) else token
+    return client
+
+
+def run(app, client, topic, turns, async_summary):
+    """Send ``turns`` messages and return per-reply latencies in ms."""
+    from app.common.summary_worker import get_summary_worker
+
+    app.config['CHAT_SUMMARY_ASYNC'] = async_summary
+    latencies = []
+    for i in range(turns):
+        start = time.perf_counter()
+        response = client.post(
+            f'/chat/{topic}/send',
+            data={'message': f'Question {i}'},
+            headers={'X-Requested-With': 'XMLHttpRequest'})
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+        # Let the worker finish so both modes start each turn from the same state
+        get_summary_worker().join()
+    return latencies
+
+
+def report(label, latencies):
+    """Log summary statistics for one run."""
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    logger.info(
+        f"{label:<32} mean={statistics.mean(latencies):7.1f}ms "
+        f"p50={statistics.median(latencies):7.1f}ms p95={p95:7.1f}ms")
+
+
+def main():
+    """Benchmark both summarisation modes."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per stub completion")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.llm_latency)
+
+    from app import create_app
+    from app.common import utils
+
+    utils.LLM_BASE_URL = base_url
+    utils.LLM_MODEL_NAME = "stub"
+
+    app = create_app(BenchConfig)
+    client = login(app)
+    logger.info(f"Stub LLM at {base_url} ({args.turns} turns, {args.llm_latency:.2f}s per completion)")
+
+    try:
+        before = run(app, client, "bench_inline", args.turns, async_summary=False)
+        report("before: inline summary", before)
+
+        after = run(app, client, "bench_async", args.turns, async_summary=True)
+        report("after: background summary", after)
+
+        saved = statistics.mean(before) - statistics.mean(after)
+        logger.info(f"Reply latency saved: {saved:.1f}ms ({saved / statistics.mean(before) * 100:.0f}%)")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
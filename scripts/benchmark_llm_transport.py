@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+Benchmark per-call overhead of the LLM HTTP transport.
+
+Starts a local stub of the OpenAI-compatible ``/v1/chat/completions`` endpoint
+and compares a bare ``requests.post`` per call (the previous behaviour of
+``call_llm``) against the pooled keep-alive ``LLMTransport``.
+
+Usage:
+    python scripts/benchmark_llm_transport.py --calls 500 --threads 4
+"""
+import sys
+import os
+import json
+import time
+import logging
+import argparse
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+# Add the project root to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.common.llm_transport import LLMTransport  # noqa: E402
+
+STUB_BODY = json.dumps({
+    "choices": [{"message": {"role": "assistant", "content": "ok"}}],
+    "usage": {"prompt_tokens": 5, "completion_tokens": 1}
+}).encode()
+
+PAYLOAD = {
+    "model": "stub",
+    "messages": [{"role": "user", "content": "ping"}],
+    "temperature": 0.7,
+    "max_tokens": 16,
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Minimal HTTP/1.1 handler answering every POST with a fixed completion."""
+
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one segment; avoids Nagle/delayed-ACK stalls
+    # that would otherwise dominate keep-alive timings.
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+
+    def do_POST(self):
+        """Drain the request body and return the canned completion."""
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(STUB_BODY)))
+        self.end_headers()
+        self.wfile.write(STUB_BODY)
+
+    def log_message(self, format, *args):
+        """Silence per-request access logging."""
+        pass
+
+
+def start_stub_server():
+    """Start the stub server on a free port and return (server, url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}/v1/chat/completions"
+
+
+def run(post, url, calls, threads):
+    """Issue ``calls`` POSTs across ``threads`` workers and return latencies in ms."""
+    def one_call(_):
+        start = time.perf_counter()
+        resp = post(url, json=PAYLOAD, headers={"Authorization": "Bearer dummy"}, timeout=10)
+        resp.raise_for_status()
+        resp.json()
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(one_call, range(calls)))
+
+
+def report(label, latencies, wall_s):
+    """Log summary statistics for one run."""
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    logger.info(
+        f"{label:<28} mean={statistics.mean(latencies):6.2f}ms "
+        f"p50={statistics.median(latencies):6.2f}ms p95={p95:6.2f}ms "
+        f"throughput={len(latencies) / wall_s:8.1f} req/s")
+
+
+def main():
+    """Run both transports against the stub server."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    server, url = start_stub_server()
+    logger.info(f"Stub LLM at {url} ({args.calls} calls, {args.threads} threads)")
+
+    try:
+        # Warm up the interpreter / server threads
+        run(requests.post, url, 20, args.threads)
+
+        start = time.perf_counter()
+        before = run(requests.post, url, args.calls, args.threads)
+        report("before: requests.post", before, time.perf_counter() - start)
+
+        transport = LLMTransport(pool_maxsize=max(args.threads, 1))
+        start = time.perf_counter()
+        after = run(transport.post, url, args.calls, args.threads)
+        report("after: pooled LLMTransport", after, time.perf_counter() - start)
+        transport.close()
+
+        saved = statistics.mean(before) - statistics.mean(after)
+        logger.info(f"Per-call overhead saved: {saved:.2f}ms ({saved / statistics.mean(before) * 100:.0f}%)")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+Benchmark single-field topic saves: full reconcile vs change-set save.
+
+Builds a topic with ``--steps`` steps (teaching material, questions and a
+popup chat each) in an in-memory database, then repeatedly loads it, changes
+one field of one step and saves it. A deep copy of the loaded dict has no
+load snapshot, so ``save_topic`` walks and rewrites the whole topic (the
+previous behaviour); the loaded dict itself is saved as a change set.
+
+Usage:
+    python scripts/benchmark_save_topic.py --steps 30 --iterations 50
+"""
+import sys
+import os
+import copy
+import time
+import uuid
+import logging
+import argparse
+import statistics
+
+logging.basicConfig(level=logging.WARNING, format='%(message)s')
+logger = logging.getLogger("benchmark")
+logger.setLevel(logging.INFO)
+
+# Add the project root to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import TestConfig  # noqa: E402
+
+
+class BenchConfig(TestConfig):
+    """In-memory app without background telemetry capture."""
+    ENABLE_TELEMETRY_LOGGING = False
+
+
+def create_topic(uid, name, steps):
+    """Insert a topic with ``steps`` fully generated steps."""
+    from app.core.extensions import db
+    from app.core.models import Topic, ChapterMode, ChatMessage
+
+    topic = Topic(name=name, user_id=uid, study_plan=[f"Step {i}" for i in range(steps)])
+    db.session.add(topic)
+    db.session.flush()
+    for i in range(steps):
+        step = ChapterMode(
+            user_id=uid, topic_id=topic.id, step_index=i, title=f"Step {i}",
+            content="Teaching material. " * 250,
+            questions={"questions": [{"question": f"Q{q}", "options": ["A", "B", "C", "D"],
+                                      "correct_answer": "A"} for q in range(5)]})
+        db.session.add(step)
+        db.session.flush()
+        db.session.add_all([
+            ChatMessage(user_id=uid, topic_id=topic.id, step_id=step.id, channel=ChatMessage.STEP,
+                        seq=0, role="user", content="Question?"),
+            ChatMessage(user_id=uid, topic_id=topic.id, step_id=step.id, channel=ChatMessage.STEP,
+                        seq=1, role="assistant", content="Answer. " * 40)])
+    db.session.commit()
+
+
+def run(name, iterations, full):
+    """Load, change one step's score and save; return (latencies in ms, statements per save)."""
+    from sqlalchemy import event
+    from app.core.extensions import db
+    from app.common.storage import load_topic, save_topic
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    latencies = []
+    counts = []
+    for i in range(iterations):
+        data = load_topic(name)
+        if full:
+            data = copy.deepcopy(data)
+        data['chapter_mode'][i % len(data['chapter_mode'])]['score'] = float(i)
+        db.session.expire_all()
+
+        statements.clear()
+        event.listen(db.engine, "before_cursor_execute", record)
+        start = time.perf_counter()
+        save_topic(name, data)
+        latencies.append((time.perf_counter() - start) * 1000)
+        event.remove(db.engine, "before_cursor_execute", record)
+        counts.append(len(statements))
+    return latencies, counts
+
+
+def report(label, latencies, counts):
+    """Log summary statistics for one run."""
+    logger.info(
+        f"{label:<28} mean={statistics.mean(latencies):7.2f}ms "
+        f"p50={statistics.median(latencies):7.2f}ms statements/save={statistics.mean(counts):5.1f}")
+
+
+def main():
+    """Benchmark both save paths."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.core.extensions import db
+    from app.core.models import Login
+    from flask_login import login_user
+
+    app = create_app(BenchConfig)
+    with app.test_request_context():
+        uid = str(uuid.uuid4())
+        account = Login(userid=uid, username='bench', name='Bench User')
+        account.set_password('password')
+        db.session.add(account)
+        db.session.commit()
+        login_user(account)
+
+        create_topic(uid, "bench", args.steps)
+        logger.info(f"{args.steps}-step topic, {args.iterations} single-field saves per mode")
+
+        before, before_counts = run("bench", args.iterations, full=True)
+        report("before: full reconcile", before, before_counts)
+
+        after, after_counts = run("bench", args.iterations, full=False)
+        report("after: change set", after, after_counts)
+
+        saved = statistics.mean(before) - statistics.mean(after)
+        logger.info(f"Save latency saved: {saved:.2f}ms ({saved / statistics.mean(before) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""
+Run EXPLAIN on the application's hot queries and flag full table scans.
+
+Connects to the configured database (``DATABASE_URL``, as the app does) and
+checks the lookups the routes and the DCS sync issue on every request or
+sync pass. On PostgreSQL sequential scans are disabled for the check, so a
+``Seq Scan`` in a plan means no index can serve the query at all; on SQLite a
+``SCAN <table>`` without an index is flagged.
+
+Exits with status 1 if any query is flagged, so it can run in CI after
+``scripts/update_database.py``.
+
+Usage:
+    python scripts/explain_queries.py [--verbose]
+"""
+import sys
+import os
+import re
+import logging
+import argparse
+import datetime
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+# Add the project root to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+load_dotenv()
+
+from app import create_app, db  # noqa: E402
+from app.core import models  # noqa: E402
+from app.common.storage import step_feedback_reference  # noqa: E402
+
+# Placeholder values: plans depend on the shape of the query, not the values
+USER_ID = 'explain-user'
+TOPIC_ID = 1
+BATCH_SIZE = 50
+
+PG_SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+def hot_queries():
+    """
+    Build the statements to check, mirroring the queries in app.common.
+
+    Returns:
+        list: (label, statement) pairs.
+    """
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+    queries = [
+        ("topic by name", select(models.Topic.id).where(
+            models.Topic.user_id == USER_ID, models.Topic.name == 'topic')),
+        ("home page topics", select(models.Topic.name).where(models.Topic.user_id == USER_ID)
+            .order_by(models.Topic.modified_at.desc(), models.Topic.id.desc()).limit(10)),
+        ("chapter steps", select(models.ChapterMode.id).where(models.ChapterMode.topic_id == TOPIC_ID)
+            .order_by(models.ChapterMode.step_index)),
+        ("chat thread page", select(models.ChatMessage.seq).where(
+            models.ChatMessage.topic_id == TOPIC_ID, models.ChatMessage.channel == models.ChatMessage.CHAT,
+            models.ChatMessage.step_id.is_(None)).order_by(models.ChatMessage.seq.desc()).limit(51)),
+        ("step feedback", select(models.Feedback.comment).where(
+            models.Feedback.user_id == USER_ID,
+            models.Feedback.content_reference.in_(
+                [step_feedback_reference(TOPIC_ID, i) for i in range(2)]))),
+        ("flashcards", select(models.FlashcardMode.id).where(models.FlashcardMode.topic_id == TOPIC_ID)),
+        ("quiz", select(models.QuizMode.id).where(models.QuizMode.topic_id == TOPIC_ID)),
+        ("plan revision dedupe", select(models.PlanRevision.id).where(
+            models.PlanRevision.topic_id == TOPIC_ID, models.PlanRevision.user_id == USER_ID)
+            .order_by(models.PlanRevision.timestamp.desc()).limit(1)),
+        ("telemetry by event", select(models.TelemetryLog.id).where(
+            models.TelemetryLog.event_type == 'topic_opened', models.TelemetryLog.timestamp >= since)),
+        ("model performance by user", select(models.AIModelPerformance.id).where(
+            models.AIModelPerformance.user_id == USER_ID, models.AIModelPerformance.timestamp >= since)),
+    ]
+    # DCS sync: one pending batch per SyncMixin table
+    for model in models.SyncMixin.__subclasses__():
+        table = model.__table__
+        queries.append((f"sync pending {table.name}", select(*table.primary_key.columns)
+                        .where(table.c.sync_status == 'pending').limit(BATCH_SIZE)))
+    return queries
+
+
+def explain(connection, statement):
+    """
+    Return the plan lines and the tables read by a full scan.
+
+    Args:
+        connection: Open SQLAlchemy connection.
+        statement: Select statement to explain.
+
+    Returns:
+        tuple: (list of plan lines, list of fully scanned table names).
+    """
+    # render_postcompile expands IN lists into one parameter per value
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    if connection.dialect.name == 'postgresql':
+        rows = connection.exec_driver_sql(f"EXPLAIN {compiled}", params).all()
+        lines = [row[0] for row in rows]
+        scans = [m.group(1) for line in lines for m in [PG_SEQ_SCAN.search(line)] if m]
+    else:
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+        lines = [row[-1] for row in rows]
+        scans = [m.group(1) for line in lines for m in [SQLITE_SCAN.match(line)] if m]
+    return lines, scans
+
+
+def explain_queries(verbose=False):
+    """
+    Explain every hot query and log the ones that scan whole tables.
+
+    Returns:
+        int: Number of flagged queries.
+    """
+    app = create_app()
+    flagged = 0
+    with app.app_context():
+        logger.info(f"Explaining hot queries on {db.engine.name}...")
+        with db.engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                if db.engine.name == 'postgresql':
+                    # Plan as if every table were large: a Seq Scan now means no usable index
+                    connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+                for label, statement in hot_queries():
+                    try:
+                        # A savepoint per query: on PostgreSQL a failed EXPLAIN would
+                        # otherwise abort the transaction for every later query
+                        with connection.begin_nested():
+                            lines, scans = explain(connection, statement)
+                    except Exception as e:
+                        logger.error(f"  [!] {label}: could not explain ({e})")
+                        flagged += 1
+                        continue
+                    if scans:
+                        flagged += 1
+                        logger.warning(f"  [!] {label}: full scan of {', '.join(sorted(set(scans)))}")
+                    else:
+                        logger.info(f"  [ok] {label}")
+                    if verbose or scans:
+                        for line in lines:
+                            logger.info(f"        {line}")
+            finally:
+                transaction.rollback()
+
+    if flagged:
+        logger.warning(f"{flagged} quer{'y' if flagged == 1 else 'ies'} without a supporting index. "
+                       "Run scripts/update_database.py or the Alembic migrations.")
+    else:
+        logger.info("✓ Every hot query uses an index.")
+    return flagged
+
+
+def main():
+    """Parse arguments and exit non-zero if any query is flagged."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verbose", action="store_true", help="Print every plan, not just flagged ones")
+    args = parser.parse_args()
+    sys.exit(1 if explain_queries(verbose=args.verbose) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,9 @@ Handles creating missing tables and adding missing columns/updating column types
 """
 import sys
 import os
+import json
 import logging
+import datetime
 from dotenv import load_dotenv
 from sqlalchemy import inspect, text
 
@@ -28,11 +30,13 @@ TARGET_MODELS = [
     models.QuizMode,
     models.FlashcardMode,
     models.ChatMode,
+    models.ChatMessage,
     models.User,
     models.Installation,
     models.TelemetryLog,
     models.Feedback,
     models.AIModelPerformance,
+    models.LLMCacheEntry,
     models.PlanRevision,
     models.Login
 ]
@@ -44,6 +48,166 @@ def get_column_type(column):
     """
     return str(column.type).upper()
 
+def ensure_indexes(inspector):
+    """
+    Create model indexes that are missing from existing tables.
+
+    Args:
+        inspector: SQLAlchemy inspector for the current engine.
+    """
+    existing_tables = set(inspector.get_table_names())
+    for model in TARGET_MODELS:
+        table = model.__table__
+        if table.name not in existing_tables:
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            logger.info(f"  [+] Creating missing index: {index.name} on {table.name}")
+            try:
+                index.create(bind=db.engine, checkfirst=True)
+                logger.info("      -> Created successfully.")
+            except Exception as e:
+                logger.error(f"      -> FAILED to create index: {e}")
+
+# Number each chat thread 0..n-1 again in (seq, id) order (see ensure_unique_chat_seq)
+RENUMBER_CHAT_SEQ = """
+UPDATE chat_messages SET seq = numbered.position
+FROM (
+    SELECT id, ROW_NUMBER() OVER (
+        PARTITION BY topic_id, channel, step_id ORDER BY seq, id) - 1 AS position
+    FROM chat_messages
+) AS numbered
+WHERE numbered.id = chat_messages.id AND chat_messages.seq <> numbered.position
+"""
+
+def ensure_unique_chat_seq(inspector):
+    """
+    Prepare chat_messages for its unique (thread, seq) indexes.
+
+    Concurrent appends could give two messages of a thread the same seq before
+    the indexes existed, so threads are renumbered first; the plain thread
+    index they replace is dropped. ``ensure_indexes`` then creates them.
+
+    Args:
+        inspector: SQLAlchemy inspector for the current engine.
+    """
+    if 'chat_messages' not in inspector.get_table_names():
+        return
+    existing = {ix['name'] for ix in inspector.get_indexes('chat_messages')}
+    if {'ux_chat_messages_step_seq', 'ux_chat_messages_thread_seq'} <= existing:
+        return
+    logger.info("Renumbering chat message positions for the unique thread indexes...")
+    try:
+        db.session.execute(text(RENUMBER_CHAT_SEQ))
+        if 'ix_chat_messages_thread' in existing:
+            db.session.execute(text('DROP INDEX ix_chat_messages_thread'))
+        db.session.commit()
+        logger.info("      -> Renumbered successfully.")
+    except Exception as e:
+        logger.error(f"      -> FAILED to renumber chat messages: {e}")
+        db.session.rollback()
+
+def _json_list(value):
+    """Decode a legacy JSON history column (SQLite returns it as text)."""
+    if isinstance(value, str):
+        value = json.loads(value) if value else None
+    return value or []
+
+def migrate_chat_histories(inspector):
+    """
+    Move legacy JSON chat histories into chat_messages rows.
+
+    Only threads without rows are converted, and the legacy columns are
+    cleared afterwards, so re-running is safe. PostgreSQL drops the emptied
+    columns later with the other deprecated columns.
+
+    Args:
+        inspector: SQLAlchemy inspector for the current engine.
+    """
+    legacy = {
+        'chat_mode': [c for c in ('history', 'history_summary', 'popup_chat_history')
+                      if c in {col['name'] for col in inspector.get_columns('chat_mode')}],
+        # Older databases still have the popup history under its pre-rename name
+        'chapter_mode': [c for c in ('popup_chat_history', 'chat_history')
+                         if c in {col['name'] for col in inspector.get_columns('chapter_mode')}],
+    }
+    if not any(legacy.values()):
+        return
+
+    logger.info("Migrating chat histories to chat_messages...")
+    threads = []  # (user_id, topic_id, step_id, channel, history, summaries)
+    if legacy['chat_mode']:
+        columns = ', '.join(f'"{c}"' for c in legacy['chat_mode'])
+        for row in db.session.execute(text(f'SELECT user_id, topic_id, {columns} FROM chat_mode')).mappings():
+            threads.append((row['user_id'], row['topic_id'], None, models.ChatMessage.CHAT,
+                            _json_list(row.get('history')), _json_list(row.get('history_summary'))))
+            threads.append((row['user_id'], row['topic_id'], None, models.ChatMessage.POPUP,
+                            _json_list(row.get('popup_chat_history')), []))
+    for column in legacy['chapter_mode']:
+        rows = db.session.execute(text(
+            f'SELECT id, user_id, topic_id, "{column}" AS history FROM chapter_mode '
+            f'WHERE "{column}" IS NOT NULL')).mappings()
+        for row in rows:
+            threads.append((row['user_id'], row['topic_id'], row['id'], models.ChatMessage.STEP,
+                            _json_list(row['history']), []))
+
+    existing = set(db.session.execute(db.select(
+        models.ChatMessage.topic_id, models.ChatMessage.channel, models.ChatMessage.step_id).distinct()))
+    now = datetime.datetime.utcnow()
+    migrated = 0
+    try:
+        for user_id, topic_id, step_id, channel, history, summaries in threads:
+            if not history or (topic_id, channel, step_id) in existing:
+                continue
+            for seq, message in enumerate(history):
+                content = message.get('content') or ''
+                summary = summaries[seq].get('content') if seq < len(summaries) else None
+                db.session.add(models.ChatMessage(
+                    user_id=user_id, topic_id=topic_id, step_id=step_id, channel=channel, seq=seq,
+                    role=message.get('role') or 'user', content=content,
+                    summary=summary if summary != content else None,
+                    created_at=now, modified_at=now))
+            existing.add((topic_id, channel, step_id))
+            migrated += 1
+        for table_name, columns in legacy.items():
+            if columns:
+                assignments = ', '.join(f'"{c}" = NULL' for c in columns)
+                db.session.execute(text(f'UPDATE "{table_name}" SET {assignments}'))
+        db.session.commit()
+        logger.info(f" -> Migrated {migrated} chat thread(s).")
+    except Exception as e:
+        logger.error(f" -> FAILED to migrate chat histories: {e}")
+        db.session.rollback()
+
+def ensure_version_columns(inspector):
+    """
+    Add the optimistic-concurrency ``version`` column to tables created before it.
+
+    The generic add-column pass below is PostgreSQL only, so SQLite databases
+    (the default install) get the column here. Existing rows start at 1.
+
+    Args:
+        inspector: SQLAlchemy inspector for the current engine.
+    """
+    existing_tables = set(inspector.get_table_names())
+    for model in TARGET_MODELS:
+        table_name = model.__tablename__
+        if 'version' not in model.__table__.c or table_name not in existing_tables:
+            continue
+        if 'version' in {col['name'] for col in inspector.get_columns(table_name)}:
+            continue
+        logger.info(f"  [+] Adding missing column: version to {table_name}")
+        try:
+            db.session.execute(text(
+                f'ALTER TABLE "{table_name}" ADD COLUMN version INTEGER NOT NULL DEFAULT 1'))
+            db.session.commit()
+            logger.info("      -> Added successfully.")
+        except Exception as e:
+            logger.error(f"      -> FAILED to add column: {e}")
+            db.session.rollback()
+
 def update_database():
     app = create_app()
     with app.app_context():
@@ -96,7 +260,16 @@ def update_database():
         logger.info("Checking for schema updates...")
         inspector = inspect(db.engine) # Re-inspect after create/rename
 
+        # create_all() only adds indexes together with new tables
+        ensure_unique_chat_seq(inspector)
+        ensure_indexes(inspector)
+
+        # Chat histories moved from JSON columns to the chat_messages table
+        migrate_chat_histories(inspector)
+
         if db.engine.name == 'sqlite':
+            # Mapped as the ORM's version counter: every query of these tables selects it
+            ensure_version_columns(inspector)
             logger.info("SQLite mode: Skipping advanced schema inspections (Postgres-specific).")
             return
 
@@ -149,21 +322,19 @@ def update_database():
                           logger.error(f"      -> FAILED to drop column: {e}")
                           db.session.rollback()
 
-            # Special check for renaming 'chat_history' -> 'popup_chat_history' in ChapterMode
-            if table_name == 'chapter_mode':
-                if 'chat_history' in existing_col_map and 'popup_chat_history' not in existing_col_map:
-                    logger.info("  [~] Renaming column 'chat_history' to 'popup_chat_history'")
-                    try:
-                        sql = text('ALTER TABLE "chapter_mode" RENAME COLUMN "chat_history" TO "popup_chat_history"')
-                        db.session.execute(sql)
-                        db.session.commit()
-                        logger.info("      -> Renamed successfully.")
-                        # Update local map
-                        existing_col_map['popup_chat_history'] = existing_col_map.pop('chat_history')
-                        existing_col_map['popup_chat_history']['name'] = 'popup_chat_history'
-                    except Exception as e:
-                         logger.error(f"      -> FAILED to rename column: {e}")
-                         db.session.rollback()
+            # Special check for chat history columns (moved to the chat_messages table)
+            if table_name in ('chat_mode', 'chapter_mode'):
+                for deprecated_col in ['history', 'history_summary', 'popup_chat_history', 'chat_history']:
+                    if deprecated_col in existing_col_map:
+                        logger.info(f"  [-] Dropping deprecated column: {deprecated_col} (moved to chat_messages)")
+                        try:
+                            sql = text(f'ALTER TABLE "{table_name}" DROP COLUMN "{deprecated_col}"')
+                            db.session.execute(sql)
+                            db.session.commit()
+                            logger.info("      -> Dropped successfully.")
+                        except Exception as e:
+                            logger.error(f"      -> FAILED to drop column: {e}")
+                            db.session.rollback()
 
             # Special check for 'installation_id' removal in Feedback (refactor to user-centric)
             if table_name == 'feedback':
@@ -404,6 +575,11 @@ def update_database():
                     try:
                         # Compile type to SQL string
                         type_str = col_type.compile(dialect=db.engine.dialect)
+                        if column.server_default is not None:
+                            # Existing rows take the default, so NOT NULL can apply at once
+                            type_str += f" DEFAULT '{column.server_default.arg}'"
+                            if not column.nullable:
+                                type_str += " NOT NULL"
                         sql = text(f'ALTER TABLE "{table_name}" ADD COLUMN "{col_name}" {type_str}')
                         db.session.execute(sql)
                         db.session.commit()
@@ -4,7 +4,7 @@ import functools
 from unittest.mock import patch
 from app.common.utils import call_llm, LLM_BASE_URL, LLM_MODEL_NAME
 from unittest.mock import MagicMock
-from app.core.models import Topic
+from app.core.models import Topic, ChatMessage
 from app.core.exceptions import LLMResponseError
 from app.modes.quiz.agent import QuizAgent
 from app.common.agents import PlannerAgent, FeedbackAgent
@@ -216,8 +216,8 @@ def test_chat_session_persistence(logger, app):
             t = Topic.query.filter_by(name=topic_name).first()
             assert t is not None
             assert t.chat_mode is not None
-            assert len(t.chat_mode.history) == 1
-            assert t.chat_mode.history[0]['content'] == "Hi"
+            assert len(t.chat_messages) == 1
+            assert t.chat_messages[0].content == "Hi"
 
             logger.info("ChatMode persistence verified.")
 
@@ -400,17 +400,13 @@ def test_chat_summary_integration(auth_client, app):
 
     with app.app_context():
         # Verify topic created
-        from app.core.models import Topic
         topic = Topic.query.filter_by(name=topic_name).first()
         assert topic is not None
         assert topic.chat_mode is not None
-        # Should be empty initially
-        assert len(topic.chat_mode.history) == 1 # Welcome message
-        # history_summary defaults to None in DB if just added, or [] via load_topic logic
-        # But accessing model directly (topic.chat_mode.history_summary) gives raw value.
-        # It should be None or empty.
-        val = topic.chat_mode.history_summary
-        assert val is None or len(val) == 0
+        messages = ChatMessage.query.filter_by(topic_id=topic.id, channel=ChatMessage.CHAT).all()
+        assert len(messages) == 1 # Welcome message
+        # Messages are stored unsummarised until a summary lands
+        assert messages[0].summary is None
 
     # Mock LLM to return distinct answers and summaries
     # We patch app.common.utils.call_llm because summarize_text uses it.
@@ -430,26 +426,22 @@ def test_chat_summary_integration(auth_client, app):
 
     with app.app_context():
         topic = Topic.query.filter_by(name=topic_name).first()
-        session = topic.chat_mode
+        messages = ChatMessage.query.filter_by(
+            topic_id=topic.id, channel=ChatMessage.CHAT).order_by(ChatMessage.seq).all()
 
-        print(f"History: {len(session.history)}")
-        summary_len = len(session.history_summary) if session.history_summary else 0
-        print(f"Summary: {summary_len}")
+        print(f"History: {len(messages)}")
 
-        assert len(session.history) == 3
+        assert len(messages) == 3
         # Welcome (1) + User (1) + Assistant (1) = 3
 
-        assert summary_len == 3
-        # Welcome (copied) + User (copied) + Assistant (summarized)
-
         # Check content
         # History has full answer
-        assert session.history[-1]['content'] == "FULL_ANSWER_CONTENT"
+        assert messages[-1].content == "FULL_ANSWER_CONTENT"
         # Summary has summarized answer
-        assert session.history_summary[-1]['content'] == "SUMMARY_OF_ANSWER"
+        assert messages[-1].summary == "SUMMARY_OF_ANSWER"
 
-        # Verify Welcome message exists in summary (unsummarized because it was copied)
-        assert session.history_summary[0]['content'] == session.history[0]['content']
+        # Verify Welcome message has no summary (its content is used as is)
+        assert messages[0].summary is None
 
 
 def test_chat_context_construction(auth_client, app):
@@ -471,11 +463,11 @@ def test_chat_context_construction(auth_client, app):
 
     with app.app_context():
         topic = Topic.query.filter_by(name=topic_name).first()
-        sess = topic.chat_mode
+        messages = ChatMessage.query.filter_by(
+            topic_id=topic.id, channel=ChatMessage.CHAT).order_by(ChatMessage.seq).all()
         # History: W(0), U0(1), A0(2), U1(3), A1(4), U2(5), A2(6), U3(7), A3(8) = 9 messages
-        assert len(sess.history) == 9
-        assert sess.history_summary and len(sess.history_summary) == 9
-        assert sess.history_summary[-1]['content'] == "SUM"
+        assert len(messages) == 9
+        assert messages[-1].summary == "SUM"
 
     # Now verify the next call uses the correct context.
     # We want to inspect what is passed to `chat_agent.get_answer` -> `call_llm`.
@@ -490,23 +482,19 @@ def test_chat_context_construction(auth_client, app):
 
         # Verify call args
         mock_agent.assert_called_once()
-        args, _ = mock_agent.call_args
-        # args[1] is messages_for_llm
+        args, kwargs = mock_agent.call_args
+        # args[1] is the full history; the agent's context builder decides what
+        # is sent in full, summarised or rolled up (see test_context_builder_*).
         passed_history = args[1]
+        passed_summary = kwargs['history_summary']
 
-        # Expected:
         # Full history: W, U0, A0, U1, A1, U2, A2, U3, A3, CurrentMsg (10 msgs)
-        # KEEP_FULL_COUNT = 5
-        # Older part: Summary[:-5] -> Indexes 0 to 4 (5 messages)
-        #   W(0), U0(1), S0(2), U1(3), S1(4)
-        # Recent part: Full[-5:] -> Indexes 5 to 9 (5 messages)
-        #   U2(5), A2(6), U3(7), A3(8), Curr(9)
-
         assert len(passed_history) == 10
-        # Index 4 is S1 (Summary of Assistant 1). Since mock returned "SUM", it should be "SUM".
-        assert passed_history[4]['content'] == "SUM"
-        # Index 6 is A2 (Full Assistant 2). Since mock returned "ANS", it should be "ANS".
-        assert passed_history[6]['content'] == "ANS"
+        assert len(passed_summary) == 10
+        # Index 4 is A1: full answer in history, summary alongside
+        assert passed_history[4]['content'] == "ANS"
+        assert passed_summary[4]['content'] == "SUM"
+        assert passed_history[-1]['content'] == "CurrentMsg"
 
 # --- Consolidated Tests from test_exception_handling.py ---
 